@@ -1,10 +1,41 @@
 # ai_client.py
+import copy
+import hashlib
 import json
 import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+
+from config import (
+    OPENROUTER_API_KEY,
+    LLM_TIMEOUT,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MODELS,
+    LLM_DEADLINE,
+    LLM_MAX_ATTEMPTS,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_HEDGE_PERCENTILE,
+)
+from ai.errors import LLMError, LLMTimeout, LLMUnavailable, LLMCircuitOpen, LLMBadResponse
+from ai.json_stream import ItemsStreamParser
+from ai.llm_cache import llm_cache, normalize
+from ai.prompts import PARSE_SYSTEM_PROMPT, EDIT_SYSTEM_PROMPT
+from ai.resilience import CircuitBreaker, LatencyWindow, backoff, OPEN, HALF_OPEN
+from ai.schemas import SCHEMAS, TaskLLMResponse, ItemLLMResponse
+from metrics import LLM_LATENCY, LLM_FIRST_TOKEN, LLM_RETRIES, LLM_FAILURES, LLM_TOKENS, LLM_HEDGES, LLM_SINGLE_FLIGHT, Gauge, registry
 
-from openai import OpenAI
-
-from config import OPENROUTER_API_KEY
+import logging
+logger = logging.getLogger(__name__)
 
 
 # загружаем переменные из .env в систему, чтобы потом можно было достать
@@ -12,666 +43,488 @@ from config import OPENROUTER_API_KEY
 
 OPENROUTER_API_KEY = OPENROUTER_API_KEY
 
+# основная модель, остальные из LLM_MODELS — запасные
+MODEL = LLM_MODELS[0]
+
+
+# общий пул keep-alive соединений для всех запросов к LLM
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    ),
+    timeout=httpx.Timeout(LLM_TIMEOUT),
+)
 
-# Инициализация клиента OpenRouter (OpenAI-совместимый) [web:45][web:49][web:83]
-client = OpenAI(
+# Инициализация асинхронного клиента OpenRouter (OpenAI-совместимый) [web:45][web:49][web:83]
+# ретраи делаем сами в ask_llm, поэтому у клиента их отключаем
+client = AsyncOpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=OPENROUTER_API_KEY,
+    http_client=http_client,
+    max_retries=0,
 )
 
-async def ask_llm(description: str, system_msg:str) -> dict:
-    print("попал в ask_llm")
-    user_msg = description
+# ограничение на количество одновременных запросов к LLM
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
 
-    error = ""
-    max_retries=3
-    for i in range(max_retries):
-        try:
-            print("перед получением ответа")
-            # Вызов chat completion через OpenRouter [web:45][web:49][web:76]
-            response = client.chat.completions.create(
-                model="google/gemini-2.0-flash-lite-001",
-                messages=[
-                    {"role": "system", "content": system_msg},
-                    {"role": "user", "content": user_msg},
-                ],
-                # JSON-режим: просим модель возвращать JSON-объект [web:81][web:85]
-                response_format={"type": "json_object"},
-                max_tokens=None,
-                temperature=0.70,
-            )
-            print("после получения ответа")
 
-            content: str = response.choices[0].message.content
-            data = json.loads(content)
+async def close_llm_client():
+    """Закрыть пул соединений к LLM при остановке бота"""
+    await client.close()
 
-            print(data)
 
-            return data  
+def log_usage(response, model: str = MODEL):
+    """Токены запроса в лог и в метрики; cached — сколько токенов префикса взято из кэша провайдера"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion")
+    LLM_TOKENS.inc(cached, model=model, kind="cached")
+    logger.info(
+        f"LLM токены ({model}): prompt={usage.prompt_tokens}, cached={cached}, completion={usage.completion_tokens}"
+    )
 
-        except Exception as e:
-            print("попал в exception")
-            # На проде лучше логировать ошибку
-            error=e
-            await asyncio.sleep(0.5)
 
-    return error
+# ================= устойчивость =================
 
-async def parse_text(description: str) -> dict: 
-    print("попал в parse_text")
-    system_msg = """
-    Ты — ассистент по тайм-менеджменту. Твоя задача — понять сообщение пользователя и определить, содержит ли оно одну или несколько задач.
-    Достать задачи из текста и записать их максимально понятно.
-    Задач может быть любое количество. Ты должен достать все задачи из текста и записать их в удобной для понимания форме.
-    
-    ОБЩИЕ ПРАВИЛА:
-    1. Ты ВСЕГДА отвечаешь СТРОГО в формате JSON.
-    2. Никакого текста вне JSON.
-    3. Корневой объект ВСЕГДА содержит поле "type".
-    4. Если по сообщению не понятно про какой день говорит пользователь - не ставь дату
-
-    ВОЗМОЖНЫЕ ТИПЫ ОТВЕТА:
-
-    1) "type": "tasks" — если в тексте есть одна или несколько задач.
-    2) "type": "shopping_list" — если пользователь перечисляет товары, которые нужно купить.
-    --------------------------------------------------
-
-    ФОРМАТ ОТВЕТА, ЕСЛИ НАЙДЕНЫ ЗАДАЧИ:
-
-    {
-    "type": "tasks",
-    "items": [
-        {
-        "category": "тип категории",
-        "date": "дата выполнения задачи в формате YYYY-MM-DD или пустая строка",
-        "time": "время выполнения в формате HH:MM или пустая строка",
-        "remind_date": "дата напоминания в формате YYYY-MM-DD или пустая строка",
-        "remind_time": "время напоминания в формате HH:MM или пустая строка",
-        "task": "краткое описание задачи"
-        }
-    ]
-    }
+breakers = {
+    model: CircuitBreaker(model, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+    for model in LLM_MODELS
+}
+latencies = {model: LatencyWindow() for model in LLM_MODELS}
 
-    Если в тексте описано несколько задач — добавь каждую отдельным объектом в массив items.
 
-    --------------------------------------------------
+def _is_retryable(error: Exception) -> bool:
+    """Таймауты, обрывы, 429 и 5xx повторяем; остальные 4xx (ключ, неверный запрос) — нет"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return True
 
-    КАТЕГОРИИ ЗАДАЧ (используй ТОЛЬКО их):
 
-    - short_5 — до 5 минут.
-    - short_30 — от 5 до 30 минут.
-    - short_120 — от 30 минут до 2 часов.
-    - long — более 2 часов или сложные проекты.
+def _final_error(error: Exception | None, model: str | None, timed_out: bool) -> LLMError:
+    """
+    Во что превратить последнюю ошибку, когда модели и попытки кончились.
+    model — модель, ответившая этой ошибкой (None — запрос не ушел ни к одной)
+    """
+    LLM_FAILURES.inc(model=model or "none")
+    if error is None:
+        # ни одна модель не пропустила запрос; полуоткрытые ждут пробного запроса — тоже не 0 с
+        retry_after = min((b.retry_after() for b in breakers.values() if b.state == OPEN), default=0.0)
+        return LLMCircuitOpen(max(1.0, retry_after))
+    if timed_out or isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+        return LLMTimeout(f"LLM не ответила за {LLM_DEADLINE} с: {error!r}")
+    if isinstance(error, LLMError):
+        return error
+    return LLMUnavailable(f"LLM недоступна: {error!r}")
+
+
+def _messages(system_msg: str, user_msg: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg},
+    ]
 
-    Допустимые значения: "short_5", "short_30", "short_120", "long".
 
-    --------------------------------------------------
+async def _request(model: str, messages: list[dict], timeout: float) -> dict:
+    """Один запрос к модели; timeout — дедлайн всей попытки, а не одного чтения сокета"""
+    start = time.perf_counter()
+    try:
+        # не блокирует event loop, пока ждем ответ модели
+        async with llm_semaphore:
+            response = await asyncio.wait_for(client.chat.completions.create(
+                model=model,
+                messages=messages,
+                # JSON-режим: просим модель возвращать JSON-объект [web:81][web:85]
+                response_format={"type": "json_object"},
+                max_tokens=None,
+                temperature=0.70,
+                timeout=timeout,
+            ), timeout)
+    except Exception:
+        LLM_LATENCY.observe(time.perf_counter() - start, model=model, outcome="error")
+        raise
+    elapsed = time.perf_counter() - start
+    log_usage(response, model)
+
+    content = response.choices[0].message.content
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError) as e:
+        LLM_LATENCY.observe(elapsed, model=model, outcome="bad_response")
+        raise LLMBadResponse(f"{model} ответила не JSON: {content!r}") from e
+    if not isinstance(data, dict):
+        LLM_LATENCY.observe(elapsed, model=model, outcome="bad_response")
+        raise LLMBadResponse(f"{model} ответила не объектом: {content!r}")
+
+    LLM_LATENCY.observe(elapsed, model=model, outcome="ok")
+    latencies[model].add(elapsed)
+    logger.debug(f"ответ LLM: {data}")
+    return data
 
-    ПРИМЕРЫ ДЛЯ ЗАДАЧ:
 
-    ПРИМЕР 1:
-    ввод:
-    сегодня Monday, 2026-01-31 10:20, мне нужно завтра купить после обеда наушники для Наташи
+async def _hedged_request(model: str, messages: list[dict], timeout: float) -> dict:
+    """
+    Если ответа нет дольше LLM_HEDGE_PERCENTILE-го перцентиля обычной задержки,
+    отправляем такой же второй запрос и берем первый успешный ответ
+    """
+    delay = latencies[model].percentile(LLM_HEDGE_PERCENTILE) if LLM_HEDGE_PERCENTILE else None
+    if delay is None or delay >= timeout:
+        return await _request(model, messages, timeout)
+
+    first = asyncio.create_task(_request(model, messages, timeout))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            LLM_HEDGES.inc(model=model)
+            tasks.add(asyncio.create_task(_request(model, messages, timeout - delay)))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def ask_llm(description: str, system_msg: str) -> dict:
+    """
+    Запрос к LLM с защитой от сбоев провайдера:
+    - каждая попытка ограничена LLM_TIMEOUT, весь вызов — LLM_DEADLINE;
+    - повторы с паузой base * 2^n со случайным разбросом, чтобы не бить в провайдера всем разом;
+    - модели из LLM_MODELS по порядку, у каждой свой circuit breaker: пока он открыт,
+      модель пропускается, а если открыты все — ошибка сразу, без ожидания;
+    - при LLM_HEDGE_PERCENTILE — дублирующий запрос к медленной модели.
+    Бросает LLMError (ai/errors.py)
+    """
+    messages = _messages(system_msg, description)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_DEADLINE
+    error = None
+    failed_model = None
+
+    for model in LLM_MODELS:
+        breaker = breakers[model]
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            if not breaker.allow():
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                breaker.abandon()
+                raise _final_error(error, failed_model, timed_out=True) from error
+            if attempt:
+                LLM_RETRIES.inc(model=model)
+            try:
+                data = await _hedged_request(model, messages, min(LLM_TIMEOUT, remaining))
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            except LLMBadResponse as e:
+                # провайдер отвечает, модель просто ошиблась с форматом — повторяем ее же
+                breaker.record_success()
+                error, failed_model = e, model
+                logger.warning(f"{e} (попытка {attempt + 1})")
+            except Exception as e:
+                breaker.record_failure()
+                error, failed_model = e, model
+                logger.warning(f"ошибка запроса к {model} (попытка {attempt + 1}): {e!r}")
+                if not _is_retryable(e):
+                    break
+            else:
+                breaker.record_success()
+                return data
+
+            if attempt + 1 < LLM_MAX_ATTEMPTS:
+                pause = min(backoff(attempt, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX), deadline - loop.time())
+                if pause > 0:
+                    await asyncio.sleep(pause)
+        if model != LLM_MODELS[-1]:
+            logger.warning(f"{model} недоступна ({breaker.state}), пробуем следующую модель")
+
+    raise _final_error(error, failed_model, timed_out=False) from error
+
+
+# ================= single-flight =================
+
+class _SharedStream:
+    """Ответ, который читает лидер; остальные получают те же куски с начала"""
+
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        # задача, читающая ответ LLM (ссылка, чтобы ее не собрал сборщик мусора)
+        self.pump: asyncio.Task | None = None
+        # заменяется на новое после каждого куска, ожидающие будятся старым
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    Одинаковые запросы к LLM, которые выполняются одновременно (двойное нажатие,
+    повторная доставка обновления, повторно отправленный текст), делят один запрос.
+    Ключ — системный промпт + нормализованное сообщение пользователя (с датой и временем).
+    Запрос идет в отдельной задаче: отмена одного из ожидающих не обрывает его для остальных
+    """
 
-    ответ:
-    {
-    "type": "tasks",
-    "items": [
-        {
-        "category": "short_5",
-        "date": "2026-02-01",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "купить наушники Наташе"
-        }
-    ]
-    }
-
-    --------------------------------------------------
-
-    ПРИМЕР 2:
-    ввод:
-    сегодня Tuesday, 2026-07-19 20:07, нужно через неделю сходить в зал в 19, напомни за день вечером. и нужно сегодня забрать протеин с озона
-
-    ответ:
-    {
-    "type": "tasks",
-    "items": [
-        {
-        "category": "short_120",
-        "date": "2026-07-26",
-        "time": "19:00",
-        "remind_date": "2026-07-25",
-        "remind_time": "18:00",
-        "task": "сходить в зал"
-        },
-        {
-        "category": "short_30",
-        "date": "2026-07-19",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "забрать протеин с озона"
-        }
-    ]
-    }
-    ПРИМЕР 3:
-    ввод:
-    сегодня Friday, 2025-09-10 10:17, напомни мне через 40 минут снять кастрюлю с плиты
-    ответ:
-    {
-    "type": "tasks",
-    "items": [
-        {
-        "category": "short_5",
-        "date": "2025-09-10",
-        "time": "10:57",
-        "remind_date": "2025-09-10",
-        "remind_time": "10:57",
-        "task": "снять кастрюлю с плиты"
-        }
-    ]
-    }
-
-    ПРИМЕР 4:
-    ввод:
-    сегодня Monday, 2025-10-10 10:17, Родион
-    1. переделать генерацию приемов пищи на дни отдельно и список покупок отдельно
-    2. запрос для получения бжу и калорий на день на пользователя
-    3. найти слабые места в коде
-
-    ответ:
-    {
-    "type": "tasks",
-    "items": [
-        {
-        "category": "short_120",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "переделать генерацию приемов пищи на дни отдельно и список покупок отдельно"
-        },
-        {
-        "category": "short_120",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "сделать запрос для получения бжу и калорий на день на пользователя"
-        },
-        {
-        "category": "short_30",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": " найти слабые метса в коде"
-        }
-    ]
-    }
-
-    ПРИМЕР 5 (пользователь написал покупку но указал время):
-    ввод:
-    сегодня Friday, 2025-09-10 10:17, купить хлеб в 18
-    ответ:
-    {
-    "type": "tasks",
-    "items": [
-        {
-        "category": "short_30",
-        "date": "2025-09-10",
-        "time": "18:00",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "купить хлеб"
-        }
-    ]
-    }
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._streams: dict[str, _SharedStream] = {}
+        # сколько запросов ушло в LLM и сколько вызовов к ним присоединились
+        self.leaders = 0
+        self.collapsed = 0
+
+    @staticmethod
+    def make_key(system_msg: str, user_msg: str) -> str:
+        raw = "\x00".join((system_msg, normalize(user_msg)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, kind: str, leader: bool):
+        if leader:
+            self.leaders += 1
+        else:
+            self.collapsed += 1
+        LLM_SINGLE_FLIGHT.inc(kind=kind, outcome="leader" if leader else "collapsed")
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[dict]]) -> dict:
+        task = self._calls.get(key)
+        self._count("call", leader=task is None)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish_call(key, t))
+        result = await asyncio.shield(task)
+        # у каждого вызова своя копия: обработчики могут менять ответ
+        return copy.deepcopy(result)
+
+    def _finish_call(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # ошибку могли не забрать, если все ожидающие отменены
+        if not task.cancelled():
+            task.exception()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        shared = self._streams.get(key)
+        self._count("stream", leader=shared is None)
+        if shared is None:
+            shared = self._streams[key] = _SharedStream()
+            shared.pump = asyncio.create_task(self._pump(key, shared, factory))
+
+        position = 0
+        while True:
+            changed = shared.changed
+            while position < len(shared.chunks):
+                yield shared.chunks[position]
+                position += 1
+            if shared.done:
+                if shared.error:
+                    raise shared.error
+                return
+            await changed.wait()
+
+    async def _pump(self, key: str, shared: _SharedStream, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in factory():
+                shared.chunks.append(chunk)
+                shared.notify()
+        except BaseException as e:
+            shared.error = e
+        finally:
+            shared.done = True
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+            shared.notify()
+
+
+llm_flights = SingleFlight()
+
+
+async def parse_text(text: str, dt_string: str) -> dict: 
+    system_msg = PARSE_SYSTEM_PROMPT
+    description = f"сегодня {dt_string}, {text}"
+
+    # одинаковые фразы в один и тот же день отдаем из кэша без запроса к LLM
+    cache_key = llm_cache.make_key(system_msg, text, dt_string) if llm_cache else None
+    if cache_key:
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    async def call() -> dict:
+        data = await ask_llm(description, system_msg)
+        if cache_key and data.get("items"):
+            await llm_cache.put(cache_key, data)
+        return data
+
+    return await llm_flights.run(SingleFlight.make_key(system_msg, description), call)
     
-    ЕСЛИ ПОЛЬЗОВАТЕЛЬ НАПИСАЛ КУПИТЬ ЧТО-НИБУДЬ, НО УКАЗАЛ ВРЕМЯ, ТО ЭТО ЗАДАЧА
-    --------------------------------------------------
-
-    ФОРМАТ ОТВЕТА ДЛЯ ПОКУПОК ("type": "shopping_list"):
-
-    {
-    "type": "shopping_list",
-    "items": [
-        {
-        "category": "строго из списка ниже",
-        "item": "название товара",
-        "amount": "число (float) или пустая строка",
-        "unit": "строго из списка ниже или пустая строка"
-        }
-    ]
-    }
-
-    КАТЕГОРИИ ПОКУПОК (используй ТОЛЬКО эти):
-    - grocery (продукты, напитки)
-    - pharmacy (лекарства)
-    - household (бытовая химия, товары для дома)
-    - beauty (гигиена, косметика)
-    - electronics (техника, батарейки)
-    - clothes (одежда, обувь)
-    - other (все остальное)
-
-    ЕДИНИЦЫ ИЗМЕРЕНИЯ (приводи к этому виду):
-    - кг (пересчитывай граммы в кг: 500г -> 0.5)
-    - л (пересчитывай мл в литры: 500мл -> 0.5)
-    - шт (для штук, пачек, упаковок)
-    - м (метры)
-
-    --------------------------------------------------
-
-    ПРИМЕРЫ ДЛЯ ПОКУПОК:
-
-    ПРИМЕР 1:
-    ввод:
-    сегодня Monday, 2026-02-10 12:00, две пачки молока, полкило яблок и пластырь
-
-    ответ:
-    {
-    "type": "shopping_list",
-    "items": [
-        {
-        "category": "grocery",
-        "item": "молоко",
-        "amount": "2.0",
-        "unit": "шт"
-        },
-        {
-        "category": "grocery",
-        "item": "яблоки",
-        "amount": "0.5",
-        "unit": "кг"
-        },
-        {
-        "category": "pharmacy",
-        "item": "пластырь",
-        "amount": "",
-        "unit": ""
-        }
-    ]
-    }
-
-    ПРИМЕР 2:
-    ввод:
-    сегодня Monday, 2026-02-10 12:00, нужно купить молоко
-
-    ответ:
-    {
-    "type": "shopping_list",
-    "items": [
-        {
-        "category": "grocery",
-        "item": "молоко",
-        "amount": "",
-        "unit": ""
-        }
-    ]
-    }
-
-    ПРИМЕР 2:
-    ввод:
-    сегодня Monday, 2026-02-10 12:00, мне нужно купить соду яйца десяток половая швабра наушники
-
-    ответ:
-    {
-    "type": "shopping_list",
-    "items": [
-        {
-        "category": "grocery",
-        "item": "сода",
-        "amount": "",
-        "unit": ""
-        },
-        {
-        "category": "grocery",
-        "item": "яйца",
-        "amount": "10",
-        "unit": "шт"
-        },
-        {
-        "category": "household",
-        "item": "половая швабра",
-        "amount": "",
-        "unit": ""
-        },
-        {
-        "category": "electronics",
-        "item": "наушники",
-        "amount": "",
-        "unit": ""
-        }
-    ]
-    }
-
-    --------------------------------------------------
-
-    ВАЖНО:
-    - Если пользователь указывает количество текстом ("три"), переводи в число (3.0).
-    - Если в сообщении есть и дела, и покупки — выбери тип, которого больше.
-    - Никогда не возвращай массив или строку на верхнем уровне.
-
 
+async def ask_llm_stream(description: str, system_msg: str) -> AsyncIterator[str]:
     """
-    data = await ask_llm(description, system_msg)
-    return data
-    
+    Как ask_llm, но отдает текст ответа кусками по мере генерации.
+    Дедлайн попытки — до первого куска; повторяем и переключаем модель, только пока
+    модель ничего не прислала: начатый ответ уже показан пользователю.
+    Дублирующие запросы не делаем. Бросает LLMError (ai/errors.py)
+    """
+    messages = _messages(system_msg, description)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_DEADLINE
+    error = None
+    failed_model = None
+
+    for model in LLM_MODELS:
+        breaker = breakers[model]
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            if not breaker.allow():
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                breaker.abandon()
+                raise _final_error(error, failed_model, timed_out=True) from error
+            if attempt:
+                LLM_RETRIES.inc(model=model)
+            timeout = min(LLM_TIMEOUT, remaining)
+            start = time.perf_counter()
+            started = False
+            try:
+                async with llm_semaphore:
+                    async with asyncio.timeout(timeout) as first_chunk_deadline:
+                        stream = await client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            response_format={"type": "json_object"},
+                            max_tokens=None,
+                            temperature=0.70,
+                            timeout=timeout,
+                            stream=True,
+                            # в последнем куске придет usage
+                            stream_options={"include_usage": True},
+                        )
+                        async for chunk in stream:
+                            if chunk.usage:
+                                log_usage(chunk, model)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if not delta:
+                                continue
+                            if not started:
+                                started = True
+                                # дальше ответ идет, общий дедлайн попытки больше не нужен
+                                first_chunk_deadline.reschedule(None)
+                                LLM_FIRST_TOKEN.observe(time.perf_counter() - start, model=model)
+                            yield delta
+                LLM_LATENCY.observe(time.perf_counter() - start, model=model, outcome="ok")
+                breaker.record_success()
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.abandon()
+                raise
+            except Exception as e:
+                LLM_LATENCY.observe(time.perf_counter() - start, model=model, outcome="error")
+                breaker.record_failure()
+                logger.warning(f"ошибка стриминга ответа {model} (попытка {attempt + 1}): {e!r}")
+                if started:
+                    LLM_FAILURES.inc(model=model)
+                    raise LLMUnavailable(f"ответ LLM оборвался: {e!r}") from e
+                error, failed_model = e, model
+                if not _is_retryable(e):
+                    break
+
+            if attempt + 1 < LLM_MAX_ATTEMPTS:
+                pause = min(backoff(attempt, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX), deadline - loop.time())
+                if pause > 0:
+                    await asyncio.sleep(pause)
+        if model != LLM_MODELS[-1]:
+            logger.warning(f"{model} недоступна ({breaker.state}), пробуем следующую модель")
+
+    raise _final_error(error, failed_model, timed_out=False) from error
+
+
+def _validate_item(type: str, data: dict) -> TaskLLMResponse | ItemLLMResponse | None:
+    schema = SCHEMAS.get(type)
+    if schema is None:
+        logger.error(f"неизвестный тип ответа LLM: {type}")
+        return None
+    try:
+        return schema(**data)
+    except ValidationError as e:
+        logger.warning(f"пропускаю элемент {data}: {e}")
+        return None
+
+
+async def parse_text_stream(text: str, dt_string: str) -> AsyncIterator[TaskLLMResponse | ItemLLMResponse]:
+    """
+    parse_text в режиме стриминга: отдает каждый проверенный элемент items,
+    как только модель закончила его объект. Битые элементы пропускаются
+    """
+    system_msg = PARSE_SYSTEM_PROMPT
+    description = f"сегодня {dt_string}, {text}"
+
+    cache_key = llm_cache.make_key(system_msg, text, dt_string) if llm_cache else None
+    if cache_key:
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            for data in cached.get("items") or []:
+                item = _validate_item(cached.get("type"), data)
+                if item:
+                    yield item
+            return
+
+    parser = ItemsStreamParser()
+    # элементы, которые закрылись раньше, чем модель написала "type"
+    pending = []
+    flight_key = SingleFlight.make_key(system_msg, description)
+    async for chunk in llm_flights.stream(flight_key, lambda: ask_llm_stream(description, system_msg)):
+        pending.extend(parser.feed(chunk))
+        if parser.type is None:
+            continue
+        for data in pending:
+            item = _validate_item(parser.type, data)
+            if item:
+                yield item
+        pending.clear()
+
+    for data in pending:
+        item = _validate_item(parser.type, data)
+        if item:
+            yield item
+
+    result = parser.result()
+    if cache_key and result["type"] and result["items"]:
+        await llm_cache.put(cache_key, result)
+
 
 async def edit_task(description: str, date_and_time: str) -> dict:
+    """
+    Правка задачи/покупки по комментарию пользователя.
+    Дата и время передаются в user-сообщении, системный промпт общий для всех запросов
+    """
+    system_msg = EDIT_SYSTEM_PROMPT
+    if date_and_time not in description:
+        description = f"Сегодня {date_and_time}. {description}"
 
-    system_msg = f'''
-    Ты — ассистент по тайм-менеджменту. Твоя задача — получить задачу или список покупок и комментарий к ним,
-    понять комментарий и если нужно изменить элемент и прислать его в нужном формате.
-
-    ВАЖНО: Ты можешь работать с двумя типами данных:
-    - "tasks" — задачи
-    - "shopping_list" — покупки
-
-    Если пользователь хочет изменить задачу — используй формат tasks.
-    Если пользователь хочет изменить покупку — используй формат shopping_list.
-
-    Пришли новую версию в таком формате (выбери ОДИН из вариантов):
-
-    ДЛЯ ЗАДАЧ ("type": "tasks"):
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "тип категории",
-        "date": "дата выполнения задачи в формате YYYY-MM-DD или пустая строка",
-        "time": "время выполнения в формате HH:MM или пустая строка",
-        "remind_date": "дата напоминания в формате YYYY-MM-DD или пустая строка",
-        "remind_time": "время напоминания в формате HH:MM или пустая строка",
-        "task": "краткое описание задачи"
-        }}
-    ]
-    }}
-
-    ДЛЯ ПОКУПОК ("type": "shopping_list"):
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "категория товара",
-        "item": "название товара",
-        "amount": "число (float) или пустая строка",
-        "unit": "единица измерения или пустая строка"
-        }}
-    ]
-    }}
-
-    ВРЕМЯ УКАЗЫВАЙ БЕЗ СЕКУНД: HH:MM
-    ВРЕМЯ УКАЗЫВАЙ БЕЗ СЕКУНД: HH:MM
-    ВРЕМЯ УКАЗЫВАЙ БЕЗ СЕКУНД: HH:MM
-
-    КАТЕГОРИИ ЗАДАЧ (используй ТОЛЬКО их):
-    - short_5 — до 5 минут.
-    - short_30 — от 5 до 30 минут.
-    - short_120 — от 30 минут до 2 часов.
-    - long — более 2 часов или сложные проекты.
-
-    КАТЕГОРИИ ПОКУПОК (используй ТОЛЬКО их):
-    - grocery (продукты, напитки)
-    - pharmacy (лекарства)
-    - household (бытовая химия, товары для дома)
-    - beauty (гигиена, косметика)
-    - electronics (техника, батарейки)
-    - clothes (одежда, обувь)
-    - other (все остальное)
-
-    ЕДИНИЦЫ ИЗМЕРЕНИЯ ДЛЯ ПОКУПОК:
-    - кг (пересчитывай граммы в кг: 500г -> 0.5)
-    - л (пересчитывай мл в литры: 500мл -> 0.5)
-    - шт (для штук, пачек, упаковок)
-    - м (метры)
-
-    "Перенеси на послезавтра" означает +2 дня к {date_and_time}
-    "Перенеси на завтра" означает +1 дня к {date_and_time}
-    сейчас время: {date_and_time}
-
-    ОЧЕНЬ ВАЖНО ПРИСЛАТЬ ИМЕННО В ТАКОМ ФОРМАТЕ. УКАЗЫВАЙ ПРАВИЛЬНОЕ ВРЕМЯ.
-    ЕСЛИ ПОЛЬЗОВАТЕЛЬ НЕ ГОВОРИТ ЧТО-ТО МЕНЯТЬ, НЕ МЕНЯЙ НИЧЕГО, ДАЖЕ ВРЕМЯ И ДАТУ, ПРОСТО ВСЕ ПЕРЕПИШИ В ДРУГОЙ ФОРМАТ.
-
-    Примеры для ЗАДАЧ:
-    пример 1 (назначить задачу на сегодня):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя задача:
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "short_30",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "Сходить в пятерочку"
-        }}
-    ]
-    }}
-    Вот моя просьба: Сегодня
-    Твой ответ:
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "short_30",
-        "date": "2026-02-27",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "Сходить в пятерочку"
-        }}
-    ]
-    }}
-
-    пример 2 (посмотреть задачу):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя задача:
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "short_30",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "Сходить в пятерочку"
-        }}
-    ]
-    }}
-    Вот моя просьба: покажи
-    Твой ответ:
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "short_30",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "Сходить в пятерочку"
-        }}
-    ]
-    }}
-
-    пример 3 (изменить задачу):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя задача:
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "short_30",
-        "date": "",
-        "time": "",
-        "remind_date": "",
-        "remind_time": "",
-        "task": "Сходить в пятерочку"
-        }}
-    ]
-    }}
-    Вот моя просьба: я закажу онлайн напомни через часик
-    Твой ответ:
-    {{
-    "type": "tasks",
-    "items": [
-        {{
-        "category": "short_5",
-        "date": "2026-02-27",
-        "time": "23:19",
-        "remind_date": "2026-02-27",
-        "remind_time": "23:19",
-        "task": "Заказать еду из пятерочки"
-        }}
-    ]
-    }}
-
-    Примеры для ПОКУПОК:
-
-    пример 5 (изменить количество в покупке):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя покупка:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "grocery",
-        "item": "молоко",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-    Вот моя просьба: две упаковки
-    Твой ответ:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "grocery",
-        "item": "молоко",
-        "amount": "2.0",
-        "unit": "шт"
-        }}
-    ]
-    }}
-
-    пример 6 (изменить категорию покупки):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя покупка:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "other",
-        "item": "шампунь",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-    Вот моя просьба: это из гигиены
-    Твой ответ:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "beauty",
-        "item": "шампунь",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-
-    пример 7 (добавить единицы измерения):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя покупка:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "grocery",
-        "item": "яблоки",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-    Вот моя просьба: полкило
-    Твой ответ:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "grocery",
-        "item": "яблоки",
-        "amount": "0.5",
-        "unit": "кг"
-        }}
-    ]
-    }}
-
-    пример 8 (исправить название товара):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя покупка:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "pharmacy",
-        "item": "пластырь",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-    Вот моя просьба: не пластырь а бинт
-    Твой ответ:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "pharmacy",
-        "item": "бинт",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-
-    пример 9 (показать покупку):
-    Сегодня Friday, 2026-02-27 22:19. Вот моя покупка:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "other",
-        "item": "шампунь",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
-    Вот моя просьба: покажи
-    Твой ответ:
-    {{
-    "type": "shopping_list",
-    "items": [
-        {{
-        "category": "other",
-        "item": "шампунь",
-        "amount": "",
-        "unit": ""
-        }}
-    ]
-    }}
+    return await llm_flights.run(
+        SingleFlight.make_key(system_msg, description),
+        lambda: ask_llm(description, system_msg),
+    )
 
-    ВАЖНО: 
-    - Если пользователь редактирует задачу — используй формат tasks
-    - Если пользователь редактирует покупку — используй формат shopping_list
-    - Никогда не меняй тип (tasks/shopping_list) без явной просьбы пользователя
-    - НЕ МЕНЯЙ ПОЛЯ КОТОРЫЕ ПОЛЬЗОВАТЕЛЬ НЕ ПРОСИТ ИЗМЕНИТЬ!
-    '''
 
-    data = await ask_llm(description, system_msg)
-    return data
\ No newline at end of file
+registry.register(Gauge(
+    "llm_circuit_state", "Состояние circuit breaker модели: 0 — закрыт, 1 — пробный запрос, 2 — открыт", ("model",),
+    callback=lambda: {(m,): {HALF_OPEN: 1, OPEN: 2}.get(b.state, 0) for m, b in breakers.items()},
+))
@@ -0,0 +1,29 @@
+# errors.py
+"""
+Ошибки вызова LLM. ask_llm и ask_llm_stream бросают только их,
+обработчики по типу решают, что ответить пользователю.
+"""
+
+
+class LLMError(Exception):
+    """Базовая ошибка LLM"""
+
+
+class LLMTimeout(LLMError):
+    """Не уложились в LLM_DEADLINE со всеми повторами"""
+
+
+class LLMUnavailable(LLMError):
+    """Все модели из LLM_MODELS ответили ошибкой"""
+
+
+class LLMCircuitOpen(LLMUnavailable):
+    """Все модели временно отключены circuit breaker'ом, запрос даже не отправлялся"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM недоступна, повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class LLMBadResponse(LLMError):
+    """Модель ответила, но не JSON-объектом или объектом не по схеме"""
@@ -0,0 +1,88 @@
+# json_stream.py
+"""
+Инкрементальный разбор ответа LLM вида {"type": "...", "items": [{...}, {...}]},
+который приходит кусками (stream). Каждый объект из items отдается, как только
+закрылась его фигурная скобка, не дожидаясь конца ответа.
+"""
+import json
+import re
+
+import logging
+logger = logging.getLogger(__name__)
+
+TYPE_RE = re.compile(r'"type"\s*:\s*"([a-z_]+)"')
+ITEMS_KEY_RE = re.compile(r'"items"\s*:\s*$')
+
+
+class ItemsStreamParser:
+    """
+    feed(chunk) возвращает объекты items, закрывшиеся в этом куске.
+    Текст сканируется один раз: помним позицию, глубину вложенности и то,
+    находимся ли внутри строки (скобки в строках не считаются).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.type: str | None = None
+        self.items: list[dict] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # глубина внутри массива items (None — массив еще не начался или закончился)
+        self._items_depth: int | None = None
+        self._item_start: int | None = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        self.text += chunk
+        closed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and ITEMS_KEY_RE.search(text, 0, i):
+                    self._items_depth = self._depth + 1
+                elif ch == "{" and self._depth == self._items_depth:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._item_start is not None and self._depth == self._items_depth:
+                    item = self._load(text[self._item_start:i + 1])
+                    self._item_start = None
+                    if item is not None:
+                        closed.append(item)
+                elif ch == "]" and self._depth + 1 == self._items_depth:
+                    self._items_depth = None
+        self._pos = len(text)
+
+        if self.type is None:
+            match = TYPE_RE.search(text)
+            if match:
+                self.type = match.group(1)
+        self.items.extend(closed)
+        return closed
+
+    @staticmethod
+    def _load(fragment: str) -> dict | None:
+        try:
+            item = json.loads(fragment)
+        except json.JSONDecodeError:
+            logger.warning(f"не удалось разобрать элемент ответа LLM: {fragment}")
+            return None
+        return item if isinstance(item, dict) else None
+
+    def result(self) -> dict:
+        """Итог в том же виде, что у ask_llm"""
+        return {"type": self.type, "items": list(self.items)}
@@ -0,0 +1,120 @@
+# llm_cache.py
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES
+
+import logging
+logger = logging.getLogger(__name__)
+
+# ответ на такие фразы зависит от текущего времени, а не только от даты — не кэшируем
+RELATIVE_TIME_RE = re.compile(
+    r"\bчерез\b|\bсейчас\b|\bскоро\b|\bпозже\b|\bпотом\b|полчас|\bчасик|\bминутк",
+    re.IGNORECASE,
+)
+
+# дата из строки вида "Понедельник (Monday), 2026-02-27 22:19"
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def normalize(text: str) -> str:
+    """Нормализация текста для ключа: регистр, пробелы, точка в конце"""
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip(" .!")
+
+
+class LLMCache:
+    """
+    Кэш ответов LLM в SQLite: переживает перезапуск бота.
+    Ключ — системный промпт + нормализованный текст + дата пользователя,
+    поэтому "завтра" на следующий день уже не попадет в старую запись.
+    Записи живут TTL часов, при переполнении вытесняются самые давно использованные.
+    """
+
+    def __init__(self, path: str, ttl_hours: float, max_entries: int):
+        self.ttl = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(system_msg: str, text: str, dt_string: str) -> str | None:
+        """Ключ кэша или None, если сообщение нельзя кэшировать"""
+        if RELATIVE_TIME_RE.search(text):
+            return None
+        date_match = DATE_RE.search(dt_string)
+        day = date_match.group(0) if date_match else dt_string
+        raw = "\x00".join((system_msg, day, normalize(text)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def _put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            # просроченные и лишние (самые давно использованные) записи
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> dict | None:
+        value = await asyncio.to_thread(self._get, key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def put(self, key: str, value: dict):
+        await asyncio.to_thread(self._put, key, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES) if LLM_CACHE_ENABLED else None
@@ -0,0 +1,95 @@
+# resilience.py
+"""
+Защита вызовов LLM: circuit breaker на модель, пауза с экспоненциальным ростом
+и случайным разбросом (jitter) и скользящее окно задержек для дублирующих запросов.
+"""
+import random
+import time
+from collections import deque
+
+import logging
+logger = logging.getLogger(__name__)
+
+# состояния circuit breaker
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    closed — запросы идут; после failure_threshold ошибок подряд — open:
+    запросы не отправляются reset_timeout секунд; затем half_open — пропускаем
+    один пробный запрос: успех закрывает, ошибка снова открывает
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        """Через сколько секунд можно пробовать снова (0 — уже можно)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def abandon(self):
+        """Пробный запрос отменен без результата — следующий вызов снова сможет попробовать"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"{self.name}: circuit breaker закрыт")
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"{self.name}: circuit breaker открыт на {self.reset_timeout} с после {self.failures} ошибок")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Пауза перед повтором номер attempt (с 0): случайная в [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class LatencyWindow:
+    """Последние size длительностей успешных запросов, для перцентиля"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._values = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float):
+        self._values.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        """None, пока данных мало"""
+        if len(self._values) < self.min_samples:
+            return None
+        ordered = sorted(self._values)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
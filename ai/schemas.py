@@ -44,6 +44,12 @@ class ItemLLMResponse(BaseModel):
             return None
         return v
 
+# схема элемента items по полю "type" ответа LLM
+SCHEMAS = {
+    "tasks": TaskLLMResponse,
+    "shopping_list": ItemLLMResponse,
+}
+
 """
 получаю либо это
     {
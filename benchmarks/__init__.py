@@ -0,0 +1,9 @@
+"""
+Бенчмарки и проверки производительности (запускаются вручную, без сети):
+    python -m benchmarks.suite          — горячие пути бота с фейковыми Bot и LLM, JSON для сравнения
+    python -m benchmarks.loop_blocking  — блокировка event loop синхронной БД
+    python -m benchmarks.fast_parser    — точность и скорость быстрого разбора
+    python -m benchmarks.query_plans    — все запросы database.py идут по индексам
+    python -m benchmarks.sqlite_profiles — профили SQLite под конкурентной нагрузкой
+    python -m benchmarks.prompt_budget  — размер и неизменность системных промптов LLM
+"""
@@ -0,0 +1,36 @@
+"""
+Все офлайн-проверки разом (перед коммитом или в CI): планы запросов, бюджет промптов,
+корпус быстрого разбора и регрессионные проверки.
+Каждая проверка запускается отдельным процессом — у них свои временные БД и переменные окружения.
+Код выхода 1, если не прошла хотя бы одна.
+
+Запуск:
+    python -m benchmarks.checks
+"""
+import subprocess
+import sys
+
+CHECKS = [
+    "benchmarks.query_plans",
+    "benchmarks.prompt_budget",
+    "benchmarks.fast_parser",
+    "benchmarks.regressions",
+]
+
+
+def main() -> int:
+    failed = []
+    for module in CHECKS:
+        print(f"== {module}", flush=True)
+        if subprocess.run([sys.executable, "-m", module]).returncode != 0:
+            failed.append(module)
+
+    if failed:
+        print(f"\nне прошли: {', '.join(failed)}")
+        return 1
+    print("\nвсе проверки прошли")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
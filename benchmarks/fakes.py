@@ -0,0 +1,109 @@
+"""
+Подмены для бенчмарков: Bot, который ничего не отправляет, а записывает вызовы,
+и ask_llm/ask_llm_stream с настраиваемой задержкой вместо запроса к OpenRouter.
+"""
+import asyncio
+import itertools
+import json
+import re
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message, User
+
+import ai.ai_client
+
+# формально корректный токен: Bot проверяет только формат
+FAKE_TOKEN = "123456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi"
+
+
+class FakeBot(Bot):
+    """Bot без сети: каждый вызов метода API записывается в calls"""
+
+    def __init__(self):
+        super().__init__(token=FAKE_TOKEN)
+        self.calls = []
+        self._ids = itertools.count(1000)
+
+    async def __call__(self, method: TelegramMethod, request_timeout: int | None = None):
+        self.calls.append(method)
+        if isinstance(method, SendMessage):
+            return make_message(method.chat_id, method.text, bot=self, message_id=next(self._ids))
+        return True
+
+    def count(self, method_type: type) -> int:
+        return sum(isinstance(c, method_type) for c in self.calls)
+
+
+def make_message(user_id: int, text: str, bot: Bot, message_id: int = 1, reply_to: Message | None = None) -> Message:
+    """Входящее сообщение пользователя, привязанное к bot"""
+    message = Message(
+        message_id=message_id,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="bench"),
+        text=text,
+        reply_to_message=reply_to,
+    )
+    return message.as_(bot)
+
+
+def fake_ask_llm(latency: float):
+    """
+    ask_llm с задержкой latency секунд. Для нового сообщения возвращает одну задачу
+    с его текстом, для редактирования — ту же задачу с временем 19:00.
+    """
+
+    async def ask_llm(description: str, system_msg: str) -> dict:
+        await asyncio.sleep(latency)
+        if "Вот моя просьба" in description:
+            task = re.search(r'"task": ?"(?P<task>[^"]*)"', description)
+            return {
+                "type": "tasks",
+                "items": [{
+                    "category": "short_30",
+                    "date": "",
+                    "time": "19:00",
+                    "remind_date": "",
+                    "remind_time": "",
+                    "task": task.group("task") if task else "задача",
+                }],
+            }
+        text = description.split(", ", 2)[-1]
+        return {
+            "type": "tasks",
+            "items": [{
+                "category": "short_30",
+                "date": "",
+                "time": "",
+                "remind_date": "",
+                "remind_time": "",
+                "task": text,
+            }],
+        }
+
+    return ask_llm
+
+
+def fake_ask_llm_stream(latency: float, chunk_size: int = 16):
+    """
+    ask_llm_stream: тот же ответ, что у fake_ask_llm, кусками по chunk_size символов;
+    задержка latency распределена между кусками, как при генерации токенов
+    """
+    answer = fake_ask_llm(0)
+
+    async def ask_llm_stream(description: str, system_msg: str):
+        text = json.dumps(await answer(description, system_msg), ensure_ascii=False)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk
+
+    return ask_llm_stream
+
+
+def install_fake_llm(latency: float):
+    """Подменить ask_llm и ask_llm_stream, которыми пользуются parse_text(_stream) и edit_task"""
+    ai.ai_client.ask_llm = fake_ask_llm(latency)
+    ai.ai_client.ask_llm_stream = fake_ask_llm_stream(latency)
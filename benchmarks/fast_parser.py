@@ -0,0 +1,83 @@
+"""
+Точность и скорость быстрого разбора (Parser.fast_parse) на корпусе сообщений.
+В корпусе для каждого сообщения записан правильный ответ или null —
+"такое должна разбирать LLM". Главные цифры:
+  покрытие — какая доля сообщений обходится без LLM;
+  ошибки   — ответы, которые не совпали с правильными (их должно быть 0);
+  задержка — p50/p99 на одно сообщение (для сравнения: запрос к LLM — секунды).
+
+Код выхода 1, если есть ошибки: уверенный неверный ответ до LLM уже не дойдет.
+
+Запуск:
+    python -m benchmarks.fast_parser --repeat 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from services.parser import Parser
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "parser_corpus.json")
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    answered = 0
+    wrong = []
+    missed = []
+    latencies = []
+
+    for case in corpus:
+        now = datetime.fromisoformat(case["now"])
+        expected = case["expected"]
+
+        result = Parser.fast_parse(case["text"], now)
+        got = result["items"][0] if result else None
+        if got is not None:
+            answered += 1
+            if got != expected:
+                wrong.append((case["text"], expected, got))
+        elif expected is not None:
+            missed.append(case["text"])
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            Parser.fast_parse(case["text"], now)
+        latencies.append((time.perf_counter() - start) / args.repeat)
+
+    total = len(corpus)
+    print(f"сообщений в корпусе: {total}")
+    print(f"разобрано без LLM: {answered} ({answered / total:.0%})")
+    print(f"ошибок: {len(wrong)}, отдано в LLM, хотя ответ известен: {len(missed)}")
+    print(
+        f"задержка на сообщение: p50 {percentile(latencies, 0.5) * 1e6:.1f} мкс, "
+        f"p99 {percentile(latencies, 0.99) * 1e6:.1f} мкс"
+    )
+
+    for text, expected, got in wrong:
+        print(f"\nОШИБКА: {text}\n  ожидали: {expected}\n  получили: {got}")
+    for text in missed:
+        print(f"пропущено: {text}")
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
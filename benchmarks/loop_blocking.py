@@ -0,0 +1,129 @@
+"""
+Сколько времени event loop стоит заблокированным на одно обновление:
+синхронный SQLAlchemy (как было) против асинхронного database.py.
+Главная цифра — задержка других корутин (p99/макс.): на столько в худшем случае
+замирают ответы другим пользователям, пока идет работа с БД.
+
+Запуск:
+    python -m benchmarks.loop_blocking --updates 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, time as dtime
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_loop.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+from models import Task, UserSettings
+
+
+class LoopMonitor:
+    """Меряет, насколько event loop опаздывает просыпаться (= время блокировки)"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            self.lags.append(max(lag, 0.0))
+
+    @property
+    def blocked(self) -> float:
+        return sum(self.lags)
+
+    def percentile(self, p: float) -> float:
+        if not self.lags:
+            return 0.0
+        lags = sorted(self.lags)
+        return lags[min(len(lags) - 1, int(len(lags) * p))]
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+# ================= одно "обновление" =================
+
+SyncSession = sessionmaker(bind=create_engine(f"sqlite:///{DB_PATH}"))
+
+
+async def sync_update(user_id: int):
+    """То же, что делал обработчик до перехода на async: синхронные вызовы в корутине"""
+    s = SyncSession()
+    try:
+        s.query(UserSettings).filter_by(user_id=user_id).first()
+        task = Task(user_id=user_id, description="bench", category="short_5", deadline_day=date.today())
+        s.add(task)
+        s.commit()
+        s.query(Task).filter(Task.user_id == user_id, Task.deadline_day == date.today()).all()
+        task.is_completed = True
+        s.commit()
+    finally:
+        s.close()
+    await asyncio.sleep(0)
+
+
+async def async_update(user_id: int):
+    await database.get_user_settings(user_id)
+    task = await database.save_task(
+        Task(user_id=user_id, description="bench", category="short_5", deadline_day=date.today())
+    )
+    await database.get_tasks_for_day(user_id, date.today())
+    await database.mark_done(task.id, user_id)
+
+
+async def measure(name: str, update, updates: int, users: int) -> dict:
+    with LoopMonitor() as monitor:
+        start = time.perf_counter()
+        await asyncio.gather(*(update(i % users + 1) for i in range(updates)))
+        elapsed = time.perf_counter() - start
+    return {
+        "name": name,
+        "updates": updates,
+        "elapsed_s": round(elapsed, 3),
+        "blocked_per_update_ms": round(monitor.blocked / updates * 1000, 3),
+        "p99_lag_ms": round(monitor.percentile(0.99) * 1000, 3),
+        "max_lag_ms": round(monitor.percentile(1.0) * 1000, 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    await database.init_db()
+    for user_id in range(1, args.users + 1):
+        await database.upsert_user_settings(user_id, 3, dtime(9, 0))
+
+    for name, update in (("sync (до)", sync_update), ("async (после)", async_update)):
+        result = await measure(name, update, args.updates, args.users)
+        print(
+            f"{result['name']:>14}: {result['elapsed_s']} с всего, "
+            f"блокировка loop {result['blocked_per_update_ms']} мс/обновление, "
+            f"задержка других корутин p99 {result['p99_lag_ms']} мс, макс. {result['max_lag_ms']} мс"
+        )
+
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Проверка размера системных промптов из ai/prompts.py.
+Промпт отправляется с каждым запросом к LLM, поэтому его рост — это рост цены
+и времени до первого токена. Скрипт проверяет, что каждый промпт:
+- не больше бюджета (символы и грубая оценка токенов);
+- не зависит от момента сборки (побайтово одинаковый после перезагрузки модуля,
+  без сегодняшней даты и неподставленных {плейсхолдеров}) — иначе сломается кэш префикса.
+Код выхода 1, если что-то из этого нарушено.
+
+Запуск:
+    python -m benchmarks.prompt_budget
+"""
+import importlib
+import re
+import sys
+from datetime import date
+
+import ai.prompts
+
+# бюджет на каждый промпт, символы
+BUDGETS = {
+    "parse": 5500,
+    "edit": 5500,
+}
+
+# для русского текста в среднем ~3 символа на токен; точные числа — в логах ask_llm
+CHARS_PER_TOKEN = 3
+
+PLACEHOLDER_RE = re.compile(r"\{[a-z_]+\}")
+
+
+def check(name: str, prompt: str, reloaded: str) -> list[str]:
+    problems = []
+    budget = BUDGETS[name]
+    if len(prompt) > budget:
+        problems.append(f"{len(prompt)} символов при бюджете {budget}")
+    if prompt != reloaded:
+        problems.append("меняется между сборками")
+    if date.today().isoformat() in prompt:
+        problems.append("содержит сегодняшнюю дату")
+    placeholders = PLACEHOLDER_RE.findall(prompt)
+    if placeholders:
+        problems.append(f"неподставленные плейсхолдеры: {', '.join(placeholders)}")
+    return problems
+
+
+def main() -> int:
+    prompts = dict(ai.prompts.SYSTEM_PROMPTS)
+    reloaded = importlib.reload(ai.prompts).SYSTEM_PROMPTS
+
+    failed = False
+    for name, prompt in prompts.items():
+        problems = check(name, prompt, reloaded[name])
+        failed = failed or bool(problems)
+        status = "ПЛОХО" if problems else "OK "
+        print(
+            f"{status} {name}: {len(prompt)} символов, {len(prompt.encode())} байт, "
+            f"~{len(prompt) // CHARS_PER_TOKEN} токенов (бюджет {BUDGETS[name]} символов)"
+        )
+        for problem in problems:
+            print(f"      {problem}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
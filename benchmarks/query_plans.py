@@ -0,0 +1,148 @@
+"""
+Проверка планов запросов database.py: каждый запрос должен идти по индексу,
+а не сканировать всю таблицу. Функции database.py вызываются на временной
+SQLite-базе с данными, их SQL перехватывается и прогоняется через EXPLAIN QUERY PLAN.
+Код выхода 1, если какой-то запрос сканирует таблицу.
+
+Запуск:
+    python -m benchmarks.query_plans
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import date, datetime, time as dtime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "query_plans.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from sqlalchemy import event
+
+import database
+from models import Task, ShoppingItem
+
+# запросы, которым полный проход по таблице положен по смыслу
+ALLOWED_SCANS = {"get_all_users", "ensure_lease_partitions"}
+
+USERS = 50
+TASKS_PER_USER = 40
+
+
+async def seed():
+    await database.init_db()
+    today = date.today()
+    for user_id in range(1, USERS + 1):
+        await database.upsert_user_settings(user_id, 3, dtime(9, 0))
+        await database.save_tasks([
+            Task(
+                user_id=user_id,
+                description=f"задача {i}",
+                category=("short_5", "short_30", "short_120", "long")[i % 4],
+                deadline_day=today + timedelta(days=i % 10),
+                deadline_time=dtime(9 + i % 10, 0),
+                remind_date=today + timedelta(days=i % 10) if i % 3 == 0 else None,
+                remind_time=dtime(8, 0) if i % 3 == 0 else None,
+            )
+            for i in range(TASKS_PER_USER)
+        ])
+        await database.save_shopping_items([
+            ShoppingItem(user_id=user_id, item=f"товар {i}", category=("grocery", "pharmacy")[i % 2])
+            for i in range(10)
+        ])
+
+
+async def consume(generator):
+    return [row async for row in generator]
+
+
+def calls():
+    """(название, фабрика корутины) для каждой функции чтения/записи database.py"""
+    today = date.today()
+    now = datetime.utcnow()
+    return [
+        ("get_all_users", lambda: database.get_all_users()),
+        ("get_user_settings", lambda: database.get_user_settings(USERS + 1)),
+        ("get_tasks_for_day", lambda: database.get_tasks_for_day(7, today)),
+        ("get_tasks_for_day (страница)", lambda: database.get_tasks_for_day(7, today, offset=10, limit=11)),
+        ("get_tasks_week", lambda: database.get_tasks_week(7, today, today + timedelta(days=7))),
+        ("get_tasks_to_remind", lambda: database.get_tasks_to_remind(7)),
+        ("get_tasks_by_category", lambda: database.get_tasks_by_category(7, "short_5")),
+        ("get_item_by_category", lambda: database.get_item_by_category(7, "grocery")),
+        ("get_all_tasks", lambda: database.get_all_tasks(7, offset=0, limit=11)),
+        ("get_task_by_id", lambda: database.get_task_by_id(5)),
+        ("get_item_by_id", lambda: database.get_item_by_id(5)),
+        ("iter_due_reminders", lambda: consume(database.iter_due_reminders(now - timedelta(days=1), now + timedelta(days=1)))),
+        ("iter_due_digests", lambda: consume(database.iter_due_digests(now, now + timedelta(hours=1)))),
+        ("iter_due_reminders (партиции)", lambda: consume(database.iter_due_reminders(now - timedelta(days=1), now + timedelta(days=1), shard=(16, {1, 5})))),
+        ("iter_due_digests (партиции)", lambda: consume(database.iter_due_digests(now, now + timedelta(hours=1), shard=(16, {1, 5})))),
+        ("advance_digest", lambda: database.advance_digest(8, now)),
+        ("ensure_lease_partitions", lambda: database.ensure_lease_partitions(16)),
+        ("heartbeat_worker", lambda: database.heartbeat_worker("w1", now, now - timedelta(seconds=30))),
+        ("get_leases", lambda: database.get_leases(16)),
+        ("acquire_lease", lambda: database.acquire_lease(3, "w1", now, now + timedelta(seconds=30))),
+        ("save_checkpoint", lambda: database.save_checkpoint("w1", [3], now)),
+        ("release_leases", lambda: database.release_leases("w1", [3])),
+        ("claim_notification", lambda: database.claim_notification("remind", 5, 1, now)),
+        ("finish_notifications", lambda: database.finish_notifications([1], "sent")),
+        ("iter_pending_notifications", lambda: consume(database.iter_pending_notifications(now - timedelta(days=1), now, shard=(16, {1, 5})))),
+        ("iter_pending_notifications (с прошлого прохода)", lambda: consume(database.iter_pending_notifications(now - timedelta(days=1), now, shard=(16, {1, 5}), created_from=now - timedelta(minutes=1)))),
+        ("iter_changed_tasks", lambda: consume(database.iter_changed_tasks(now - timedelta(minutes=1), shard=(16, {1, 5})))),
+        ("iter_changed_settings", lambda: consume(database.iter_changed_settings(now - timedelta(minutes=1), shard=(16, {1, 5})))),
+        ("get_tasks_by_ids", lambda: database.get_tasks_by_ids([5, 6, 7])),
+        ("remove_worker", lambda: database.remove_worker("w1")),
+        ("update_task_fields", lambda: database.update_task_fields(10, 1, {"description": "новое"})),
+        ("mark_done", lambda: database.mark_done(11, 1)),
+        ("mark_bought", lambda: database.mark_bought(11, 2)),
+        ("delete_task", lambda: database.delete_task(12, 1)),
+        ("delete_item", lambda: database.delete_item(12, 2)),
+    ]
+
+
+def explain(conn: sqlite3.Connection, statement: str, params) -> list[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", params or ())]
+
+
+def is_full_scan(detail: str) -> bool:
+    # "SCAN tasks" — полный проход; "SCAN tasks USING INDEX ..." — проход по индексу ради ORDER BY
+    return detail.startswith("SCAN ") and "USING" not in detail
+
+
+async def main() -> int:
+    await seed()
+
+    captured = []
+    event.listen(
+        database.engine.sync_engine, "before_cursor_execute",
+        lambda conn, cursor, statement, params, context, many: captured.append((statement, params)),
+    )
+
+    conn = sqlite3.connect(DB_PATH)
+    failed = []
+    for name, call in calls():
+        captured.clear()
+        await call()
+        for statement, params in captured:
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            plan = explain(conn, statement, params)
+            scans = [d for d in plan if is_full_scan(d)]
+            ok = not scans or name in ALLOWED_SCANS
+            print(f"{'OK ' if ok else 'ПЛОХО'} {name}: {' | '.join(plan)}")
+            if not ok:
+                failed.append(name)
+
+    conn.close()
+    await database.engine.dispose()
+
+    if failed:
+        print(f"\nполный проход по таблице: {', '.join(sorted(set(failed)))}")
+        return 1
+    print("\nвсе запросы идут по индексам")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
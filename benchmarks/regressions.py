@@ -0,0 +1,119 @@
+"""
+Регрессионные проверки поведения, которое уже ломалось: без сети и токенов,
+на временной SQLite-базе. Каждая проверка — функция, бросающая AssertionError.
+Код выхода 1, если не прошла хотя бы одна.
+
+Запуск:
+    python -m benchmarks.regressions
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import traceback
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "regressions.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+
+from datetime import time
+
+import database
+from ai.errors import LLMBadResponse
+from database import settings_cache, get_user_settings, upsert_user_settings, save_task, get_tasks_by_ids
+from handlers.commands import entities_message
+from middlewares import DbSessionMiddleware
+from services.message_service import MessageService
+from models import Task, ShoppingItem
+from services.pager import MAX_MESSAGE_LENGTH
+
+# лимит Telegram на кнопки в одном сообщении
+MAX_BUTTONS = 100
+
+
+def _buttons(markup) -> int:
+    return sum(len(row) for row in markup.inline_keyboard)
+
+
+async def check_long_confirmation_fits_telegram():
+    """Подтверждение 60 добавленных задач и покупок: не больше 100 кнопок и 4096 символов"""
+    tasks = [Task(id=i, user_id=1, description="очень длинная задача " * 10, category="short_30") for i in range(1, 61)]
+    items = [ShoppingItem(id=i, user_id=1, item="товар с длинным названием " * 10, amount=2.0, unit="шт") for i in range(1, 61)]
+    for entities in (tasks, items):
+        text, markup = entities_message(entities)
+        assert len(text) <= MAX_MESSAGE_LENGTH, len(text)
+        assert _buttons(markup) <= MAX_BUTTONS, _buttons(markup)
+        assert text.endswith("…и еще 30"), text[-40:]
+
+
+async def check_failed_handler_keeps_settings_cache():
+    """Обработчик записал настройки и упал: в кэше остаются старые настройки, а не откатившиеся"""
+    user_id = 7
+    await upsert_user_settings(user_id, 3, time(9, 0))
+
+    async def failing(event, data):
+        await upsert_user_settings(user_id, 5, time(21, 0), session=data["session"])
+        raise RuntimeError("handler failed")
+
+    try:
+        await DbSessionMiddleware()(failing, None, {})
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("ошибка обработчика потерялась")
+
+    found, cached = settings_cache.get(user_id)
+    assert not found or cached.utc_offset == 3, cached.utc_offset
+    settings = await get_user_settings(user_id)
+    assert (settings.utc_offset, settings.notify_time) == (3, time(9, 0)), settings.utc_offset
+
+
+async def check_invalid_edit_is_not_not_found():
+    """Правка не по схеме — LLMBadResponse, а не "не нашел"; задача остается как была, в том числе при смене типа"""
+    task = await save_task(Task(user_id=8, description="купить цветы", category="short_30"))
+    for result in (
+        {"type": "tasks", "items": [{"task": "купить цветы", "category": "когда-нибудь"}]},
+        {"type": "shopping_list", "items": [{"category": "цветы"}]},
+    ):
+        try:
+            await MessageService.update_entity(task.id, "tasks", result, 8)
+        except LLMBadResponse:
+            pass
+        else:
+            raise AssertionError(f"нет ошибки для {result}")
+        saved = (await get_tasks_by_ids([task.id])).get(task.id)
+        assert saved is not None and saved.category == "short_30", saved
+
+
+CHECKS = [
+    check_long_confirmation_fits_telegram,
+    check_failed_handler_keeps_settings_cache,
+    check_invalid_edit_is_not_not_found,
+]
+
+
+async def main() -> int:
+    await database.init_db()
+    failed = []
+    for check in CHECKS:
+        try:
+            await check()
+        except Exception:
+            failed.append(check.__name__)
+            print(f"ПЛОХО {check.__name__}: {check.__doc__}")
+            traceback.print_exc()
+        else:
+            print(f"OK  {check.__name__}")
+    await database.engine.dispose()
+
+    if failed:
+        print(f"\nне прошли: {', '.join(failed)}")
+        return 1
+    print("\nвсе проверки прошли")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,125 @@
+"""
+Конкурентные чтение и запись в SQLite под каждым профилем из database.SQLITE_PROFILES.
+Писатели создают и закрывают задачи (как обработчики сообщений), читатели
+запрашивают задачи на день и напоминания (как списки и notification_loop).
+Для каждого профиля — своя новая БД, чтобы режим журнала не переходил между прогонами.
+
+Запуск:
+    python -m benchmarks.sqlite_profiles --seconds 5 --writers 4 --readers 8
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, time as dtime
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_main.db')}")
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import database
+from models import Base, Task
+
+USERS = 20
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def writer(sessions, user_id: int, deadline: float, stats: Stats):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with sessions() as s:
+                task = await database.save_task(
+                    Task(user_id=user_id, description="bench", category="short_5", deadline_day=date.today()),
+                    session=s,
+                )
+                await s.commit()
+                await database.mark_done(task.id, user_id, session=s)
+                await s.commit()
+        except OperationalError:
+            stats.errors += 1
+            continue
+        stats.latencies.append(time.perf_counter() - start)
+
+
+async def reader(sessions, user_id: int, deadline: float, stats: Stats):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with sessions() as s:
+                await database.get_tasks_for_day(user_id, date.today(), session=s)
+                await database.get_tasks_to_remind(user_id, session=s)
+        except OperationalError:
+            stats.errors += 1
+            continue
+        stats.latencies.append(time.perf_counter() - start)
+
+
+async def run_profile(profile: str, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), f"bench_{profile}.db")
+    engine = database.make_engine(f"sqlite:///{path}", profile)
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as s:
+        for user_id in range(1, USERS + 1):
+            await database.upsert_user_settings(user_id, 3, dtime(9, 0), session=s)
+        await s.commit()
+
+    report = await database.storage_report(engine, profile)
+    writes, reads = Stats(), Stats()
+    deadline = time.perf_counter() + args.seconds
+    await asyncio.gather(
+        *(writer(sessions, i % USERS + 1, deadline, writes) for i in range(args.writers)),
+        *(reader(sessions, i % USERS + 1, deadline, reads) for i in range(args.readers)),
+    )
+    await engine.dispose()
+
+    return {
+        "profile": profile,
+        "journal_mode": report.get("journal_mode"),
+        "synchronous": report.get("synchronous"),
+        "writes_per_s": round(len(writes.latencies) / args.seconds, 1),
+        "reads_per_s": round(len(reads.latencies) / args.seconds, 1),
+        "write_p99_ms": round(writes.percentile(0.99) * 1000, 2),
+        "read_p99_ms": round(reads.percentile(0.99) * 1000, 2),
+        "errors": writes.errors + reads.errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    args = parser.parse_args()
+
+    for profile in database.SQLITE_PROFILES:
+        r = await run_profile(profile, args)
+        print(
+            f"{r['profile']:>10} (journal={r['journal_mode']}, synchronous={r['synchronous']}): "
+            f"запись {r['writes_per_s']}/с, p99 {r['write_p99_ms']} мс; "
+            f"чтение {r['reads_per_s']}/с, p99 {r['read_p99_ms']} мс; ошибок {r['errors']}"
+        )
+
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,260 @@
+"""
+Офлайн-бенчмарк горячих путей бота: БД с N пользователями и M задачами/покупками,
+Bot и LLM подменены (benchmarks/fakes.py), сеть не нужна.
+Результат — JSON (среднее, p50, p99 в мс на каждый замер), его можно сохранить
+и сравнить с прогоном на другом коммите.
+
+Запуск:
+    python -m benchmarks.suite --users 200 --tasks 30 --items 10 --llm-latency 0.05 --output before.json
+    python -m benchmarks.suite ... --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, time as dtime
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_suite.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+# меряем обработку, а не ограничения Telegram и не кэш ответов LLM
+os.environ["SEND_GLOBAL_RATE"] = "1000000"
+os.environ["SEND_CHAT_RATE"] = "1000000"
+os.environ["SEND_CHAT_BURST"] = "1000000"
+os.environ["LLM_CACHE_ENABLED"] = "0"
+
+import database
+import notifications
+from ai.ai_client import llm_flights, parse_text
+from database import user_tz
+from handlers.commands import new_task, handle_reply
+from middlewares import DbSessionMiddleware
+from models import Task, ShoppingItem
+from services.formater import Formater
+from services.parser import Parser
+from services.task_service import TaskService
+
+from benchmarks.fakes import FakeBot, install_fake_llm, make_message
+
+
+# ================= данные =================
+
+async def seed(users: int, tasks: int, items: int):
+    """users пользователей, у каждого tasks задач на ближайшие дни и items покупок"""
+    await database.init_db()
+    today = date.today()
+    now = datetime.utcnow()
+    for user_id in range(1, users + 1):
+        # ежедневное уведомление — через минуту по местному времени пользователя
+        notify_at = (now + timedelta(hours=3, minutes=1)).time().replace(second=0, microsecond=0)
+        await database.upsert_user_settings(user_id, 3, notify_at)
+        local_now = datetime.now(user_tz(await database.get_user_settings(user_id)))
+        await database.save_tasks([
+            Task(
+                user_id=user_id,
+                description=f"задача {i} пользователя {user_id}",
+                category=("short_5", "short_30", "short_120", "long")[i % 4],
+                deadline_day=today + timedelta(days=i % 7),
+                deadline_time=dtime(8 + i % 12, 0),
+                # каждая пятая задача — с напоминанием, которое уже наступило
+                remind_date=local_now.date() if i % 5 == 0 else None,
+                remind_time=(local_now - timedelta(minutes=1)).time() if i % 5 == 0 else None,
+            )
+            for i in range(tasks)
+        ])
+        await database.save_shopping_items([
+            ShoppingItem(user_id=user_id, item=f"товар {i}", category="grocery", amount=1.0, unit="шт")
+            for i in range(items)
+        ])
+
+
+# ================= замеры =================
+
+def summary(durations: list[float]) -> dict:
+    values = sorted(durations)
+    return {
+        "n": len(values),
+        "mean_ms": round(statistics.fmean(values) * 1000, 4),
+        "p50_ms": round(values[len(values) // 2] * 1000, 4),
+        "p99_ms": round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 4),
+    }
+
+
+async def timed(call, repeat: int) -> dict:
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await call(i)
+        durations.append(time.perf_counter() - start)
+    return summary(durations)
+
+
+def timed_sync(call, repeat: int) -> dict:
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        call(i)
+        durations.append(time.perf_counter() - start)
+    return summary(durations)
+
+
+async def run_handler(handler, message):
+    """Обработчик целиком, с сессией от DbSessionMiddleware, как в боте"""
+    await DbSessionMiddleware()(lambda event, data: handler(event, data["session"]), message, {})
+
+
+async def bench_notifications(bot: FakeBot) -> dict:
+    """Загрузка окна при старте и один тик цикла со всеми наступившими событиями"""
+    scheduler = notifications.ReminderScheduler(bot=bot)
+
+    start = time.perf_counter()
+    await scheduler.load()
+    load_s = time.perf_counter() - start
+    loaded = len(scheduler)
+
+    due_at = datetime.utcnow() + timedelta(minutes=2)
+    start = time.perf_counter()
+    sent_before = len(bot.calls)
+    due = scheduler._pop_due(due_at)
+    await scheduler._fire_due(due)
+    # ждем, пока очередь отправки разошлет все
+    await notifications.send_queue.drain(60)
+    tick_s = time.perf_counter() - start
+
+    return {
+        "notifications_load": {"n": loaded, "total_ms": round(load_s * 1000, 3)},
+        "notifications_tick": {
+            "n": len(due),
+            "total_ms": round(tick_s * 1000, 3),
+            "per_event_ms": round(tick_s / max(len(due), 1) * 1000, 4),
+            # уведомления одного пользователя склеиваются в одно сообщение
+            "messages": len(bot.calls) - sent_before,
+        },
+    }
+
+
+async def bench_single_flight(concurrency: int) -> dict:
+    """Одинаковые запросы одновременно (двойное нажатие) — в LLM должен уйти один"""
+    leaders, collapsed = llm_flights.leaders, llm_flights.collapsed
+    start = time.perf_counter()
+    await asyncio.gather(*(parse_text("купить хлеб", "Понедельник (Monday), 2024-01-01 10:00") for _ in range(concurrency)))
+    return {
+        "n": concurrency,
+        "total_ms": round((time.perf_counter() - start) * 1000, 3),
+        "llm_requests": llm_flights.leaders - leaders,
+        "collapsed": llm_flights.collapsed - collapsed,
+    }
+
+
+async def run(args) -> dict:
+    await seed(args.users, args.tasks, args.items)
+
+    bot = FakeBot()
+    install_fake_llm(args.llm_latency)
+
+    users = args.users
+    sample_task = await database.get_task_by_id(1)
+    sample_text = Formater.format_task(sample_task, make_task=True)
+
+    results = {}
+    results.update(await bench_notifications(bot))
+    results["get_day_tasks"] = await timed(
+        lambda i: TaskService.get_day_tasks(i % users + 1, 0), args.repeat
+    )
+    results["get_week_task"] = await timed(
+        lambda i: TaskService.get_week_task(i % users + 1), args.repeat
+    )
+    results["format_task"] = timed_sync(
+        lambda i: Formater.format_task(sample_task, make_task=True), args.repeat * 10
+    )
+    results["format_short_task"] = timed_sync(
+        lambda i: Formater.format_short_task(sample_task, is_day=True), args.repeat * 10
+    )
+    results["get_id_info"] = timed_sync(
+        lambda i: Parser.get_id_info(sample_text), args.repeat * 10
+    )
+    results["new_task_llm"] = await timed(
+        lambda i: run_handler(new_task, make_message(i % users + 1, f"купить молоко {i}", bot)),
+        args.repeat,
+    )
+    results["new_task_fast_path"] = await timed(
+        lambda i: run_handler(new_task, make_message(i % users + 1, "созвон завтра в 10:30", bot)),
+        args.repeat,
+    )
+
+    # карточки задач, на которые отвечает пользователь, готовим заранее
+    replies = []
+    for i in range(args.repeat):
+        user_id = i % users + 1
+        task = (await database.get_all_tasks(user_id, offset=0, limit=1))[0]
+        card = make_message(user_id, Formater.format_task(task, make_task=True), bot)
+        replies.append(make_message(user_id, "перенеси на 19:00", bot, reply_to=card))
+
+    results["handle_reply"] = await timed(lambda i: run_handler(handle_reply, replies[i]), args.repeat)
+    results["single_flight"] = await bench_single_flight(20)
+
+    await database.engine.dispose()
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "params": vars(args) | {"output": None, "compare": None},
+        "telegram_calls": dict(Counter(type(c).__name__ for c in bot.calls)),
+        "results": results,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict):
+    """Изменение mean/total относительно сохраненного прогона"""
+    print(f"\nсравнение с {baseline.get('commit')}:", file=sys.stderr)
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        key = "mean_ms" if "mean_ms" in result else "total_ms"
+        if old.get(key):
+            change = (result[key] - old[key]) / old[key] * 100
+            print(f"  {name:>20}: {old[key]} -> {result[key]} мс ({change:+.1f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="задержка фейкового LLM, секунды")
+    parser.add_argument("--output", help="куда сохранить JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    data = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(data)
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
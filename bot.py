@@ -8,11 +8,18 @@ import logging
 
 from aiogram import Bot, Dispatcher
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, METRICS_HOST, METRICS_PORT, BOT_MODE, SHUTDOWN_TIMEOUT, NOTIFICATIONS_ENABLED,
+)
 from database import init_db
 from handlers.commands import router as commands_router
 from handlers.callbacks import router as callbacks_router
-from notifications import notification_loop
+from notifications import notification_loop, scheduler
+from middlewares import DbSessionMiddleware, HandlerMetricsMiddleware, InFlightMiddleware, TelegramMetricsMiddleware
+from send_queue import send_queue
+from webhook import run_webhook
+from metrics import start_metrics_server
+from ai.ai_client import close_llm_client
 
 from logging_conf import setup_logging
 
@@ -21,8 +28,21 @@ logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
 bot = Bot(token=BOT_TOKEN)
+bot.session.middleware(TelegramMetricsMiddleware())
 dp = Dispatcher()
 
+# Сколько обновлений сейчас в обработке (для корректной остановки)
+in_flight = InFlightMiddleware()
+dp.update.outer_middleware(in_flight)
+
+# Одна сессия БД на каждое обновление
+dp.update.outer_middleware(DbSessionMiddleware())
+
+# Длительность каждого обработчика
+for router in (commands_router, callbacks_router):
+    router.message.middleware(HandlerMetricsMiddleware())
+    router.callback_query.middleware(HandlerMetricsMiddleware())
+
 # Регистрация роутеров обработчиков
 dp.include_router(commands_router)
 dp.include_router(callbacks_router)
@@ -34,15 +54,46 @@ async def main():
     setup_logging()
     logger.info("Бот начал работу")
     # Инициализация БД
-    init_db()
+    await init_db()
+
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError:
+            logger.exception("не удалось запустить сервер метрик, работаем без него")
     
     # Запуск цикла уведомлений
-    asyncio.create_task(notification_loop())
-    logger.info("Notification loop started")
-    
-    # Запуск polling
-    logger.info("Bot started polling")
-    await dp.start_polling(bot)
+    notify_task = None
+    if NOTIFICATIONS_ENABLED:
+        notify_task = asyncio.create_task(notification_loop(bot))
+        logger.info("Notification loop started")
+
+    async def shutdown():
+        """Дождаться обработчиков, текущего прохода уведомлений и отправки очереди"""
+        if notify_task:
+            scheduler.stop()
+            try:
+                await asyncio.wait_for(notify_task, SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("цикл уведомлений не остановился вовремя")
+        if not await in_flight.wait_idle(SHUTDOWN_TIMEOUT):
+            logger.warning(f"не дождались {in_flight.count} обработчиков")
+        if not await send_queue.drain(SHUTDOWN_TIMEOUT):
+            logger.warning(f"не отправлено сообщений: {send_queue.qsize()}")
+
+    try:
+        if BOT_MODE == "webhook":
+            logger.info("Bot started webhook")
+            await run_webhook(bot, dp, in_flight, shutdown, SHUTDOWN_TIMEOUT)
+        else:
+            logger.info("Bot started polling")
+            await dp.start_polling(bot)
+            await shutdown()
+    finally:
+        await close_llm_client()
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
@@ -8,8 +8,104 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///tasks.db")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
+# профиль SQLite: production — WAL, synchronous=NORMAL и т.д., default — настройки SQLite по умолчанию
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # сколько ждать блокировку записи
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))  # кэш страниц на соединение
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "128"))
+# пул соединений с БД
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+
+# настройки клиента LLM
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # секунды на один запрос
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))  # одновременных запросов
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))  # размер пула соединений
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))  # секунды жизни keep-alive
+
+# модели по порядку: при недоступности первой запрос уходит следующей
+LLM_MODELS = [m.strip() for m in os.getenv("LLM_MODELS", "google/gemini-2.0-flash-lite-001").split(",") if m.strip()]
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))  # секунды на весь вызов со всеми повторами
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))  # попыток на одну модель
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # пауза перед повтором: случайная до base * 2^n
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# circuit breaker: после стольких ошибок подряд модель не вызывается LLM_BREAKER_RESET_SECONDS
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# дублирующий запрос, если ответа нет дольше этого перцентиля задержки (0 — выключено)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+
+# ответ LLM на новое сообщение читается потоком: элементы сохраняются и показываются по одному
+LLM_STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "1") == "1"
+# не чаще одного редактирования сообщения со списком в столько секунд
+LLM_STREAM_EDIT_INTERVAL = float(os.getenv("LLM_STREAM_EDIT_INTERVAL", "1"))
+
+# кэш ответов LLM (SQLite-файл, переживает перезапуск)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "24"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# за сколько минут назад досылать пропущенные уведомления (после перезапуска/задержки)
+NOTIFY_CATCHUP_MINUTES = int(os.getenv("NOTIFY_CATCHUP_MINUTES", "10"))
+# на сколько минут вперед планировщик подгружает уведомления из БД
+NOTIFY_HORIZON_MINUTES = int(os.getenv("NOTIFY_HORIZON_MINUTES", "60"))
+# пользователи делятся между воркерами уведомлений на партиции по user_id % NOTIFY_PARTITIONS
+# (одинаковое значение во всех процессах)
+NOTIFY_PARTITIONS = int(os.getenv("NOTIFY_PARTITIONS", "16"))
+# аренда партиции: сколько живет без продления и как часто продлевается
+NOTIFY_LEASE_TTL_SECONDS = float(os.getenv("NOTIFY_LEASE_TTL_SECONDS", "30"))
+NOTIFY_LEASE_RENEW_SECONDS = float(os.getenv("NOTIFY_LEASE_RENEW_SECONDS", "10"))
+# после перезапуска или перехода партиции досылать пропущенное не дальше чем за столько часов
+NOTIFY_REPLAY_HOURS = float(os.getenv("NOTIFY_REPLAY_HOURS", "24"))
+# как часто перечитывать окно из БД (задачи могли измениться в другом процессе), 0 — не перечитывать
+NOTIFY_REFRESH_SECONDS = float(os.getenv("NOTIFY_REFRESH_SECONDS", "15"))
+
+# сколько настроек пользователей держать в памяти
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", "10000"))
+# сколько секунд доверять кэшу: настройки могли поменять в другом процессе (бот, воркер уведомлений)
+SETTINGS_CACHE_TTL_SECONDS = float(os.getenv("SETTINGS_CACHE_TTL_SECONDS", "30"))
+
+# ограничения скорости отправки в Telegram (сообщений в секунду)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))  # сколько можно отправить в чат разом
+
+# сколько строк в одной странице списка задач/покупок
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "10"))
+
+# простые сообщения ("купить хлеб в 18") разбираются правилами, без LLM
+FAST_PARSER_ENABLED = os.getenv("FAST_PARSER_ENABLED", "1") == "1"
+
+# метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# публичный адрес за reverse proxy, например https://bot.example.com (путь добавится сам)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# секрет из заголовка X-Telegram-Bot-Api-Secret-Token, обязателен в режиме webhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# сколько секунд при остановке ждать обработчики, уведомления и очередь отправки
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+# цикл уведомлений в этом процессе (можно вынести в отдельные python worker.py)
+NOTIFICATIONS_ENABLED = os.getenv("NOTIFICATIONS_ENABLED", "1") == "1"
+
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set in environment")
 
 if not OPENROUTER_API_KEY:
     raise RuntimeError("OPENROUTER_API_KEY is not set in environment")
+
+if not LLM_MODELS:
+    raise RuntimeError("LLM_MODELS is empty")
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise RuntimeError(f"BOT_MODE must be polling or webhook, got {BOT_MODE}")
+
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise RuntimeError("WEBHOOK_SECRET is not set in environment (required for BOT_MODE=webhook)")
@@ -1,225 +1,808 @@
-from datetime import date, time
-from typing import List
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, time, datetime, timedelta, timezone, tzinfo
+from time import monotonic
+from typing import AsyncIterator, Collection, List, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, event, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+
+from config import (
+    DB_URL, SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL_SECONDS, SQLITE_PROFILE, SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE_MB, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+)
+from models import (
+    Base, Task, UserSettings, ShoppingItem, NotificationLease, NotificationWorker,
+    SentNotification, SENT_PENDING,
+)
+import migrations
+from migrations import BACKFILL_SCHEDULE
+from metrics import timed_query
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def make_async_url(url: str) -> str:
+    """Подставить асинхронный драйвер в DATABASE_URL (sqlite -> aiosqlite, postgres -> asyncpg)"""
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme:
+        # драйвер уже указан явно
+        return url
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if scheme in ("postgres", "postgresql"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+# PRAGMA для каждого нового соединения SQLite
+SQLITE_PROFILES = {
+    "default": {},
+    "production": {
+        # читатели не ждут писателя, писатель не ждет читателей
+        "journal_mode": "WAL",
+        # в WAL безопасно: при сбое питания теряется только последняя транзакция, но не целостность
+        "synchronous": "NORMAL",
+        # ждать блокировку записи, а не сразу падать с "database is locked"
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+        # отрицательное значение — размер в КиБ
+        "cache_size": -SQLITE_CACHE_SIZE_KB,
+        "mmap_size": SQLITE_MMAP_SIZE_MB * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def make_engine(url: str, profile: str = SQLITE_PROFILE) -> AsyncEngine:
+    """Движок БД: для SQLite применяет PRAGMA профиля к каждому соединению"""
+    url = make_async_url(url)
+    kwargs = {}
+    is_sqlite = url.startswith("sqlite")
+    if not (is_sqlite and ":memory:" in url):
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=not is_sqlite)
+    new_engine = create_async_engine(url, echo=False, **kwargs)
+
+    if is_sqlite:
+        if profile not in SQLITE_PROFILES:
+            raise ValueError(f"неизвестный профиль SQLite: {profile}")
+        pragmas = SQLITE_PROFILES[profile]
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return new_engine
+
+
+async def storage_report(db_engine: AsyncEngine | None = None, profile: str = SQLITE_PROFILE) -> dict:
+    """Фактические настройки хранилища (для лога при запуске и бенчмарка)"""
+    db_engine = db_engine or engine
+    report = {
+        "driver": db_engine.dialect.driver,
+        "pool": type(db_engine.pool).__name__,
+        "pool_size": getattr(db_engine.pool, "size", lambda: None)(),
+    }
+    if db_engine.dialect.name == "sqlite":
+        report["profile"] = profile
+        async with db_engine.connect() as conn:
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "temp_store"):
+                report[name] = (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+    return report
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-
-from config import DB_URL
-from models import Base, Task, UserSettings, ShoppingItem
 
 # инициализация БД
-engine = create_engine(DB_URL, echo=False)
-SessionLocal = sessionmaker(bind=engine)
+engine = make_engine(DB_URL)
+# объекты остаются доступны после commit, сессия закрывается сразу после запроса
+SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+# через сколько строк отдавать результат потоковых запросов
+STREAM_CHUNK_SIZE = 500
 
 
-def init_db():
-    """Создание таблиц при запуске"""
-    Base.metadata.create_all(bind=engine)
+async def init_db():
+    """Создание таблиц и миграции при запуске"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        applied = await conn.run_sync(migrations.upgrade)
+    if applied:
+        logger.info(f"применены миграции: {applied}")
+    logger.info(f"хранилище: {await storage_report()}")
 
+    if BACKFILL_SCHEDULE & set(applied):
+        async with get_session() as s:
+            now = datetime.utcnow()
+            for settings in (await s.scalars(select(UserSettings))).all():
+                await _refresh_user_schedule(s, settings, now)
+            await s.commit()
 
-def get_session() -> Session:
+
+def get_session() -> AsyncSession:
     """Получение сессии БД"""
     return SessionLocal()
 
 
+@asynccontextmanager
+async def session_scope(session: AsyncSession | None = None) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для CRUD-функции.
+    Если передана сессия обновления (DbSessionMiddleware) — работаем в ней,
+    коммит сделает middleware в конце обновления. Иначе открываем свою и коммитим сразу.
+    """
+    if session is not None:
+        yield session
+        return
+    async with get_session() as s:
+        try:
+            yield s
+            await s.commit()
+        except BaseException:
+            # явный откат: close() не вызывает after_rollback и кэш настроек не сбросится
+            await s.rollback()
+            raise
+
+
+class SettingsCache:
+    """
+    LRU-кэш настроек пользователей в памяти.
+    Настройки меняются редко, а читаются на каждое сообщение.
+    upsert_user_settings обновляет кэш сразу (write-through).
+    Запись живет ttl секунд: процессов несколько (боты, воркеры уведомлений),
+    изменение в одном из них остальные увидят не позже чем через ttl.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # user_id -> (monotonic-время, до которого запись верна, настройки)
+        self._data: OrderedDict[int, tuple[float, UserSettings | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # растет при каждой записи: чтение из БД, начатое до записи, не должно затереть новое значение
+        self.version = 0
+
+    def get(self, user_id: int) -> tuple[bool, UserSettings | None]:
+        """(есть ли в кэше, настройки); None тоже кэшируется — у пользователя нет настроек"""
+        entry = self._data.get(user_id)
+        if entry is not None:
+            expires_at, settings = entry
+            if expires_at > monotonic():
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return True, settings
+            del self._data[user_id]
+        self.misses += 1
+        return False, None
+
+    def fill(self, user_id: int, settings: UserSettings | None, version: int):
+        """Положить прочитанное из БД, если с начала чтения никто не записывал"""
+        if version == self.version:
+            self._store(user_id, settings)
+
+    def put(self, user_id: int, settings: UserSettings | None):
+        """Запись (write-through)"""
+        self.version += 1
+        self._store(user_id, settings)
+
+    def _store(self, user_id: int, settings: UserSettings | None):
+        self._data[user_id] = (
+            monotonic() + self.ttl,
+            _detached_copy(settings) if settings else None,
+        )
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self.version += 1
+        self._data.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def _detached_copy(settings: UserSettings) -> UserSettings:
+    """Копия без привязки к сессии: кэш не должен зависеть от чужих транзакций"""
+    return UserSettings(
+        user_id=settings.user_id,
+        utc_offset=settings.utc_offset,
+        notify_time=settings.notify_time,
+        timezone=settings.timezone,
+        next_digest_utc=settings.next_digest_utc,
+    )
+
+
+settings_cache = SettingsCache(SETTINGS_CACHE_SIZE, SETTINGS_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_cached_writes(session: Session):
+    session.info.pop("cached_settings", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_uncommitted_settings(session: Session):
+    """Транзакция откатилась — записанные в кэш настройки больше не верны"""
+    for user_id in session.info.pop("cached_settings", ()):
+        settings_cache.invalidate(user_id)
+
+
+def user_tz(settings: UserSettings | None) -> tzinfo:
+    """Часовой пояс пользователя: IANA, если задан, иначе фиксированный сдвиг"""
+    if not settings:
+        return timezone.utc
+    if settings.timezone:
+        return ZoneInfo(settings.timezone)
+    return timezone(timedelta(hours=settings.utc_offset))
+
+
+def local_to_utc(day: date, at: time, tz: tzinfo) -> datetime:
+    """Перевод локальных даты и времени пользователя в наивный UTC"""
+    local = datetime.combine(day, at, tzinfo=tz)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_to_local(moment: datetime, tz: tzinfo) -> datetime:
+    """Перевод наивного UTC в локальное время пользователя"""
+    return moment.replace(tzinfo=timezone.utc).astimezone(tz)
+
+
+def next_digest_at(settings: UserSettings, after: datetime) -> datetime:
+    """Ближайший момент ежедневного уведомления (UTC) не раньше after"""
+    tz = user_tz(settings)
+    local_day = utc_to_local(after, tz).date()
+    fire_at = local_to_utc(local_day, settings.notify_time, tz)
+    if fire_at < after:
+        # считаем заново, а не +24 часа: на переходе на летнее время сутки короче
+        fire_at = local_to_utc(local_day + timedelta(days=1), settings.notify_time, tz)
+    return fire_at
+
+
+def remind_at(task: Task, settings: UserSettings) -> datetime | None:
+    """Момент напоминания по задаче (UTC)"""
+    if not task.remind_date:
+        return None
+    at = task.remind_time if task.remind_time else settings.notify_time
+    return local_to_utc(task.remind_date, at, user_tz(settings))
+
+
+async def _refresh_user_schedule(s: AsyncSession, settings: UserSettings, now: datetime):
+    """Пересчитать UTC-моменты уведомлений пользователя после смены настроек"""
+    settings.next_digest_utc = next_digest_at(settings, now)
+    tasks = await s.scalars(select(Task).filter(
+        Task.user_id == settings.user_id,
+        Task.is_completed == False,
+        Task.remind_date.isnot(None)
+    ))
+    for task in tasks.all():
+        task.remind_at_utc = remind_at(task, settings)
+
+
 # ================= CRUD операции =================
-def get_all_users() -> UserSettings | None:
-    s=get_session()
-    try:
-        return s.query(UserSettings).all()
-    finally:
-        s.close()
-
-def get_user_settings(user_id: int) -> UserSettings | None:
+@timed_query
+async def get_all_users(session: AsyncSession | None = None) -> List[UserSettings]:
+    async with session_scope(session) as s:
+        return (await s.scalars(select(UserSettings))).all()
+
+@timed_query
+async def get_user_settings(user_id: int, session: AsyncSession | None = None) -> UserSettings | None:
     """Получение настроек пользователя"""
-    s = get_session()
-    try:
-        return s.query(UserSettings).filter_by(user_id=user_id).first()
-    finally:
-        s.close()
+    found, settings = settings_cache.get(user_id)
+    if found:
+        return settings
+    version = settings_cache.version
+    async with session_scope(session) as s:
+        settings = await s.scalar(select(UserSettings).filter_by(user_id=user_id))
+    settings_cache.fill(user_id, settings, version)
+    return settings
 
 
 
 
-def upsert_user_settings(user_id: int, utc_offset: int, notify_time: time):
+@timed_query
+async def upsert_user_settings(user_id: int, utc_offset: int, notify_time: time, tz_name: str | None = None, session: AsyncSession | None = None):
     """Обновление/создание настроек пользователя"""
-    s = get_session()
-    try:
-        settings = s.query(UserSettings).filter_by(user_id=user_id).first()
+    async with session_scope(session) as s:
+        settings = await s.scalar(select(UserSettings).filter_by(user_id=user_id))
         if settings:
             settings.utc_offset = utc_offset
             settings.notify_time = notify_time
+            settings.timezone = tz_name
         else:
-            s.add(UserSettings(
+            settings = UserSettings(
                 user_id=user_id,
                 utc_offset=utc_offset,
-                notify_time=notify_time
-            ))
-        s.commit()
-    finally:
-        s.close()
-
-
-def save_task(task: Task) -> Task:
+                notify_time=notify_time,
+                timezone=tz_name
+            )
+            s.add(settings)
+        await _refresh_user_schedule(s, settings, datetime.utcnow())
+        await s.flush()
+
+        # write-through: кэш сразу видит новые настройки, при откате транзакции они сбросятся
+        settings_cache.put(user_id, settings)
+        s.sync_session.info.setdefault("cached_settings", set()).add(user_id)
+
+
+@timed_query
+async def advance_digest(user_id: int, fired_at: datetime, session: AsyncSession | None = None) -> datetime | None:
+    """Сдвинуть ежедневное уведомление на следующий день после отправки"""
+    async with session_scope(session) as s:
+        settings = await s.scalar(select(UserSettings).filter_by(user_id=user_id))
+        if not settings:
+            return None
+        settings.next_digest_utc = next_digest_at(settings, fired_at + timedelta(minutes=1))
+        await s.flush()
+        settings_cache.put(user_id, settings)
+        s.sync_session.info.setdefault("cached_settings", set()).add(user_id)
+        return settings.next_digest_utc
+
+
+@timed_query
+async def save_task(task: Task, session: AsyncSession | None = None) -> Task:
     """Сохранение задачи"""
-    s = get_session()
-    try:
+    async with session_scope(session) as s:
+        settings = await s.scalar(select(UserSettings).filter_by(user_id=task.user_id))
+        task.remind_at_utc = remind_at(task, settings) if settings else None
         s.add(task)
-        s.commit()
-        s.refresh(task)
+        await s.flush()
         return task
-    finally:
-        s.close()
 
-def save_shopping_item(shopping_item: ShoppingItem) -> ShoppingItem:
+@timed_query
+async def save_shopping_item(shopping_item: ShoppingItem, session: AsyncSession | None = None) -> ShoppingItem:
     """сохранение покупки"""
-    s = get_session()
-    try:
+    async with session_scope(session) as s:
         s.add(shopping_item)
-        s.commit()
-        s.refresh(shopping_item)
+        await s.flush()
         return shopping_item
-    finally:
-        s.close()
-
 
-
-def get_tasks_for_day(user_id: int, day: date) -> List[Task]:
+# поля, которые заполняются при создании (остальные берут значения по умолчанию)
+TASK_INSERT_FIELDS = (
+    "user_id", "description", "category",
+    "deadline_day", "deadline_time", "remind_date", "remind_time", "remind_at_utc",
+)
+ITEM_INSERT_FIELDS = ("user_id", "item", "category", "amount", "unit")
+
+
+async def _bulk_insert(s: AsyncSession, model, objects: list, fields: tuple) -> list:
+    """
+    Один INSERT ... VALUES (...), (...) RETURNING на все строки.
+    Обычный add_all + flush на SQLite вставляет по строке, чтобы сохранить порядок RETURNING,
+    поэтому вставляем напрямую и сортируем результат по id (он растет в порядке VALUES).
+    """
+    rows = [{field: getattr(obj, field) for field in fields} for obj in objects]
+    # render_nulls: строки с разными пустыми полями не разбиваются на несколько INSERT
+    saved = (await s.scalars(
+        insert(model).returning(model), rows, execution_options={"render_nulls": True}
+    )).all()
+    return sorted(saved, key=lambda obj: obj.id)
+
+
+@timed_query
+async def save_tasks(tasks: List[Task], session: AsyncSession | None = None) -> List[Task]:
+    """Сохранение нескольких задач одного пользователя одним INSERT"""
+    if not tasks:
+        return []
+    async with session_scope(session) as s:
+        settings = await s.scalar(select(UserSettings).filter_by(user_id=tasks[0].user_id))
+        for task in tasks:
+            task.remind_at_utc = remind_at(task, settings) if settings else None
+        return await _bulk_insert(s, Task, tasks, TASK_INSERT_FIELDS)
+
+@timed_query
+async def save_shopping_items(items: List[ShoppingItem], session: AsyncSession | None = None) -> List[ShoppingItem]:
+    """Сохранение нескольких покупок одним INSERT"""
+    if not items:
+        return []
+    async with session_scope(session) as s:
+        return await _bulk_insert(s, ShoppingItem, items, ITEM_INSERT_FIELDS)
+
+
+
+def _page(query, offset: int, limit: int | None):
+    """Одна страница списка: LIMIT/OFFSET выполняются в БД"""
+    if limit is not None:
+        query = query.offset(offset).limit(limit)
+    return query
+
+
+@timed_query
+async def get_tasks_for_day(user_id: int, day: date, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None) -> List[Task]:
     """Получение задач на указаный день"""
-    s = get_session()
-    try:
-        return s.query(Task).filter(
+    async with session_scope(session) as s:
+        return (await s.scalars(_page(select(Task).filter(
             Task.user_id == user_id,
             Task.deadline_day == day,
             Task.is_completed == False
-        ).order_by(Task.deadline_time).all()
-    finally:
-        s.close()
+        ).order_by(Task.deadline_time, Task.id), offset, limit))).all()
 
 
-def get_tasks_week(user_id: int, start: date, end: date) -> List[Task]:
+@timed_query
+async def get_tasks_week(user_id: int, start: date, end: date, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None) -> List[Task]:
     """Получение задач на неделю"""
-    s = get_session()
-    try:
-        return s.query(Task).filter(
+    async with session_scope(session) as s:
+        return (await s.scalars(_page(select(Task).filter(
             Task.user_id == user_id,
             Task.deadline_day >= start,
             Task.deadline_day <= end,
             Task.is_completed == False
-        ).order_by(Task.deadline_day).all()
-    finally:
-        s.close()
-
-def get_tasks_to_remind(user_id: int) -> List[Task]:
-    s = get_session()
-    try:
-        return s.query(Task).filter(
+        ).order_by(Task.deadline_day, Task.deadline_time, Task.id), offset, limit))).all()
+
+@timed_query
+async def get_tasks_to_remind(user_id: int, session: AsyncSession | None = None) -> List[Task]:
+    async with session_scope(session) as s:
+        return (await s.scalars(select(Task).filter(
                     Task.user_id == user_id,
                     Task.is_completed == False,
                     Task.remind_date.isnot(None)  # Напоминание установлено
-                ).all()
-    finally:
-        s.close()
-
-
-def get_tasks_by_category(user_id: int, category: str) -> List[Task]:
-    s = get_session()
-    try:
-        return s.query(Task).filter(
+                ))).all()
+
+
+def _in_shard(user_id_column, shard: Tuple[int, Collection[int]]):
+    partitions, owned = shard
+    return (user_id_column % partitions).in_(sorted(owned))
+
+
+@timed_query
+async def iter_due_reminders(start: datetime, end: datetime, shard: Tuple[int, Collection[int]] | None = None) -> AsyncIterator[Tuple[UserSettings, Task, datetime]]:
+    """
+    Все напоминания, которые срабатывают в окне [start, end) по UTC.
+    Один запрос по индексу remind_at_utc, результат читается порциями.
+    shard=(N, партиции) — только пользователи с user_id % N из партиций.
+    Отдает (настройки, задача, момент срабатывания).
+    """
+    async with get_session() as s:
+        query = select(UserSettings, Task).join(
+            Task, Task.user_id == UserSettings.user_id
+        ).filter(
+            Task.remind_at_utc >= start,
+            Task.remind_at_utc < end,
+            Task.is_completed == False,
+        ).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        if shard is not None:
+            query = query.filter(_in_shard(UserSettings.user_id, shard))
+
+        async for settings, task in await s.stream(query):
+            yield settings, task, task.remind_at_utc
+
+
+@timed_query
+async def iter_due_digests(start: datetime, end: datetime, shard: Tuple[int, Collection[int]] | None = None) -> AsyncIterator[Tuple[UserSettings, datetime]]:
+    """
+    Все пользователи, у которых ежедневное уведомление попадает в окно [start, end) по UTC.
+    Запрос по индексу next_digest_utc; устаревшие значения (бот был выключен)
+    пересчитываются от start. Отдает (настройки, момент срабатывания), читает порциями.
+    """
+    async with get_session() as s:
+        query = select(UserSettings).filter(
+            UserSettings.next_digest_utc < end
+        ).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        if shard is not None:
+            query = query.filter(_in_shard(UserSettings.user_id, shard))
+
+        async for settings in await s.stream_scalars(query):
+            fire_at = settings.next_digest_utc
+            if fire_at < start:
+                fire_at = next_digest_at(settings, start)
+            if fire_at < end:
+                yield settings, fire_at
+
+
+@timed_query
+async def iter_changed_tasks(since: datetime, shard: Tuple[int, Collection[int]] | None = None) -> AsyncIterator[Task]:
+    """Задачи, измененные с since (по индексу updated_at), читает порциями"""
+    async with get_session() as s:
+        query = select(Task).filter(Task.updated_at >= since).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        if shard is not None:
+            query = query.filter(_in_shard(Task.user_id, shard))
+
+        async for task in await s.stream_scalars(query):
+            yield task
+
+
+@timed_query
+async def iter_changed_settings(since: datetime, shard: Tuple[int, Collection[int]] | None = None) -> AsyncIterator[UserSettings]:
+    """Настройки пользователей, измененные с since (по индексу updated_at), читает порциями"""
+    async with get_session() as s:
+        query = select(UserSettings).filter(UserSettings.updated_at >= since).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        if shard is not None:
+            query = query.filter(_in_shard(UserSettings.user_id, shard))
+
+        async for settings in await s.stream_scalars(query):
+            yield settings
+
+
+@timed_query
+async def get_tasks_by_category(user_id: int, category: str, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None) -> List[Task]:
+    async with session_scope(session) as s:
+        return (await s.scalars(_page(select(Task).filter(
             Task.user_id == user_id,
             Task.category == category,
             Task.is_completed == False
-        ).all()
-    finally:
-        s.close()
+        ).order_by(Task.id), offset, limit))).all()
 
 
-def get_item_by_category(user_id: int, category: str) -> List[ShoppingItem]:
-    s = get_session()
-    try:
-        return s.query(ShoppingItem).filter(
+@timed_query
+async def get_item_by_category(user_id: int, category: str, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None) -> List[ShoppingItem]:
+    async with session_scope(session) as s:
+        return (await s.scalars(_page(select(ShoppingItem).filter(
             ShoppingItem.user_id == user_id,
             ShoppingItem.category == category,
             ShoppingItem.is_bought == False
-        ).all()
-    finally:
-        s.close()
+        ).order_by(ShoppingItem.id), offset, limit))).all()
 
-def get_item_by_id(item_id: int) -> ShoppingItem:
+@timed_query
+async def get_item_by_id(item_id: int, session: AsyncSession | None = None) -> ShoppingItem:
     """получение задачи по ее id"""
-    s = get_session()
-    try:
-        return s.query(ShoppingItem).filter(ShoppingItem.id==item_id).first()
-    finally:
-        s.close()
+    async with session_scope(session) as s:
+        return await s.scalar(select(ShoppingItem).filter(ShoppingItem.id==item_id))
 
-def get_task_by_id(task_id: int) -> Task:
+@timed_query
+async def get_task_by_id(task_id: int, session: AsyncSession | None = None) -> Task:
     """получение задачи по ее id"""
-    s = get_session()
-    try:
-        return s.query(Task).filter(Task.id==task_id).first()
-    finally:
-        s.close()
-
-def get_all_tasks(user_id: int) -> List[Task]:
+    async with session_scope(session) as s:
+        return await s.scalar(select(Task).filter(Task.id==task_id))
+
+@timed_query
+async def get_tasks_by_ids(task_ids: Collection[int], session: AsyncSession | None = None) -> dict[int, Task]:
+    """Задачи по списку id одним запросом (IN); {id: задача}, удаленных нет в словаре"""
+    if not task_ids:
+        return {}
+    async with session_scope(session) as s:
+        tasks = await s.scalars(select(Task).filter(Task.id.in_(set(task_ids))))
+        return {task.id: task for task in tasks.all()}
+
+@timed_query
+async def get_all_tasks(user_id: int, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None) -> List[Task]:
     """Получение всех задач пользователя"""
-    s = get_session()
-    try:
-        return s.query(Task).filter(Task.user_id == user_id, Task.is_completed==False).all()
-    finally:
-        s.close()
+    async with session_scope(session) as s:
+        return (await s.scalars(_page(
+            select(Task).filter(Task.user_id == user_id, Task.is_completed==False).order_by(Task.id),
+            offset, limit
+        ))).all()
+
+
+def _apply_changes(obj, values: dict) -> list[str]:
+    """Записать в объект только отличающиеся поля; ORM обновит в UPDATE только их"""
+    changed = [field for field, value in values.items() if getattr(obj, field) != value]
+    for field in changed:
+        setattr(obj, field, values[field])
+    return changed
+
+
+@timed_query
+async def update_task_fields(task_id: int, user_id: int, values: dict, session: AsyncSession | None = None) -> tuple[Task | None, list[str]]:
+    """
+    Изменить задачу на месте (id и created_at сохраняются).
+    Возвращает задачу и список измененных полей; если ничего не изменилось — в БД не пишем.
+    """
+    async with session_scope(session) as s:
+        task = await s.scalar(select(Task).filter_by(id=task_id, user_id=user_id))
+        if not task:
+            return None, []
+        changed = _apply_changes(task, values)
+        if {"remind_date", "remind_time"} & set(changed):
+            settings = await get_user_settings(user_id, session=s)
+            task.remind_at_utc = remind_at(task, settings) if settings else None
+        if changed:
+            await s.flush()
+        return task, changed
+
+
+@timed_query
+async def update_item_fields(item_id: int, user_id: int, values: dict, session: AsyncSession | None = None) -> tuple[ShoppingItem | None, list[str]]:
+    """Изменить покупку на месте, пишем только измененные поля"""
+    async with session_scope(session) as s:
+        item = await s.scalar(select(ShoppingItem).filter_by(id=item_id, user_id=user_id))
+        if not item:
+            return None, []
+        changed = _apply_changes(item, values)
+        if changed:
+            await s.flush()
+        return item, changed
 
 
-def mark_done(task_id: int, user_id: int) -> bool:
+@timed_query
+async def mark_done(task_id: int, user_id: int, session: AsyncSession | None = None) -> bool:
     """Пометить задачу выполненой"""
-    s = get_session()
-    try:
-        task = s.query(Task).filter_by(id=task_id, user_id=user_id).first()
+    async with session_scope(session) as s:
+        task = await s.scalar(select(Task).filter_by(id=task_id, user_id=user_id))
         if not task:
             return False
         task.is_completed = True
-        s.commit()
+        await s.flush()
         return True
-    finally:
-        s.close()
 
 
-def mark_bought(item_id: int, user_id: int) -> bool:
+@timed_query
+async def mark_bought(item_id: int, user_id: int, session: AsyncSession | None = None) -> bool:
     """Пометить предмет купленным"""
-    s = get_session()
-    try:
-        item = s.query(ShoppingItem).filter_by(id=item_id, user_id=user_id).first()
+    async with session_scope(session) as s:
+        item = await s.scalar(select(ShoppingItem).filter_by(id=item_id, user_id=user_id))
         if not item:
             return False
         item.is_bought = True
-        s.commit()
+        await s.flush()
         return True
-    finally:
-        s.close()
 
-def delete_task(task_id: int, user_id: int) -> bool:
+@timed_query
+async def delete_task(task_id: int, user_id: int, session: AsyncSession | None = None) -> bool:
     """Удалить задачу"""
-    s = get_session()
-    try:
-        task = s.query(Task).filter_by(id=task_id, user_id=user_id).first()
+    async with session_scope(session) as s:
+        task = await s.scalar(select(Task).filter_by(id=task_id, user_id=user_id))
         if not task:
             return False
-        s.delete(task)
-        s.commit()
+        await s.delete(task)
+        await s.flush()
         return True
-    finally:
-        s.close()
 
-def delete_item(item_id: int, user_id: int) -> bool:
+@timed_query
+async def delete_item(item_id: int, user_id: int, session: AsyncSession | None = None) -> bool:
     """Удалить задачу"""
-    s = get_session()
-    try:
-        item = s.query(ShoppingItem).filter_by(id=item_id, user_id=user_id).first()
+    async with session_scope(session) as s:
+        item = await s.scalar(select(ShoppingItem).filter_by(id=item_id, user_id=user_id))
         if not item:
             return False
-        s.delete(item)
-        s.commit()
+        await s.delete(item)
+        await s.flush()
         return True
-    finally:
-        s.close()
 
+
+# ================= аренда партиций уведомлений =================
+
+@timed_query
+async def ensure_lease_partitions(partitions: int):
+    """Создать строки аренды для партиций 0..partitions-1, которых еще нет"""
+    async with get_session() as s:
+        existing = set((await s.scalars(select(NotificationLease.partition))).all())
+        missing = [p for p in range(partitions) if p not in existing]
+        if not missing:
+            return
+        s.add_all(NotificationLease(partition=p) for p in missing)
+        try:
+            await s.commit()
+        except IntegrityError:
+            # строки одновременно создал другой воркер
+            await s.rollback()
+
+
+@timed_query
+async def heartbeat_worker(worker_id: str, now: datetime, alive_after: datetime) -> List[str]:
+    """
+    Отметить воркера живым и вернуть id всех живых (heartbeat не раньше alive_after).
+    Строки умерших воркеров удаляются, их партиции заберут после истечения аренды
+    """
+    async with session_scope() as s:
+        await s.execute(delete(NotificationWorker).filter(NotificationWorker.heartbeat_at < alive_after))
+        worker = await s.get(NotificationWorker, worker_id)
+        if worker:
+            worker.heartbeat_at = now
+        else:
+            s.add(NotificationWorker(worker_id=worker_id, heartbeat_at=now))
+        await s.flush()
+        return list((await s.scalars(
+            select(NotificationWorker.worker_id).order_by(NotificationWorker.worker_id)
+        )).all())
+
+
+@timed_query
+async def remove_worker(worker_id: str):
+    """Убрать воркера при остановке, чтобы остальные сразу пересчитали доли"""
+    async with session_scope() as s:
+        await s.execute(delete(NotificationWorker).filter_by(worker_id=worker_id))
+
+
+@timed_query
+async def get_leases(partitions: int) -> List[NotificationLease]:
+    async with session_scope() as s:
+        return (await s.scalars(select(NotificationLease).filter(
+            NotificationLease.partition < partitions
+        ).order_by(NotificationLease.partition))).all()
+
+
+@timed_query
+async def acquire_lease(partition: int, worker_id: str, now: datetime, expires_at: datetime) -> bool:
+    """
+    Взять или продлить аренду партиции. Условие в самом UPDATE (партиция свободна,
+    аренда истекла или уже наша), поэтому два воркера не получат одну партицию
+    """
+    async with session_scope() as s:
+        result = await s.execute(update(NotificationLease).filter(
+            NotificationLease.partition == partition,
+            or_(
+                NotificationLease.owner.is_(None),
+                NotificationLease.expires_at < now,
+                NotificationLease.owner == worker_id,
+            ),
+        ).values(owner=worker_id, expires_at=expires_at))
+        return result.rowcount == 1
+
+
+@timed_query
+async def save_checkpoint(worker_id: str, partitions: Collection[int], at: datetime):
+    """Запомнить, до какого момента события своих партиций обработаны"""
+    if not partitions:
+        return
+    async with session_scope() as s:
+        await s.execute(update(NotificationLease).filter(
+            NotificationLease.owner == worker_id,
+            NotificationLease.partition.in_(sorted(partitions)),
+        ).values(checkpoint_at=at))
+
+
+@timed_query
+async def release_leases(worker_id: str, partitions: Collection[int]):
+    """Отдать партиции (при остановке или перебалансировке)"""
+    if not partitions:
+        return
+    async with session_scope() as s:
+        await s.execute(update(NotificationLease).filter(
+            NotificationLease.owner == worker_id,
+            NotificationLease.partition.in_(sorted(partitions)),
+        ).values(owner=None, expires_at=None))
+
+
+# ================= журнал уведомлений =================
+
+@timed_query
+async def claim_notification(kind: str, key: int, user_id: int, scheduled_at: datetime, status: str = SENT_PENDING, session: AsyncSession | None = None) -> int | None:
+    """
+    Записать решение отправить уведомление (kind, key, scheduled_at).
+    Вернуть id строки журнала или None, если событие уже записано (отправлено или отправляется).
+    INSERT ... ON CONFLICT DO NOTHING по уникальному индексу: одновременная запись того же
+    события другим воркером не роняет транзакцию, а просто не вставляет строку
+    """
+    async with session_scope(session) as s:
+        dialect_insert = postgresql.insert if s.bind.dialect.name == "postgresql" else sqlite.insert
+        return await s.scalar(
+            dialect_insert(SentNotification)
+            .values(kind=kind, key=key, user_id=user_id, scheduled_at=scheduled_at, status=status)
+            .on_conflict_do_nothing(index_elements=["kind", "key", "scheduled_at"])
+            .returning(SentNotification.id)
+        )
+
+
+@timed_query
+async def finish_notifications(sent_ids: List[int], status: str):
+    """Отметить итог отправки (sent или dropped)"""
+    async with session_scope() as s:
+        await s.execute(update(SentNotification).filter(SentNotification.id.in_(sent_ids)).values(
+            status=status, sent_at=datetime.utcnow(),
+        ))
+
+
+@timed_query
+async def iter_pending_notifications(since: datetime, created_before: datetime, shard: Tuple[int, Collection[int]] | None = None,
+                                     created_from: datetime | None = None) -> AsyncIterator[SentNotification]:
+    """
+    Недоставленные уведомления, запланированные с since (по частичному индексу).
+    Свежие (созданные после created_before) пропускаем — их, скорее всего, еще отправляют;
+    created_from — продолжить с прошлого прохода, не перебирая уже просмотренные строки
+    """
+    async with get_session() as s:
+        query = select(SentNotification).filter(
+            SentNotification.status == SENT_PENDING,
+            SentNotification.scheduled_at >= since,
+            SentNotification.created_at < created_before,
+        ).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        if created_from is not None:
+            query = query.filter(SentNotification.created_at >= created_from)
+        if shard is not None:
+            query = query.filter(_in_shard(SentNotification.user_id, shard))
+
+        async for row in await s.stream_scalars(query):
+            yield row
@@ -1,41 +1,133 @@
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import mark_done, delete_task, mark_bought, delete_item
+from database import mark_done, delete_task, mark_bought, delete_item, get_task_by_id, get_item_by_id
+from keyboards import without_entity, task_inline, shopping_inline
+from notifications import scheduler
+from send_queue import send_queue
+from services.formater import Formater
+from services.pager import Pager
+
+import logging
+logger = logging.getLogger(__name__)
 
 # роутер для подключения к файлу бота
 router = Router()
 
+
+def parse_callback(data: str) -> tuple[int, str]:
+    """
+    id сущности и откуда нажата кнопка:
+    "" — отдельное сообщение, "list" — общее сообщение со списком,
+    "p:<список>:<страница>" — страница списка
+    """
+    parts = data.split(":", 2)
+    return int(parts[1]), parts[2] if len(parts) > 2 else ""
+
+
+async def edit_page(callback: CallbackQuery, view: str, page: int, session: AsyncSession):
+    """Перерисовать страницу списка в том же сообщении"""
+    text, markup = await Pager.build(view, callback.from_user.id, page, session)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        # двойное нажатие: страница не изменилась
+        if "message is not modified" not in str(e):
+            raise
+
+
+async def update_list(callback: CallbackQuery, entity_id: int, context: str, text: str, session: AsyncSession):
+    """Кнопка нажата в сообщении со списком: обновляем его на месте, остальные строки не трогаем"""
+    if context == "list":
+        await callback.message.edit_reply_markup(
+            reply_markup=without_entity(callback.message.reply_markup, entity_id)
+        )
+    else:
+        view, _, page = context[2:].rpartition(":")
+        await edit_page(callback, view, int(page), session)
+    await callback.answer(text)
+
+
 # обработка нажатия на кнопку выполнено
 @router.callback_query(F.data.startswith("task_done:"))
-async def done(callback: CallbackQuery):
-    task_id = int(callback.data.split(":")[1])
-    if mark_done(task_id, callback.from_user.id):
+async def done(callback: CallbackQuery, session: AsyncSession):
+    task_id, context = parse_callback(callback.data)
+    if await mark_done(task_id, callback.from_user.id, session=session):
+        scheduler.remove_task(task_id)
+        if context:
+            await update_list(callback, task_id, context, "✅ Выполнено", session)
+            return
         await callback.message.edit_text("✅ Выполнено")
     await callback.answer()
 
 # обработка кнопки удалить задачу
 @router.callback_query(F.data.startswith("task_delete:"))
-async def delete(callback: CallbackQuery):
+async def delete(callback: CallbackQuery, session: AsyncSession):
 
-    task_id = int(callback.data.split(":")[1])
-    if delete_task(task_id, callback.from_user.id):
+    task_id, context = parse_callback(callback.data)
+    if await delete_task(task_id, callback.from_user.id, session=session):
+        scheduler.remove_task(task_id)
+        if context:
+            await update_list(callback, task_id, context, "🗑 Удалено", session)
+            return
         await callback.message.delete()
     await callback.answer()
 
 # обработка нажатия на кнопку предмет куплен
 @router.callback_query(F.data.startswith("item_bought:"))
-async def done(callback: CallbackQuery):
-    item_id = int(callback.data.split(":")[1])
-    if mark_bought(item_id, callback.from_user.id):
+async def done(callback: CallbackQuery, session: AsyncSession):
+    item_id, context = parse_callback(callback.data)
+    if await mark_bought(item_id, callback.from_user.id, session=session):
+        if context:
+            await update_list(callback, item_id, context, "✅ Куплен", session)
+            return
         await callback.message.edit_text("✅ Куплен")
     await callback.answer()
 
 # обработка кнопки удалить предмет
 @router.callback_query(F.data.startswith("item_delete:"))
-async def delete(callback: CallbackQuery):
+async def delete(callback: CallbackQuery, session: AsyncSession):
 
-    item_id = int(callback.data.split(":")[1])
-    if delete_item(item_id, callback.from_user.id):
+    item_id, context = parse_callback(callback.data)
+    if await delete_item(item_id, callback.from_user.id, session=session):
+        if context:
+            await update_list(callback, item_id, context, "🗑 Удалено", session)
+            return
         await callback.message.delete()
     await callback.answer()
+
+# переход по страницам списка
+@router.callback_query(F.data.startswith("page:"))
+async def page(callback: CallbackQuery, session: AsyncSession):
+    view, _, page = callback.data[len("page:"):].rpartition(":")
+    await edit_page(callback, view, int(page), session)
+    await callback.answer()
+
+# открыть задачу из списка отдельным сообщением (на него можно ответить, чтобы изменить)
+@router.callback_query(F.data.startswith("task_open:"))
+async def open_task(callback: CallbackQuery, session: AsyncSession):
+    task_id, _ = parse_callback(callback.data)
+    task = await get_task_by_id(task_id, session=session)
+    if task and task.user_id == callback.from_user.id and not task.is_completed:
+        await send_queue.answer(
+            callback.message,
+            Formater.format_short_task(task, is_day=False),
+            reply_markup=task_inline(task.id)
+        )
+    await callback.answer()
+
+# открыть покупку из списка отдельным сообщением
+@router.callback_query(F.data.startswith("item_open:"))
+async def open_item(callback: CallbackQuery, session: AsyncSession):
+    item_id, _ = parse_callback(callback.data)
+    item = await get_item_by_id(item_id, session=session)
+    if item and item.user_id == callback.from_user.id and not item.is_bought:
+        await send_queue.answer(
+            callback.message,
+            Formater.format_category_item(item),
+            reply_markup=shopping_inline(item.id),
+            parse_mode="Markdown"
+        )
+    await callback.answer()
@@ -1,52 +1,62 @@
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart
 from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from keyboards import (
     new_main_keyboard, 
     duration_category_keyboard,
     purchase_category_keyboard, 
     TASK_CATEGORY_MAP, 
-    READABLE_CATEGORIES, 
     task_inline, 
     shopping_inline, 
+    tasks_list_inline,
+    shopping_list_inline,
     PURCHASE_CATEGORY_MAP
     )
 
-from database import (
-    get_user_settings, 
-    get_tasks_for_day, 
-    get_tasks_week, 
-    get_all_tasks, 
-    get_tasks_by_category, 
-    get_item_by_category,
-    upsert_user_settings, 
-    get_task_by_id,
-    delete_task,
-    save_task,
-    save_shopping_item
-    )
+from database import upsert_user_settings
 
 from models import Task, ShoppingItem
-from ai.ai_client import parse_text, edit_task
+from ai.ai_client import parse_text, parse_text_stream, edit_task
+from ai.errors import LLMError, LLMTimeout, LLMCircuitOpen, LLMBadResponse
+from config import FAST_PARSER_ENABLED, LLM_STREAMING_ENABLED, LLM_STREAM_EDIT_INTERVAL
 
 from services.parser import Parser
 from services.message_service import MessageService
 from services.formater import Formater
-from services.task_service import TaskService
-from services.shopping_service import ShoppingService
+from services.pager import Pager, MAX_LIST_ROWS, LIST_ROW_LENGTH
+from notifications import scheduler
+from send_queue import send_queue
 
 router = Router()
 
 import logging
 logger = logging.getLogger(__name__)
 
+def llm_error_text(error: Exception) -> str:
+    """Что ответить пользователю, если нейросеть не справилась"""
+    if isinstance(error, LLMCircuitOpen):
+        return f"Нейросеть сейчас недоступна, попробуйте через {max(1, round(error.retry_after))} с"
+    if isinstance(error, LLMTimeout):
+        return "Нейросеть отвечает слишком долго, попробуйте еще раз"
+    if isinstance(error, LLMBadResponse):
+        return "Не получилось разобрать ответ нейросети, попробуйте написать по-другому"
+    if isinstance(error, LLMError):
+        return "Нейросеть сейчас недоступна, попробуйте позже"
+    return f"какая-то ошибка с нейросетью. Текст ошибки {error}"
+
+
 @router.message(CommandStart())
 async def start(message: Message):
     """Обработчик команды /start"""
-    await message.answer(
+    await send_queue.answer(
+        message,
         "Привет! 👋 Я твой умный личный менеджер.\n\n"
         "**Что я умею:**\n\n"
         "🤖 **Понимаю свободный текст** — просто напиши «Купить хлеб в 18:00» или «Созвон в пятницу», и я сам создам задачу или добавлю покупку.\n\n"
@@ -54,7 +64,7 @@ async def start(message: Message):
         "🛒 **Веду список покупок** — сохраняю покупки, группирую их по категориям и показываю всё в удобном виде.\n\n"
         "⏳ **Сортирую по времени** — помогу найти быстрые пятиминутки или важные и сложные дела.\n\n"
         "📅 **Планирую** — покажу задачи на сегодня, неделю или весь список сразу.\n\n"
-        "✏️ **Редактирую ответом** — чтобы изменить или посмотреть задачу или покупку, просто свайпни её сообщение влево и напиши, что поправить!\n\n"
+        "✏️ **Редактирую ответом** — чтобы изменить или посмотреть задачу или покупку, просто свайпни её сообщение влево и напиши, что поправить (в списке сначала нажми ✏️)!\n\n"
         "Настрой свой часовой пояс в настройках, чтобы уведомления приходили вовремя!",
         reply_markup=new_main_keyboard(),
         parse_mode="Markdown"
@@ -64,123 +74,60 @@ async def start(message: Message):
 @router.message(F.text == "⏱ По длительности")
 async def by_duration(message: Message):
     """Показать меню выбора по длительности"""
-    await message.answer("Выбери категорию:", reply_markup=duration_category_keyboard())
+    await send_queue.answer(message, "Выбери категорию:", reply_markup=duration_category_keyboard())
 
 
 @router.message(F.text == "⬅️ Назад")
 async def back(message: Message):
     """Вернуться в главное меню"""
-    await message.answer("Главное меню", reply_markup=new_main_keyboard())
-
-
-@router.message(F.text.in_(TASK_CATEGORY_MAP))
-async def show_task_by_category(message: Message):
-    """Показать задачи по выбранной категории"""
-    
-    user_id = message.from_user.id
+    await send_queue.answer(message, "Главное меню", reply_markup=new_main_keyboard())
 
-    tasks = TaskService.get_category_task(user_id, message.text)
 
-    if not tasks:
-        await message.answer("Задач нет")
-        return
+async def show_page(message: Message, view: str, session: AsyncSession):
+    """Показать список одним сообщением (первая страница)"""
+    text, markup = await Pager.build(view, message.from_user.id, 0, session)
+    await send_queue.answer(message, text, reply_markup=markup)
 
-    for t in tasks:
 
-        answer = Formater.format_short_task(t, is_day=False)
-
-        await message.answer(
-            answer,
-            reply_markup=task_inline(t.id)
-        )
+@router.message(F.text.in_(TASK_CATEGORY_MAP))
+async def show_task_by_category(message: Message, session: AsyncSession):
+    """Показать задачи по выбранной категории"""
+    await show_page(message, f"cat:{TASK_CATEGORY_MAP[message.text]}", session)
 
 
 @router.message(F.text.in_(PURCHASE_CATEGORY_MAP))
-async def show_item_by_category(message: Message):
+async def show_item_by_category(message: Message, session: AsyncSession):
     """Показать покупки по выбранной категории"""
-    
-    items = ShoppingService.get_category_item(message.from_user.id, message.text)
-
-    if not items:
-        await message.answer("Покупок нет")
-        return
-
-    for i in items:
-
-        answer = Formater.format_category_item(i)
-
-        await message.answer(
-            answer,
-            reply_markup=shopping_inline(i.id),
-            parse_mode="Markdown"
-        )
+    await show_page(message, f"shop:{PURCHASE_CATEGORY_MAP[message.text]}", session)
 
 #  вывод задач на день (вспомогательная функция)
-async def show_tasks_for_day(message: Message, day_shift: int):
-
-    tasks = TaskService.get_day_tasks(message.from_user.id, day_shift)
-
-    if not tasks:
-        await message.answer("Задач нет 🎉")
-        return
-
-    for t in tasks:
-
-        answer = Formater.format_short_task(t, is_day = True)
-
-        await message.answer(
-            answer,
-            reply_markup=task_inline(t.id)
-        )
+async def show_tasks_for_day(message: Message, day_shift: int, session: AsyncSession):
+    await show_page(message, f"day:{day_shift}", session)
 
 @router.message(F.text == "📅 Сегодня")
-async def today(message: Message):
-    await show_tasks_for_day(message, day_shift=0)
+async def today(message: Message, session: AsyncSession):
+    await show_tasks_for_day(message, day_shift=0, session=session)
 
 
 @router.message(F.text == "🌅 Завтра")
-async def tomorrow(message: Message):
-    await show_tasks_for_day(message, day_shift=1)
+async def tomorrow(message: Message, session: AsyncSession):
+    await show_tasks_for_day(message, day_shift=1, session=session)
 
 @router.message(F.text == "📆 Неделя")
-async def week(message: Message):
+async def week(message: Message, session: AsyncSession):
     """Показать задачи на неделю"""
-    tasks = TaskService.get_week_task(message.from_user.id)
-    if not tasks:
-        await message.answer("На неделю задач нет 🎉")
-        return
-
-    for t in tasks:
-
-        answer = Formater.format_short_task(t, is_day = False)
-        
-        await message.answer(
-            answer,
-            reply_markup=task_inline(t.id)
-        )
+    await show_page(message, "week", session)
 
 
 
 @router.message(F.text == "📋 Все задачи")
-async def all_tasks(message: Message):
+async def all_tasks(message: Message, session: AsyncSession):
     """Показать все задачи"""
-    tasks = TaskService.get_all_tasks(message.from_user.id)
-    if not tasks:
-        await message.answer("Задач нет")
-        return
-
-    for t in tasks:
-
-        answer = Formater.format_short_task(t, is_day = False)
-        
-        await message.answer(
-            answer,
-            reply_markup=task_inline(t.id)
-            )
+    await show_page(message, "all", session)
         
 @router.message(F.text == "🛒 Покупки")
 async def purchase(message: Message):
-    await message.answer("Выбери категорию:", reply_markup=purchase_category_keyboard())
+    await send_queue.answer(message, "Выбери категорию:", reply_markup=purchase_category_keyboard())
 
 
 
@@ -188,65 +135,121 @@ async def purchase(message: Message):
 async def settings(message: Message):
 
     """Показать инструкции по настройкам"""
-    await message.answer(
-        "Отправь настройки в формате:\nUTC_OFFSET HH:MM\n\nПример:\n+3 09:00"
+    await send_queue.answer(
+        message,
+        "Отправь настройки в формате:\nUTC_OFFSET HH:MM\n\nПример:\n+3 09:00\n\n"
+        "Или с часовым поясом (учитывает летнее время):\nEurope/Moscow 09:00"
     )
 
 
 @router.message(F.text.regexp(r"^[+-]?\d+\s\d{2}:\d{2}$"))
-async def save_settings(message: Message):
+async def save_settings(message: Message, session: AsyncSession):
     """Сохранить пользовательские настройки"""
     
     offset_str, time_str = message.text.split()
-    upsert_user_settings(
+    await upsert_user_settings(
         message.from_user.id,
         int(offset_str),
-        datetime.strptime(time_str, "%H:%M").time()
+        datetime.strptime(time_str, "%H:%M").time(),
+        session=session
+    )
+    await scheduler.update_user(message.from_user.id, session=session)
+    await send_queue.answer(message, "Настройки сохранены ✅", reply_markup=new_main_keyboard())
+
+
+@router.message(F.text.regexp(r"^[A-Za-z]+(/[A-Za-z0-9_+-]+)+\s\d{2}:\d{2}$"))
+async def save_settings_tz(message: Message, session: AsyncSession):
+    """Сохранить настройки с часовым поясом IANA"""
+
+    tz_name, time_str = message.text.split()
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await send_queue.answer(message, "Не знаю такого часового пояса, пример: Europe/Moscow")
+        return
+
+    # целый сдвиг оставляем для совместимости, точное время считается по tz
+    offset = datetime.now(tz).utcoffset()
+    await upsert_user_settings(
+        message.from_user.id,
+        int(offset.total_seconds() // 3600),
+        datetime.strptime(time_str, "%H:%M").time(),
+        tz_name,
+        session=session
     )
-    await message.answer("Настройки сохранены ✅", reply_markup=new_main_keyboard())
+    await scheduler.update_user(message.from_user.id, session=session)
+    await send_queue.answer(message, "Настройки сохранены ✅", reply_markup=new_main_keyboard())
 
 
 
 @router.message(F.reply_to_message)
-async def handle_reply(message: Message):
+async def handle_reply(message: Message, session: AsyncSession):
     """
     Обработчик для ответов на сообщения бота, чтобы редактировать задачи и покупки.
     """
 
     user_id = message.from_user.id
-    dt_string = Formater.get_user_time(user_id)
+    dt_string = await Formater.get_user_time(user_id, session=session)
 
     if not dt_string:
-        await message.answer("Часовой пояс не найден, добавьте его в настройках")
+        await send_queue.answer(message, "Часовой пояс не найден, добавьте его в настройках")
+        return
 
     entity_text = message.reply_to_message.text
 
-    id_type = Parser.get_id_info(entity_text)
+    try:
+        id_type = Parser.get_id_info(entity_text)
+    except ValueError:
+        # в общем сообщении со списком несколько сущностей — непонятно, какую менять
+        await send_queue.answer(message, "Ответьте на сообщение с одной задачей или покупкой, чтобы изменить ее")
+        return
 
     type = id_type["type"]
     id = id_type["id"]
     request = message.text
 
-    description = Formater.make_description(id, type, dt_string,request)
+    description = await Formater.make_description(id, type, dt_string, request, session=session)
+    if not description:
+        await send_queue.answer(message, "Не нашел, что изменить. Возможно, это уже удалено")
+        return
 
-    result = await edit_task(description, dt_string)
+    # закрываем читающую транзакцию, чтобы не держать БД, пока ждем LLM
+    await session.commit()
 
+    try:
+        result = await edit_task(description, dt_string)
+    except LLMError as e:
+        logger.warning(f"правка не удалась: {e!r}")
+        await send_queue.answer(message, llm_error_text(e))
+        return
 
-# ------------------------- 
-    # удаляем старую сущность (задачи или покупка)
-    MessageService.delete_entity(id, type, user_id)
+    # меняем строку на месте: id и дата создания сохраняются, пишутся только измененные поля
+    try:
+        entity, changed = await MessageService.update_entity(id, type, result, user_id, session=session)
+    except LLMBadResponse as e:
+        logger.warning(f"правка не удалась: {e!r}")
+        await send_queue.answer(message, "Не понял, что изменить, попробуйте написать по-другому")
+        return
+    if changed:
+        # коммитим до ответа, чтобы не держать блокировку записи, пока сообщение ждет в очереди
+        await session.commit()
+
+    if entity is None:
+        await send_queue.answer(message, "Не нашел, что изменить. Возможно, это уже удалено")
+        return
 
-    entity = MessageService.make_save_new_entity(result, user_id)
-    if type =="tasks":
-        response_text = Formater.format_task(entity, make_task = False)
-        await message.answer(
+    if isinstance(entity, Task):
+        response_text = Formater.format_task(entity, make_task = False, changed = changed)
+        await send_queue.answer(
+            message,
             response_text,
             reply_markup=task_inline(entity.id),
             parse_mode="Markdown"
         )
-    elif type =="shopping_list":
-        response_text = Formater.format_shopping_list(entity)
-        await message.answer(
+    else:
+        response_text = Formater.format_shopping_list(entity, changed = changed)
+        await send_queue.answer(
+            message,
             response_text,
             reply_markup=shopping_inline(entity.id),
             parse_mode="Markdown"
@@ -255,63 +258,152 @@ async def handle_reply(message: Message):
 
     try:
         await message.reply_to_message.delete()
-    except:
-        print(f"не удалось удалить сообщение c id = {id}")
+    except TelegramBadRequest:
+        logger.warning(f"не удалось удалить сообщение c id = {id}")
 
     
 
 # --------------------------
 
 @router.message()
-async def new_task(message: Message):
+async def new_task(message: Message, session: AsyncSession):
     """Обработчик добавления новой задачи"""
     logger.debug(f"поступило сообщение {message.text}")
 
     user_id = message.from_user.id
-    dt_string = Formater.get_user_time(user_id)
+    user_now = await Formater.get_user_now(user_id, session=session)
 
-    if not dt_string:
-        await message.answer("Часовой пояс не найден, добавьте его в настройках")
+    if not user_now:
+        await send_queue.answer(message, "Часовой пояс не найден, добавьте его в настройках")
         return
+    dt_string = Formater.format_user_time(user_now)
 
     # проверка на длину (500 слов)
     MAX_TEXT_LENGTH = 6*500
     if len(message.text) > MAX_TEXT_LENGTH:
-        await message.answer("Слишком длинный текст")
+        await send_queue.answer(message, "Слишком длинный текст")
         return
     
 
-    logger.debug(f"передаю в функцию c LLM время и дату: {dt_string}")
-    data_message = await parse_text(f"сегодня {dt_string}, {message.text}")
-
-    if isinstance(data_message, str):
-        await message.answer(f"какая-то ошибка с нейросетью. Текст ошибки {data_message}")
-        return
+    # простые сообщения разбираем сами, без LLM
+    data_message = None
+    if FAST_PARSER_ENABLED:
+        data_message = Parser.fast_parse(message.text, user_now.replace(tzinfo=None))
+
+    if data_message:
+        logger.debug(f"сообщение разобрано без LLM: {data_message}")
+    else:
+        # закрываем читающую транзакцию, чтобы не держать БД, пока ждем LLM
+        await session.commit()
+
+        logger.debug(f"передаю в функцию c LLM время и дату: {dt_string}")
+        if LLM_STREAMING_ENABLED:
+            await answer_streaming(message, dt_string, session)
+            return
+        try:
+            data_message = await parse_text(message.text, dt_string)
+        except LLMError as e:
+            logger.warning(f"разбор не удался: {e!r}")
+            await send_queue.answer(message, llm_error_text(e))
+            return
 
     
     data_list = data_message.get("items")
     if not data_list:
-        await message.answer("Не получилось выделить задачу из вашего текста. Пожалуйста напишите подробнее")
+        await send_queue.answer(message, "Не получилось выделить задачу из вашего текста. Пожалуйста напишите подробнее")
         return
     
-    entity = MessageService.make_save_new_entity(data_message, user_id)
+    # все элементы ответа сохраняем одной транзакцией
+    entities = await MessageService.make_save_new_entities(data_message, user_id, session=session)
+    await session.commit()
+
+    if not entities:
+        await send_queue.answer(message, "Не получилось выделить задачу из вашего текста. Пожалуйста напишите подробнее")
+        return
+
+    text, markup = entities_message(entities)
+    await send_queue.answer(message, text, reply_markup=markup, parse_mode="Markdown")
+
+
+def entities_message(entities: list[Task] | list[ShoppingItem]):
+    """Текст и клавиатура ответа на новые сущности: карточка для одной, общий список для нескольких"""
+    if len(entities) > 1:
+        if isinstance(entities[0], Task):
+            shown = entities[:MAX_LIST_ROWS]
+            return Formater.format_tasks(entities, MAX_LIST_ROWS, LIST_ROW_LENGTH), tasks_list_inline([t.id for t in shown])
+        shown = entities[:MAX_LIST_ROWS]
+        return Formater.format_shopping_items(entities, MAX_LIST_ROWS, LIST_ROW_LENGTH), shopping_list_inline([i.id for i in shown])
+
+    entity = entities[0]
+    if isinstance(entity, Task):
+        return Formater.format_task(entity, make_task = True), task_inline(entity.id)
+    return Formater.format_shopping_list(entity), shopping_inline(entity.id)
 
-    if isinstance(entity,Task):
 
-            response_text = Formater.format_task(entity, make_task = True)
+async def answer_streaming(message: Message, dt_string: str, session: AsyncSession):
+    """
+    Разбор через LLM со стримингом. Пока модель пишет, одно сообщение правится в список
+    уже разобранных элементов (не чаще LLM_STREAM_EDIT_INTERVAL, без кнопок — в БД их еще нет).
+    В конце все элементы сохраняются одной транзакцией и сообщение правится в итоговое, с кнопками.
+    Если ответ оборвался, сохраняем разобранное и предупреждаем, что список может быть неполным.
+    """
+    user_id = message.from_user.id
+    valid = []
+    sent = None
+    last_edit = 0.0
+    error = None
 
-            await message.answer(
-                response_text,
-                reply_markup=task_inline(entity.id),
-                parse_mode="Markdown"
-            )
+    try:
+        async for parsed in parse_text_stream(message.text, dt_string):
+            valid.append(parsed)
+            if sent is not None and time.monotonic() - last_edit < LLM_STREAM_EDIT_INTERVAL:
+                continue
+            preview = MessageService.build_entities(valid, user_id)
+            if not preview:
+                continue
+            if sent is None:
+                sent = await send_queue.answer(message, entities_preview(preview), parse_mode="Markdown")
+            else:
+                await edit_entities_message(sent, entities_preview(preview))
+            last_edit = time.monotonic()
+    except Exception as e:
+        logger.exception("ошибка при стриминге ответа LLM")
+        error = e
+
+    entities = await MessageService.save_valid_items(valid, user_id, session=session)
+    await session.commit()
+
+    if not entities:
+        text = llm_error_text(error) if error else "Не получилось выделить задачу из вашего текста. Пожалуйста напишите подробнее"
+        await send_queue.answer(message, text)
+        return
 
-    elif isinstance(entity,ShoppingItem):
+    text, markup = entities_message(entities)
+    if error:
+        text += "\n\n⚠️ Ответ нейросети оборвался, список может быть неполным"
+    if sent is not None:
+        try:
+            await edit_entities_message(sent, text, markup)
+            return
+        except Exception:
+            logger.exception("не удалось обновить сообщение со списком, отправляю новое")
+    await send_queue.answer(message, text, reply_markup=markup, parse_mode="Markdown")
 
-            response_text = Formater.format_shopping_list(entity)
 
-            await message.answer(
-                response_text,
-                reply_markup=shopping_inline(entity.id), 
-                parse_mode="Markdown"
-            )
+def entities_preview(entities: list[Task] | list[ShoppingItem]) -> str:
+    """Список еще не сохраненных элементов (без id) на время стриминга"""
+    if isinstance(entities[0], Task):
+        return Formater.format_tasks(entities, MAX_LIST_ROWS, LIST_ROW_LENGTH)
+    return Formater.format_shopping_items(entities, MAX_LIST_ROWS, LIST_ROW_LENGTH)
+
+
+async def edit_entities_message(sent: Message, text: str, markup=None):
+    """Правка сообщения через очередь отправки (лимиты и RetryAfter)"""
+    try:
+        await send_queue.enqueue(
+            sent.chat.id,
+            lambda: sent.edit_text(text, reply_markup=markup, parse_mode="Markdown"),
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
@@ -54,6 +54,57 @@ def shopping_inline(item_id: int) -> InlineKeyboardMarkup:
     kb.adjust(2)
     return kb.as_markup()
 
+def tasks_list_inline(task_ids: list[int]) -> InlineKeyboardMarkup:
+    """Кнопки для сообщения с несколькими задачами: строка на задачу"""
+    kb = InlineKeyboardBuilder()
+    for n, task_id in enumerate(task_ids, 1):
+        kb.button(text=f"✅ {n}", callback_data=f"task_done:{task_id}:list")
+        kb.button(text=f"🗑 {n}", callback_data=f"task_delete:{task_id}:list")
+    kb.adjust(2)
+    return kb.as_markup()
+
+def shopping_list_inline(item_ids: list[int]) -> InlineKeyboardMarkup:
+    """Кнопки для сообщения с несколькими покупками: строка на покупку"""
+    kb = InlineKeyboardBuilder()
+    for n, item_id in enumerate(item_ids, 1):
+        kb.button(text=f"✅ {n}", callback_data=f"item_bought:{item_id}:list")
+        kb.button(text=f"🗑 {n}", callback_data=f"item_delete:{item_id}:list")
+    kb.adjust(2)
+    return kb.as_markup()
+
+def page_inline(view: str, page: int, ids: list[int], first_number: int, is_items: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Кнопки страницы списка: строка на сущность (✅/🗑/✏️) и переход по страницам.
+    В callback_data кнопок действий зашита страница, чтобы перерисовать ее на месте.
+    """
+    done, delete, open_ = ("item_bought", "item_delete", "item_open") if is_items else ("task_done", "task_delete", "task_open")
+    kb = InlineKeyboardBuilder()
+    for n, entity_id in enumerate(ids, first_number):
+        kb.button(text=f"✅ {n}", callback_data=f"{done}:{entity_id}:p:{view}:{page}")
+        kb.button(text=f"🗑 {n}", callback_data=f"{delete}:{entity_id}:p:{view}:{page}")
+        kb.button(text=f"✏️ {n}", callback_data=f"{open_}:{entity_id}")
+    sizes = [3] * len(ids)
+
+    nav = 0
+    if page > 0:
+        kb.button(text="⬅️", callback_data=f"page:{view}:{page - 1}")
+        nav += 1
+    if has_next:
+        kb.button(text="➡️", callback_data=f"page:{view}:{page + 1}")
+        nav += 1
+    if nav:
+        sizes.append(nav)
+    kb.adjust(*sizes)
+    return kb.as_markup()
+
+def without_entity(markup: InlineKeyboardMarkup, entity_id: int) -> InlineKeyboardMarkup | None:
+    """Убрать из общего сообщения строку кнопок одной сущности"""
+    rows = [
+        row for row in markup.inline_keyboard
+        if not any(button.callback_data.split(":")[1] == str(entity_id) for button in row)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
 
 
 # Маппинг текста кнопок на внутренние коды категорий
@@ -0,0 +1,266 @@
+"""
+Метрики бота в формате Prometheus.
+Свой маленький реестр (счетчики, гистограммы, gauge), чтобы не тянуть prometheus_client;
+отдается по HTTP на METRICS_HOST:METRICS_PORT/metrics (aiohttp уже есть в зависимостях aiogram).
+"""
+import functools
+import inspect
+import threading
+import time
+from typing import Callable, Iterable
+
+from aiohttp import web
+
+import logging
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Только растет: число запросов, ошибок и т.п."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels_text(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(Metric):
+    """Распределение длительностей по корзинам + сумма и количество"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # метки -> [счетчики корзин, сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """with histogram.time(...): — замерить блок кода"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(Metric):
+    """Текущее значение, которое считается при каждом запросе /metrics"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), callback: Callable[[], dict] | None = None):
+        super().__init__(name, documentation, labelnames)
+        # callback возвращает {кортеж меток: значение}
+        self.callback = callback
+
+    def samples(self) -> list[str]:
+        if not self.callback:
+            return []
+        try:
+            values = self.callback()
+        except Exception:
+            logger.exception(f"не удалось посчитать {self.name}")
+            return []
+        return [f"{self.name}{_labels_text(self.labelnames, k)} {_number(v)}" for k, v in values.items()]
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"метрика {metric.name} уже есть")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+# ================= метрики бота =================
+
+LLM_LATENCY = registry.register(Histogram(
+    "llm_request_seconds", "Длительность одного запроса к LLM", ("model", "outcome")))
+LLM_FIRST_TOKEN = registry.register(Histogram(
+    "llm_first_token_seconds", "Время до первого куска ответа LLM в режиме стриминга", ("model",)))
+LLM_RETRIES = registry.register(Counter(
+    "llm_retries_total", "Повторные запросы к LLM после ошибки", ("model",)))
+LLM_FAILURES = registry.register(Counter(
+    "llm_failures_total", "Запросы к LLM, не удавшиеся после всех попыток", ("model",)))
+LLM_HEDGES = registry.register(Counter(
+    "llm_hedged_requests_total", "Дублирующие запросы к LLM, отправленные после перцентиля задержки", ("model",)))
+LLM_SINGLE_FLIGHT = registry.register(Counter(
+    "llm_single_flight_total", "Вызовы LLM: leader — ушел запрос, collapsed — присоединился к такому же в полете", ("kind", "outcome")))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total", "Токены LLM: prompt, completion и cached (префикс из кэша провайдера)", ("model", "kind")))
+
+DB_QUERY = registry.register(Histogram(
+    "db_query_seconds", "Длительность функций database.py", ("function",)))
+
+HANDLER_LATENCY = registry.register(Histogram(
+    "handler_seconds", "Длительность обработчиков aiogram", ("handler", "outcome")))
+
+NOTIFY_TICK = registry.register(Histogram(
+    "notification_tick_seconds", "Длительность одного прохода цикла уведомлений"))
+NOTIFICATIONS_SENT = registry.register(Counter(
+    "notifications_sent_total", "Отправленные уведомления", ("kind",)))
+NOTIFICATION_MESSAGES = registry.register(Counter(
+    "notification_messages_total", "Сообщения с уведомлениями (несколько уведомлений пользователя склеиваются в одно)"))
+
+SEND_QUEUE_WAIT = registry.register(Histogram(
+    "send_queue_wait_seconds", "Сколько сообщение ждало в очереди отправки", ("priority",)))
+
+TELEGRAM_REQUESTS = registry.register(Histogram(
+    "telegram_request_seconds", "Длительность запросов к Telegram Bot API", ("method",)))
+TELEGRAM_ERRORS = registry.register(Counter(
+    "telegram_errors_total", "Ошибки Telegram Bot API", ("method", "error")))
+TELEGRAM_RETRY_AFTER = registry.register(Counter(
+    "telegram_retry_after_total", "Ответы 429 (RetryAfter) от Telegram", ("method",)))
+
+
+def timed_query(func):
+    """Декоратор для функций database.py: длительность по имени функции"""
+    name = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            # для потоковых запросов считаем только время внутри генератора (запрос и чтение строк),
+            # а не обработку строк вызывающим кодом между yield (например, отправку в Telegram)
+            rows = func(*args, **kwargs)
+            spent = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        row = await rows.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        spent += time.perf_counter() - start
+                    yield row
+            finally:
+                await rows.aclose()
+                DB_QUERY.observe(spent, function=name)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with DB_QUERY.time(function=name):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+# ================= HTTP =================
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднять /metrics; вернуть runner, чтобы остановить его при выходе"""
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"метрики доступны на http://{host}:{port}/metrics")
+    return runner
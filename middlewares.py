@@ -0,0 +1,123 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+from database import get_session
+from metrics import HANDLER_LATENCY, TELEGRAM_REQUESTS, TELEGRAM_ERRORS, TELEGRAM_RETRY_AFTER
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на одно обновление (unit of work).
+    Сессия передается в обработчик параметром session, все изменения
+    обновления коммитятся одной транзакцией в конце, при ошибке — откатываются.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with get_session() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+                await session.commit()
+            except BaseException:
+                # close() не вызывает after_rollback — откатываем явно, чтобы сбросить кэш настроек
+                await session.rollback()
+                raise
+            return result
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Считает обновления, которые сейчас обрабатываются.
+    При остановке бота wait_idle дожидается, пока они закончатся.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if not self.count:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """True, если все обработчики закончились за timeout секунд"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Длительность обработчика (метрика handler_seconds по имени функции).
+    Вешается как inner middleware на observer роутера: к этому моменту
+    обработчик уже выбран и лежит в data["handler"].
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, handler=name, outcome=outcome)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Длительность и ошибки запросов к Bot API, включая 429 (RetryAfter)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            TELEGRAM_RETRY_AFTER.inc(method=name)
+            raise
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_REQUESTS.observe(time.perf_counter() - start, method=name)
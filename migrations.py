@@ -0,0 +1,115 @@
+"""
+Версионные миграции схемы.
+create_all создает только новые таблицы, а в существующую tasks.db не добавляет
+ни колонок, ни индексов. Для этого здесь список миграций: каждая выполняется один раз,
+номер примененной записывается в таблицу schema_version. Миграции идемпотентны
+(проверяют, что уже есть), поэтому на новой БД после create_all они ничего не меняют.
+
+Новая миграция — функция (conn) -> None и строка в MIGRATIONS со следующим номером.
+"""
+from datetime import datetime
+
+from sqlalchemy import DateTime, String, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.types import TypeEngine
+
+from models import Base
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _add_column(conn: Connection, table: str, column: str, column_type: TypeEngine, index: bool = False):
+    """
+    Добавить колонку, если ее еще нет (данные таблицы не трогаются).
+    Тип — SQLAlchemy, компилируется под диалект: DateTime() — DATETIME в SQLite, TIMESTAMP в Postgres
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column in columns:
+        return
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type.compile(dialect=conn.dialect)}"))
+    if index:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+    logger.info(f"добавлена колонка {table}.{column}")
+
+
+def _create_model_indexes(conn: Connection, *tables: str):
+    """Создать индексы, описанные в models.py, которых еще нет в БД"""
+    for name in tables:
+        existing = {i["name"] for i in inspect(conn).get_indexes(name)}
+        columns = {c["name"] for c in inspect(conn).get_columns(name)}
+        for index in Base.metadata.tables[name].indexes:
+            # индексы по колонкам из более поздних миграций создадут сами эти миграции
+            if index.name not in existing and {c.name for c in index.columns} <= columns:
+                index.create(conn)
+                logger.info(f"создан индекс {index.name}")
+
+
+# ================= миграции =================
+
+def utc_columns(conn: Connection):
+    """UTC-моменты уведомлений и часовой пояс IANA"""
+    _add_column(conn, "tasks", "remind_at_utc", DateTime(), index=True)
+    _add_column(conn, "user_settings", "timezone", String(64))
+    _add_column(conn, "user_settings", "next_digest_utc", DateTime(), index=True)
+
+
+def query_indexes(conn: Connection):
+    """Составные и частичные индексы под запросы database.py"""
+    _create_model_indexes(conn, "tasks", "shopping_items")
+
+
+def notification_leases(conn: Connection):
+    """Таблицы аренды партиций и живых воркеров уведомлений"""
+    for name in ("notification_leases", "notification_workers"):
+        Base.metadata.tables[name].create(conn, checkfirst=True)
+
+
+def sent_notifications(conn: Connection):
+    """Журнал отправленных уведомлений и контрольная точка партиции"""
+    Base.metadata.tables["sent_notifications"].create(conn, checkfirst=True)
+    _add_column(conn, "notification_leases", "checkpoint_at", DateTime())
+
+
+def change_tracking(conn: Connection):
+    """Время изменения задач и настроек — для инкрементального перечитывания в воркере уведомлений"""
+    _add_column(conn, "tasks", "updated_at", DateTime(), index=True)
+    _add_column(conn, "user_settings", "updated_at", DateTime(), index=True)
+
+
+# (версия, функция); порядок и номера не меняются, новые миграции добавляются в конец
+MIGRATIONS = [
+    (1, utc_columns),
+    (2, query_indexes),
+    (3, notification_leases),
+    (4, sent_notifications),
+    (5, change_tracking),
+]
+
+# после этих миграций нужно пересчитать UTC-моменты уведомлений
+BACKFILL_SCHEDULE = {1}
+
+
+def current_version(conn: Connection) -> int:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def upgrade(conn: Connection) -> list[int]:
+    """Применить недостающие миграции в одной транзакции, вернуть их номера"""
+    version = current_version(conn)
+    applied = []
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"миграция {number}: {migration.__doc__}")
+        migration(conn)
+        conn.execute(
+            text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+            {"v": number, "n": migration.__name__, "t": datetime.utcnow()},
+        )
+        applied.append(number)
+    return applied
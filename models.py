@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Time, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Time, Float, Index, text
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -8,6 +8,18 @@ Base = declarative_base()
 class Task(Base):
     """Модель для задачи"""
     __tablename__ = "tasks"
+    __table_args__ = (
+        # задачи на день/неделю и все открытые задачи пользователя
+        Index("ix_tasks_user_open_deadline", "user_id", "is_completed", "deadline_day", "deadline_time"),
+        # задачи по длительности
+        Index("ix_tasks_user_category", "user_id", "category", "is_completed"),
+        # только задачи с напоминанием (частичный индекс)
+        Index(
+            "ix_tasks_user_remind", "user_id", "is_completed",
+            sqlite_where=text("remind_date IS NOT NULL"),
+            postgresql_where=text("remind_date IS NOT NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, index=True, nullable=False)
@@ -22,9 +34,18 @@ class Task(Base):
     remind_date = Column(Date, nullable=True)
     remind_time = Column(Time, nullable=True)
 
+    # момент напоминания в UTC (считается из remind_* и часового пояса пользователя)
+    remind_at_utc = Column(DateTime, nullable=True, index=True)
+    # время последнего изменения: по нему воркер уведомлений подхватывает чужие правки
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
 class ShoppingItem(Base):
     """Модель для конкретного товара в списке покупок"""
     __tablename__ = "shopping_items"
+    __table_args__ = (
+        # покупки по категории
+        Index("ix_shopping_items_user_category", "user_id", "category", "is_bought"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, index=True, nullable=False)
@@ -53,4 +74,64 @@ class UserSettings(Base):
     user_id = Column(Integer, primary_key=True)
     utc_offset = Column(Integer, nullable=False)
     notify_time = Column(Time, nullable=False)
+    # часовой пояс IANA (например Europe/Moscow), если задан — важнее utc_offset
+    timezone = Column(String(64), nullable=True)
+
+    # следующий момент ежедневного уведомления в UTC
+    next_digest_utc = Column(DateTime, nullable=True, index=True)
+    # время последнего изменения (см. Task.updated_at)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+class NotificationLease(Base):
+    """Аренда партиции уведомлений: какой воркер рассылает пользователям с user_id % N == partition"""
+    __tablename__ = "notification_leases"
+
+    partition = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(128), nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    # до этого момента (UTC) события партиции уже обработаны; новый владелец догоняет с него
+    checkpoint_at = Column(DateTime, nullable=True)
+
+
+class NotificationWorker(Base):
+    """Живые воркеры уведомлений (по ним считается справедливая доля партиций)"""
+    __tablename__ = "notification_workers"
 
+    worker_id = Column(String(128), primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)
+
+
+# статусы sent_notifications
+SENT_PENDING = "pending"    # решение отправить принято, сообщение в очереди
+SENT_DONE = "sent"          # Telegram принял сообщение
+SENT_DROPPED = "dropped"    # отправлять нечего или некому (задача выполнена, бот заблокирован)
+
+
+class SentNotification(Base):
+    """
+    Журнал уведомлений: одна строка на событие (вид, задача или пользователь, момент).
+    Уникальный ключ не дает отправить одно событие дважды, а строки pending
+    досылаются после перезапуска
+    """
+    __tablename__ = "sent_notifications"
+    __table_args__ = (
+        Index("ux_sent_notifications_event", "kind", "key", "scheduled_at", unique=True),
+        # недоставленные — для досылки после перезапуска (частичный индекс)
+        Index(
+            "ix_sent_notifications_pending", "scheduled_at",
+            sqlite_where=text("status = 'pending'"),
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # digest или remind
+    kind = Column(String(16), nullable=False)
+    # id задачи для напоминания, user_id для ежедневного уведомления
+    key = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    scheduled_at = Column(DateTime, nullable=False)
+    status = Column(String(16), nullable=False, default=SENT_PENDING)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
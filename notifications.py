@@ -1,63 +1,692 @@
 import asyncio
-from datetime import datetime, timedelta, timezone
+import heapq
+import itertools
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Collection
 
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import BOT_TOKEN
-from database import get_session, get_tasks_for_day, get_all_tasks, get_tasks_to_remind, get_all_users
-from models import UserSettings, Task
-
-bot = Bot(token=BOT_TOKEN)
-
-
-async def notification_loop():
-    while True:
-        now_utc = datetime.utcnow()
-
-        users = get_all_users()
- 
-        for u in users:
-            local_now = now_utc + timedelta(hours=u.utc_offset)
-            local_date = local_now.date()
-            local_time = local_now.time().replace(second=0, microsecond=0)
-
-            # ========= 1. ЕЖЕДНЕВНОЕ УВЕДОМЛЕНИЕ =========
-            if (
-                local_time.hour == u.notify_time.hour and
-                local_time.minute == u.notify_time.minute
-            ):
-                tasks = get_tasks_for_day(u.user_id, local_date)
-                if tasks:
-                    text = "🔔 Задачи на сегодня:\n" + "\n".join(
-                        f"- {t.description}" for t in tasks
-                    )
-                    await bot.send_message(u.user_id, text)
-
-            # ========= 2. НАПОМИНАНИЯ ПО ЗАДАЧАМ =========
-
-            remind_tasks = get_tasks_to_remind(u.user_id)
-
-            for task in remind_tasks:
-                remind_at = (
-                    task.remind_time
-                    if task.remind_time
-                    else u.notify_time
-                )
-                remind_day=(
-                    task.remind_date
-                    if task.remind_date
-                    else local_date
-                )
-
-                if (
-                    remind_at.hour == local_time.hour and
-                    remind_at.minute == local_time.minute and
-                    remind_day==local_date
-                ):
-                    await bot.send_message(
-                        u.user_id,
-                        f"⏰ Напоминание:\n{task.description}"
-                    )
-
-
-        await asyncio.sleep(60)
+from config import (
+    NOTIFY_CATCHUP_MINUTES,
+    NOTIFY_HORIZON_MINUTES,
+    NOTIFY_PARTITIONS,
+    NOTIFY_LEASE_TTL_SECONDS,
+    NOTIFY_LEASE_RENEW_SECONDS,
+    NOTIFY_REFRESH_SECONDS,
+    NOTIFY_REPLAY_HOURS,
+    SHUTDOWN_TIMEOUT,
+)
+from database import (
+    get_session,
+    get_tasks_for_day,
+    get_tasks_to_remind,
+    get_user_settings,
+    get_tasks_by_ids,
+    iter_due_reminders,
+    iter_due_digests,
+    advance_digest,
+    user_tz,
+    utc_to_local,
+    ensure_lease_partitions,
+    heartbeat_worker,
+    remove_worker,
+    get_leases,
+    acquire_lease,
+    release_leases,
+    save_checkpoint,
+    claim_notification,
+    finish_notifications,
+    iter_pending_notifications,
+    iter_changed_tasks,
+    iter_changed_settings,
+)
+from keyboards import task_inline, tasks_list_inline
+from metrics import NOTIFY_TICK, NOTIFICATIONS_SENT, NOTIFICATION_MESSAGES, Gauge, registry
+from models import Task, SENT_PENDING, SENT_DONE, SENT_DROPPED
+from send_queue import send_queue
+from services.formater import Formater
+from services.pager import MAX_LIST_ROWS, LIST_ROW_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# виды событий в планировщике
+DIGEST = "digest"
+REMIND = "remind"
+
+# максимальный сон между проверками (на случай перевода системных часов)
+MAX_SLEEP_SECONDS = 300
+
+# запись журнала в статусе pending моложе этого, скорее всего, еще отправляется — не досылаем
+REDELIVER_AFTER_SECONDS = 60
+
+# перекрытие инкрементального перечитывания: изменения, закоммиченные позже своего updated_at,
+# и расхождение часов между процессами
+REFRESH_OVERLAP_SECONDS = 60
+
+# через сколько повторять события, которые не удалось отправить, и проход после сбоя (БД недоступна и т.п.)
+RETRY_SECONDS = 30
+
+# сколько задач показывать в одном уведомлении (по две кнопки на задачу, у Telegram лимит 100)
+MAX_NOTIFICATION_ROWS = MAX_LIST_ROWS
+
+
+class ReminderScheduler:
+    """
+    Планировщик уведомлений на приоритетной очереди (heapq).
+    В куче лежат моменты срабатывания в пределах горизонта (NOTIFY_HORIZON_MINUTES):
+    ежедневные уведомления пользователей и напоминания по задачам. Цикл спит
+    до ближайшего события, окна подгружаются из БД одним запросом, а при
+    изменении задачи очередь обновляется точечно.
+
+    Пользователи делятся на партиции по user_id % partitions; планировщик
+    ведет только своих (owned). owned=None — все пользователи (один процесс).
+
+    Каждое срабатывание сначала записывается в журнал sent_notifications
+    (уникальный ключ: вид, задача/пользователь, момент), и только потом
+    сообщение уходит в очередь; после отправки строка помечается sent.
+    Поэтому повторный проход не шлет дубль, а недоставленное досылается.
+
+    Раз в NOTIFY_REFRESH_SECONDS подхватываются изменения из других процессов —
+    только задачи и настройки, измененные с прошлого раза (updated_at), и только
+    новые строки журнала; целиком очередь перечитывается лишь при смене партиций.
+    """
+
+    def __init__(self, partitions: int = NOTIFY_PARTITIONS, owned: Collection[int] | None = None, bot: Bot | None = None):
+        # бот процесса, через который уходят уведомления (задает notification_loop)
+        self.bot = bot
+        self.partitions = partitions
+        self._owned = frozenset(owned) if owned is not None else None
+        # (fire_at, seq, kind, key)
+        self._heap = []
+        # (kind, key) -> seq актуальной записи, устаревшие записи пропускаем при извлечении
+        self._entries = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        # до какого момента (UTC) события уже загружены из БД
+        self._loaded_until = None
+        self._stopping = False
+        # (kind, key) -> момент, когда событие уже сработало: при перечитывании окна не повторяем
+        self._fired = {}
+        # (kind, key) -> момент события, которое не удалось отправить; повторим в _retry_at (UTC)
+        self._failed = {}
+        self._retry_at = None
+        self._needs_reload = False
+        self._reloaded_at = time.monotonic()
+        # с какого момента (UTC) искать измененные задачи и настройки при следующем обновлении
+        self._changes_since = None
+        # строки журнала, созданные раньше этого момента, уже просмотрены
+        self._replayed_until = None
+        # с какого момента догонять при следующем перечитывании (контрольная точка новых партиций)
+        self._replay_from = None
+        # партиции, загруженные в очередь, и момент, до которого их события обработаны
+        self._loaded_partitions = self._owned
+        self._checkpoint = None
+        # id строки журнала -> задача, ждущая результата отправки
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def owned(self) -> frozenset | None:
+        return self._owned
+
+    def owns(self, user_id: int) -> bool:
+        return self._owned is None or user_id % self.partitions in self._owned
+
+    def _shard(self) -> tuple[int, frozenset] | None:
+        return None if self._owned is None else (self.partitions, self._owned)
+
+    @property
+    def checkpoint(self) -> tuple[frozenset, datetime] | None:
+        """(партиции, момент): до этого момента все события этих партиций обработаны"""
+        return self._checkpoint
+
+    def set_partitions(self, owned: Collection[int], replay_from: datetime | None = None):
+        """
+        Новый набор своих партиций (от аренды); очередь перечитается в цикле.
+        replay_from — контрольная точка полученных партиций, с нее догоняем пропущенное
+        """
+        owned = frozenset(owned)
+        if replay_from is not None:
+            self._replay_from = min(self._replay_from or replay_from, replay_from)
+        elif owned == self._owned:
+            return
+        self._owned = owned
+        self._needs_reload = True
+        self._wakeup.set()
+
+    def _push(self, kind: str, key: int, fire_at: datetime):
+        if self._fired.get((kind, key)) == fire_at:
+            return
+        # события за горизонтом подтянет следующая подгрузка окна
+        if self._loaded_until and fire_at >= self._loaded_until:
+            self._cancel(kind, key)
+            return
+        seq = next(self._counter)
+        self._entries[(kind, key)] = seq
+        heapq.heappush(self._heap, (fire_at, seq, kind, key))
+        # новое событие раньше текущего ближайшего — будим цикл
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def _cancel(self, kind: str, key: int):
+        self._entries.pop((kind, key), None)
+        self._failed.pop((kind, key), None)
+        # чистим кучу, если в ней накопилось много отмененных записей
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [
+                e for e in self._heap
+                if self._entries.get((e[2], e[3])) == e[1]
+            ]
+            heapq.heapify(self._heap)
+
+    def _catchup_from(self) -> datetime:
+        return datetime.utcnow() - timedelta(minutes=NOTIFY_CATCHUP_MINUTES)
+
+    def _schedule_task(self, task: Task, after: datetime):
+        self._cancel(REMIND, task.id)
+        if task.is_completed or not task.remind_at_utc or not self.owns(task.user_id):
+            return
+        if task.remind_at_utc >= after:
+            self._push(REMIND, task.id, task.remind_at_utc)
+
+    # ================= загрузка и обновления =================
+
+    async def _load_window(self, start: datetime, end: datetime):
+        """Подгрузить из БД все события окна [start, end)"""
+        shard = self._shard()
+        if shard is not None and not shard[1]:
+            return
+        count = 0
+        async for settings, fire_at in iter_due_digests(start, end, shard=shard):
+            self._push(DIGEST, settings.user_id, fire_at)
+            count += 1
+        async for settings, task, fire_at in iter_due_reminders(start, end, shard=shard):
+            self._push(REMIND, task.id, fire_at)
+            count += 1
+        logger.info(f"загружено {count} уведомлений на {start:%H:%M}-{end:%H:%M} UTC")
+
+    async def _extend(self, now: datetime, since: datetime | None = None):
+        """Сдвинуть горизонт вперед, если он подходит к концу"""
+        horizon = timedelta(minutes=NOTIFY_HORIZON_MINUTES)
+        if self._loaded_until is None:
+            start = since or self._catchup_from()
+        elif now >= self._loaded_until:
+            start = self._loaded_until
+        else:
+            return
+        end = now + horizon
+        # окна не пересекаются, поэтому каждое событие загружается один раз
+        self._loaded_until = end
+        await self._load_window(start, end)
+
+    async def load(self):
+        """Заполнить очередь из БД при старте"""
+        await self._extend(datetime.utcnow())
+
+    async def reload(self):
+        """
+        Перечитать очередь из БД с окна догоняния: подхватить партиции, доставшиеся
+        от другого воркера, и задачи, измененные в других процессах.
+        Уже сработавшие события не повторяются (self._fired и журнал).
+        Для новых партиций окно начинается с их контрольной точки, а если есть
+        неотправленные события — с самого раннего из них (не раньше NOTIFY_REPLAY_HOURS);
+        недоставленные записи журнала досылаются
+        """
+        now = datetime.utcnow()
+        replay_limit = now - timedelta(hours=NOTIFY_REPLAY_HOURS)
+        since = self._catchup_from()
+        if self._replay_from is not None:
+            since = min(since, max(self._replay_from, replay_limit))
+        if self._failed:
+            since = min(since, max(min(self._failed.values()), replay_limit))
+            # неотправленные события загрузятся заново из окна (только своих партиций)
+            for event in self._failed:
+                self._fired.pop(event, None)
+        self._replay_from = None
+        self._needs_reload = False
+        self._reloaded_at = time.monotonic()
+        self._heap = []
+        self._entries = {}
+        self._loaded_until = None
+        self._loaded_partitions = self._owned
+        self._fired = {k: at for k, at in self._fired.items() if at >= since}
+        self._changes_since = now
+        self._replayed_until = None
+        await self._extend(now, since=since)
+        self._failed = {}
+        await self._replay_pending(replay_limit)
+        self._wakeup.set()
+
+    async def refresh(self):
+        """
+        Подхватить изменения из других процессов без перечитывания окна: задачи и настройки,
+        измененные с прошлого обновления, и строки журнала, появившиеся с прошлого прохода.
+        Удаленные задачи не видны, но при срабатывании их уже нет в БД — событие пропускается
+        """
+        if self._changes_since is None:
+            await self.reload()
+            return
+        now = datetime.utcnow()
+        since = self._changes_since - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+        self._changes_since = now
+        self._reloaded_at = time.monotonic()
+        catchup = self._catchup_from()
+        self._fired = {k: at for k, at in self._fired.items() if at >= catchup}
+
+        shard = self._shard()
+        if shard is None or shard[1]:
+            async for task in iter_changed_tasks(since, shard=shard):
+                self._schedule_task(task, catchup)
+            async for settings in iter_changed_settings(since, shard=shard):
+                if settings.next_digest_utc:
+                    self._push(DIGEST, settings.user_id, settings.next_digest_utc)
+        await self._replay_pending(now - timedelta(hours=NOTIFY_REPLAY_HOURS))
+
+    def update_task(self, task: Task):
+        """Задача создана или изменена"""
+        self._schedule_task(task, self._catchup_from())
+
+    def remove_task(self, task_id: int):
+        """Задача выполнена или удалена"""
+        self._cancel(REMIND, task_id)
+
+    async def update_user(self, user_id: int, session: AsyncSession | None = None):
+        """Изменились настройки пользователя — пересчитываем его события"""
+        if not self.owns(user_id):
+            return
+        settings = await get_user_settings(user_id, session=session)
+        if not settings:
+            return
+        # то, что уже прошло, при смене настроек не досылаем
+        after = datetime.utcnow()
+        self._push(DIGEST, user_id, settings.next_digest_utc)
+        for task in await get_tasks_to_remind(user_id, session=session):
+            self._schedule_task(task, after)
+
+    # ================= цикл =================
+
+    def _pop_due(self, now: datetime) -> list:
+        """Достать все события, время которых наступило (включая пропущенные)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, seq, kind, key = heapq.heappop(self._heap)
+            if self._entries.get((kind, key)) != seq:
+                continue
+            del self._entries[(kind, key)]
+            self._fired[(kind, key)] = fire_at
+            due.append((fire_at, kind, key))
+        return due
+
+    # ================= склейка, отправка и журнал =================
+
+    @staticmethod
+    async def _open_tasks(task_ids: list[int]) -> dict:
+        """Задачи напоминаний одним запросом; удаленные и выполненные уже не актуальны"""
+        tasks = await get_tasks_by_ids(task_ids)
+        return {task_id: task for task_id, task in tasks.items() if not task.is_completed}
+
+    async def _coalesce(self, due: list) -> tuple[dict, dict]:
+        """
+        Сгруппировать наступившие события по пользователям, чтобы у каждого все ушло
+        одним сообщением. Раньше времени события не берем: склеиваются только те,
+        что наступили к этому проходу (в том числе пропущенные).
+        Возвращает ({user_id: [(fire_at, kind, key)]}, {task_id: Task})
+        """
+        tasks = await self._open_tasks([key for _, kind, key in due if kind == REMIND])
+        by_user = {}
+        for fire_at, kind, key in due:
+            if kind == DIGEST:
+                user_id = key
+            elif key in tasks:
+                user_id = tasks[key].user_id
+            else:
+                continue
+            by_user.setdefault(user_id, []).append((fire_at, kind, key))
+        return by_user, tasks
+
+    @staticmethod
+    async def _day_tasks(user_id: int, fire_at: datetime) -> list[Task]:
+        """Задачи на день ежедневного уведомления (по местной дате пользователя)"""
+        settings = await get_user_settings(user_id)
+        if not settings:
+            return []
+        local_date = utc_to_local(fire_at, user_tz(settings)).date()
+        return await get_tasks_for_day(user_id, local_date)
+
+    @staticmethod
+    def _compose(reminders: list[Task], day_tasks: list[Task]) -> tuple[str, InlineKeyboardMarkup]:
+        """Текст и кнопки (✅/🗑 на каждую задачу) общего сообщения пользователю"""
+        reminder_ids = {t.id for t in reminders}
+        day_tasks = [t for t in day_tasks if t.id not in reminder_ids]
+        text, ids = Formater.format_notification(reminders, day_tasks, MAX_NOTIFICATION_ROWS, LIST_ROW_LENGTH)
+        if len(reminders) == 1 and not day_tasks:
+            return text, task_inline(ids[0])
+        return text, tasks_list_inline(ids)
+
+    async def _send_user(self, user_id: int, events: list, tasks: dict):
+        """
+        Все события пользователя: записать в журнал одной транзакцией и отправить одним сообщением.
+        Каждое событие занимается отдельно: уже записанные (в том числе другим воркером
+        одновременно) пропускаются, остальные уходят
+        """
+        digest_at = max((fire_at for fire_at, kind, _ in events if kind == DIGEST), default=None)
+        day_tasks = await self._day_tasks(user_id, digest_at) if digest_at else []
+
+        async with get_session() as s:
+            claimed = []
+            for fire_at, kind, key in events:
+                # пустое ежедневное уведомление записываем сразу как dropped
+                status = SENT_DROPPED if kind == DIGEST and not day_tasks else SENT_PENDING
+                sent_id = await claim_notification(kind, key, user_id, fire_at, status=status, session=s)
+                if sent_id is None:
+                    logger.info(f"{kind}:{key} на {fire_at} уже в журнале, пропускаем")
+                    continue
+                claimed.append((sent_id, kind, key, status))
+            next_at = None
+            if any(kind == DIGEST for _, kind, _, _ in claimed):
+                # перенос на следующий день — в той же транзакции
+                next_at = await advance_digest(user_id, digest_at, session=s)
+            await s.commit()
+
+        if next_at:
+            self._push(DIGEST, user_id, next_at)
+        pending = [(sent_id, kind, key) for sent_id, kind, key, status in claimed if status == SENT_PENDING]
+        reminders = [tasks[key] for _, kind, key in pending if kind == REMIND]
+        with_digest = any(kind == DIGEST for _, kind, _ in pending)
+        if not reminders and not with_digest:
+            return
+        text, markup = self._compose(reminders, day_tasks if with_digest else [])
+        self._deliver(user_id, pending, text, markup)
+
+    def _deliver(self, user_id: int, events: list, text: str, markup: InlineKeyboardMarkup):
+        """Отправить через очередь и отметить результат в журнале, когда Telegram ответит"""
+        future = send_queue.submit_message(self.bot, user_id, text, reply_markup=markup)
+        NOTIFICATION_MESSAGES.inc()
+        for _, kind, _ in events:
+            NOTIFICATIONS_SENT.inc(kind=kind)
+        sent_ids = [sent_id for sent_id, _, _ in events]
+        tracker = asyncio.create_task(self._track(sent_ids, future))
+        for sent_id in sent_ids:
+            self._pending[sent_id] = tracker
+
+    async def _track(self, sent_ids: list[int], future: asyncio.Future):
+        try:
+            try:
+                await future
+            except (TelegramForbiddenError, TelegramBadRequest):
+                # бот заблокирован или чат недоступен — повторять бесполезно
+                status = SENT_DROPPED
+            except Exception:
+                # сеть, 5xx, исчерпаны повторы 429 — остается pending; следующий проход
+                # просмотрит журнал с начала окна, чтобы дослать
+                self._replayed_until = None
+                return
+            else:
+                status = SENT_DONE
+            await finish_notifications(sent_ids, status)
+        except Exception:
+            logger.exception(f"не удалось обновить журнал уведомлений {sent_ids}")
+        finally:
+            for sent_id in sent_ids:
+                self._pending.pop(sent_id, None)
+
+    async def _replay_pending(self, since: datetime):
+        """Дослать записи журнала, которые так и остались pending (процесс упал до отправки)"""
+        shard = self._shard()
+        if shard is not None and not shard[1]:
+            return
+        created_before = datetime.utcnow() - timedelta(seconds=REDELIVER_AFTER_SECONDS)
+        by_user = {}
+        # следующий проход продолжит отсюда; строки, которые еще отправляются, посмотрим снова
+        replayed_until = created_before
+        async for row in iter_pending_notifications(since, created_before, shard=shard, created_from=self._replayed_until):
+            if row.id in self._pending:
+                replayed_until = min(replayed_until, row.created_at)
+            else:
+                by_user.setdefault(row.user_id, []).append(row)
+        self._replayed_until = replayed_until
+
+        tasks = await self._open_tasks([
+            row.key for rows in by_user.values() for row in rows if row.kind == REMIND
+        ])
+
+        for user_id, rows in by_user.items():
+            digest_at = max((r.scheduled_at for r in rows if r.kind == DIGEST), default=None)
+            day_tasks = await self._day_tasks(user_id, digest_at) if digest_at else []
+            events, reminders, dropped = [], [], []
+            for row in rows:
+                task = tasks.get(row.key) if row.kind == REMIND else None
+                if task:
+                    reminders.append(task)
+                elif row.kind == REMIND or not day_tasks:
+                    dropped.append(row.id)
+                    continue
+                events.append((row.id, row.kind, row.key))
+            if dropped:
+                await finish_notifications(dropped, SENT_DROPPED)
+            if events:
+                text, markup = self._compose(reminders, day_tasks)
+                self._deliver(user_id, events, text, markup)
+        if by_user:
+            logger.info(f"досылаем недоставленные уведомления {len(by_user)} пользователям")
+
+    async def wait_delivered(self, timeout: float) -> bool:
+        """Дождаться ответа Telegram по отправленным уведомлениям (чтобы журнал не остался pending)"""
+        if self._pending:
+            await asyncio.wait(set(self._pending.values()), timeout=timeout)
+        return not self._pending
+
+    async def _fire_due(self, due: list) -> list:
+        """Наступившие события: склеить по пользователям и отправить. Возвращает неотправленные"""
+        by_user, tasks = await self._coalesce(due)
+        failed = []
+        for user_id, events in by_user.items():
+            try:
+                await self._send_user(user_id, events, tasks)
+            except Exception:
+                logger.exception(f"не удалось отправить уведомления пользователю {user_id}")
+                failed.extend(events)
+        return failed
+
+    def _postpone(self, failed: list):
+        """Неотправленные события повторим через RETRY_SECONDS (журнал не даст отправить дважды)"""
+        for fire_at, kind, key in failed:
+            self._failed[(kind, key)] = fire_at
+        if failed:
+            self._retry_at = datetime.utcnow() + timedelta(seconds=RETRY_SECONDS)
+
+    def _take_failed(self, now: datetime) -> list:
+        """Неотправленные события, если пора повторить"""
+        if not self._failed or now < self._retry_at:
+            return []
+        failed = [(fire_at, kind, key) for (kind, key), fire_at in self._failed.items()]
+        self._failed = {}
+        return failed
+
+    def stop(self):
+        """Остановить цикл после текущего прохода (уже начатые отправки дойдут до очереди)"""
+        self._stopping = True
+        self._wakeup.set()
+
+    async def _tick(self):
+        """Один проход: обновить очередь, отправить наступившее, сдвинуть контрольную точку"""
+        if self._needs_reload:
+            await self.reload()
+        elif NOTIFY_REFRESH_SECONDS and time.monotonic() - self._reloaded_at >= NOTIFY_REFRESH_SECONDS:
+            await self.refresh()
+        await self._extend(datetime.utcnow())
+        now = datetime.utcnow()
+        due = self._pop_due(now) + self._take_failed(now)
+        if due:
+            try:
+                failed = await self._fire_due(due)
+            except Exception:
+                # не удалось даже склеить события (БД недоступна) — повторим все
+                self._postpone(due)
+                raise
+            self._postpone(failed)
+        if self._loaded_partitions:
+            # контрольная точка не обгоняет самое раннее неотправленное событие
+            self._checkpoint = (self._loaded_partitions, min([now, *self._failed.values()]))
+
+    def _sleep_seconds(self) -> float:
+        """Сколько спать до следующего прохода"""
+        wake_at = self._loaded_until
+        if self._heap:
+            wake_at = min(wake_at, self._heap[0][0])
+        if self._failed:
+            wake_at = min(wake_at, self._retry_at)
+        delay = (wake_at - datetime.utcnow()).total_seconds()
+        if NOTIFY_REFRESH_SECONDS:
+            delay = min(delay, NOTIFY_REFRESH_SECONDS)
+        return max(0, min(delay, MAX_SLEEP_SECONDS))
+
+    async def run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            start = time.perf_counter()
+            try:
+                await self._tick()
+                timeout = self._sleep_seconds()
+            except Exception:
+                # сбой БД и т.п. не должен останавливать уведомления: перечитаем очередь
+                logger.exception("сбой прохода планировщика уведомлений, перечитаем очередь")
+                self._needs_reload = True
+                timeout = RETRY_SECONDS
+            NOTIFY_TICK.observe(time.perf_counter() - start)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class PartitionLeases:
+    """
+    Аренда партиций уведомлений в БД (notification_leases).
+    Каждый воркер раз в NOTIFY_LEASE_RENEW_SECONDS отмечается живым, продлевает
+    свои партиции и добирает свободные или просроченные до справедливой доли
+    (partitions / живых воркеров), лишние отпускает. Если воркер умер, его аренда
+    истекает через NOTIFY_LEASE_TTL_SECONDS и партиции забирают остальные.
+    Вместе с арендой сохраняется контрольная точка планировщика: новый владелец
+    партиции догоняет события с нее.
+    """
+
+    def __init__(self, scheduler: ReminderScheduler, partitions: int = NOTIFY_PARTITIONS,
+                 ttl: float = NOTIFY_LEASE_TTL_SECONDS, renew_every: float = NOTIFY_LEASE_RENEW_SECONDS,
+                 worker_id: str | None = None):
+        self.scheduler = scheduler
+        self.partitions = partitions
+        self.ttl = timedelta(seconds=ttl)
+        self.renew_every = renew_every
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owned: set[int] = set()
+        # до какого момента аренда точно наша (если продлить не удается — отпускаем все)
+        self._valid_until: datetime | None = None
+        self._stopping = asyncio.Event()
+
+    async def tick(self):
+        """Один проход: heartbeat, продление, перебалансировка"""
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        live = await heartbeat_worker(self.worker_id, now, alive_after=now - self.ttl)
+        share = math.ceil(self.partitions / max(len(live), 1))
+
+        await self._save_checkpoint()
+        leases = await get_leases(self.partitions)
+        mine = sorted(l.partition for l in leases if l.owner == self.worker_id)
+        # лишнее сверх доли отпускаем с конца, чтобы его забрали новые воркеры
+        extra = mine[share:]
+        if extra:
+            await release_leases(self.worker_id, extra)
+        owned = set()
+        for partition in mine[:share]:
+            if await acquire_lease(partition, self.worker_id, now, expires_at):
+                owned.add(partition)
+        free = [l.partition for l in leases if l.owner is None or l.expires_at is None or l.expires_at < now]
+        for partition in free:
+            if len(owned) >= share:
+                break
+            if await acquire_lease(partition, self.worker_id, now, expires_at):
+                owned.add(partition)
+
+        self._valid_until = expires_at
+        gained = owned - self.owned
+        if owned != self.owned:
+            logger.info(f"{self.worker_id}: партиции {sorted(owned)} (живых воркеров {len(live)})")
+        self.owned = owned
+        checkpoints = [l.checkpoint_at for l in leases if l.partition in gained and l.checkpoint_at]
+        self.scheduler.set_partitions(owned, replay_from=min(checkpoints, default=None))
+
+    async def _save_checkpoint(self):
+        checkpoint = self.scheduler.checkpoint
+        if checkpoint:
+            partitions, at = checkpoint
+            await save_checkpoint(self.worker_id, partitions & self.owned, at)
+
+    async def run(self):
+        await ensure_lease_partitions(self.partitions)
+        while not self._stopping.is_set():
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("не удалось продлить аренду партиций")
+                if self._valid_until and datetime.utcnow() >= self._valid_until:
+                    # аренда истекла — партиции уже могут быть у другого воркера
+                    self.owned = set()
+                    self.scheduler.set_partitions(())
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.renew_every)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        """Отпустить партиции сразу, не дожидаясь истечения аренды"""
+        self._stopping.set()
+        self.scheduler.set_partitions(())
+        try:
+            await self._save_checkpoint()
+            await release_leases(self.worker_id, self.owned)
+            await remove_worker(self.worker_id)
+        except Exception:
+            logger.exception("не удалось отпустить партиции")
+        self.owned = set()
+
+
+# пока аренда не выдала партиции, планировщик не ведет никого
+# (в процессах без цикла уведомлений очередь так и остается пустой)
+scheduler = ReminderScheduler(owned=frozenset())
+
+registry.register(Gauge(
+    "notification_partitions_owned", "Сколько партиций уведомлений ведет этот процесс",
+    callback=lambda: {(): len(scheduler.owned or ())},
+))
+
+
+async def notification_loop(bot: Bot):
+    """
+    Цикл уведомлений: аренда партиций + планировщик по своим партициям.
+    bot — бот процесса (bot.py или worker.py), отдельную сессию Telegram не создаем
+    """
+    scheduler.bot = bot
+    leases = PartitionLeases(scheduler)
+    leases_task = asyncio.create_task(leases.run())
+    try:
+        await scheduler.load()
+        await scheduler.run()
+    finally:
+        # отпускаем партиции только после ответа Telegram, иначе новый владелец дошлет дубль
+        if not await scheduler.wait_delivered(SHUTDOWN_TIMEOUT):
+            logger.warning("не дождались отправки части уведомлений, они останутся pending")
+        await leases.stop()
+        await leases_task
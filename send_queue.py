@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST
+from metrics import Gauge, SEND_QUEUE_WAIT, registry
+
+logger = logging.getLogger(__name__)
+
+# полосы приоритета: ответы пользователю идут раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# сколько раз повторять отправку после 429
+MAX_RETRY_AFTER_ATTEMPTS = 5
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # до этого момента ведро заблокировано (RetryAfter от Telegram)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько ждать до следующего токена (0 — можно отправлять)"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class _Outgoing:
+    """Одно сообщение в очереди"""
+
+    __slots__ = ("chat_id", "priority", "factory", "future", "attempts", "enqueued_at")
+
+    def __init__(self, chat_id: int, priority: int, factory: Callable[[], Awaitable], future: asyncio.Future):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.factory = factory
+        self.future = future
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+class SendQueue:
+    """
+    Общая очередь исходящих сообщений в Telegram.
+    Ограничивает скорость глобально и для каждого чата (token bucket),
+    обрабатывает RetryAfter и отдает интерактивным ответам приоритет над рассылками.
+    Сообщения одного чата и одной полосы уходят строго по порядку.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float):
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chat_buckets: dict[int, TokenBucket] = {}
+
+        # (chat_id, priority) -> очередь сообщений этой полосы чата
+        self._lanes: dict[tuple[int, int], deque] = {}
+        # готовые к отправке полосы: (priority, seq, chat_id)
+        self._ready = []
+        # полосы, которые ждут токен чата: (когда, priority, seq, chat_id)
+        self._delayed = []
+        # чаты, у которых сообщение сейчас в полете
+        self._busy: set[int] = set()
+
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # ссылки на задачи отправки, чтобы их не собрал сборщик мусора
+        self._inflight: set[asyncio.Task] = set()
+
+    # ================= постановка в очередь =================
+
+    def enqueue(self, chat_id: int, factory: Callable[[], Awaitable], priority: int = INTERACTIVE) -> asyncio.Future:
+        """
+        Поставить отправку в очередь. factory создает корутину запроса к Telegram.
+        Ошибку отправки получает тот, кто ждет future; если его никто не ждет,
+        asyncio сам залогирует "exception was never retrieved"
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+
+        key = (chat_id, priority)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            heapq.heappush(self._ready, (priority, next(self._counter), chat_id))
+        lane.append(_Outgoing(chat_id, priority, factory, future))
+        self._wakeup.set()
+        return future
+
+    def submit_message(self, bot: Bot, chat_id: int, text: str, priority: int = BULK, **kwargs) -> asyncio.Future:
+        """bot.send_message через очередь, не дожидаясь отправки"""
+        return self.enqueue(chat_id, lambda: bot.send_message(chat_id, text, **kwargs), priority)
+
+    async def answer(self, message: Message, text: str, priority: int = INTERACTIVE, **kwargs) -> Message:
+        """message.answer через очередь, ждет отправки и возвращает сообщение"""
+        return await self.enqueue(message.chat.id, lambda: message.answer(text, **kwargs), priority)
+
+    def qsize(self) -> int:
+        """Сколько сообщений ждет отправки"""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def depth(self) -> dict[int, int]:
+        """Глубина очереди по полосам приоритета"""
+        result = {INTERACTIVE: 0, BULK: 0}
+        for (_, priority), lane in self._lanes.items():
+            result[priority] = result.get(priority, 0) + len(lane)
+        return result
+
+    async def drain(self, timeout: float) -> bool:
+        """Дождаться, пока очередь опустеет и все отправки завершатся; True, если успели"""
+        deadline = time.monotonic() + timeout
+        while self.qsize() or self._inflight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    # ================= отправка =================
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                now = time.monotonic()
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items() if not b.is_idle(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _requeue(self, chat_id: int, priority: int, at: float | None = None):
+        """Вернуть полосу чата в расписание (сразу или с задержкой)"""
+        if (chat_id, priority) not in self._lanes:
+            return
+        seq = next(self._counter)
+        if at is None:
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+        else:
+            heapq.heappush(self._delayed, (at, priority, seq, chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, chat_id = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, chat_id))
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            priority, _, chat_id = heapq.heappop(self._ready)
+            if (chat_id, priority) not in self._lanes or chat_id in self._busy:
+                # полоса вернется в расписание, когда закончится текущая отправка
+                continue
+
+            bucket = self._chat_bucket(chat_id)
+            chat_wait = bucket.wait_time(now)
+            if chat_wait > 0:
+                self._requeue(chat_id, priority, now + chat_wait)
+                continue
+
+            lane = self._lanes[(chat_id, priority)]
+            item = lane.popleft()
+            if not lane:
+                del self._lanes[(chat_id, priority)]
+
+            if not item.attempts:
+                SEND_QUEUE_WAIT.observe(now - item.enqueued_at, priority=PRIORITY_NAMES[priority])
+            self._global.take()
+            bucket.take()
+            self._busy.add(chat_id)
+            task = asyncio.create_task(self._send(item))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, item: _Outgoing):
+        try:
+            result = await item.factory()
+        except TelegramRetryAfter as e:
+            item.attempts += 1
+            logger.warning(f"429 для чата {item.chat_id}, ждем {e.retry_after} с")
+            self._chat_bucket(item.chat_id).blocked_until = time.monotonic() + e.retry_after
+            if item.attempts < MAX_RETRY_AFTER_ATTEMPTS:
+                # возвращаем сообщение в начало полосы, порядок не ломается
+                key = (item.chat_id, item.priority)
+                if key not in self._lanes:
+                    self._lanes[key] = deque()
+                self._lanes[key].appendleft(item)
+            elif not item.future.done():
+                item.future.set_exception(e)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self._busy.discard(item.chat_id)
+            for priority in (INTERACTIVE, BULK):
+                self._requeue(item.chat_id, priority)
+
+
+send_queue = SendQueue(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST)
+
+registry.register(Gauge(
+    "send_queue_depth", "Сообщений в очереди отправки", ("priority",),
+    callback=lambda: {(PRIORITY_NAMES[p],): n for p, n in send_queue.depth().items()},
+))
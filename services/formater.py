@@ -1,7 +1,10 @@
+import json
+
 from models import Task, ShoppingItem
 from keyboards import READABLE_CATEGORIES
-from database import get_user_settings, get_task_by_id, get_item_by_id
-from datetime import datetime, timedelta, timezone
+from database import get_user_settings, get_task_by_id, get_item_by_id, user_tz
+from datetime import datetime, time
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import logging 
 logger = logging.getLogger(__name__)
@@ -15,7 +18,20 @@ class Formater:
     """
 
     @staticmethod
-    def make_description(id: int, type: str, dt_string: str, request: str) -> str | None:
+    def _llm_value(value) -> str:
+        """Значение поля для LLM: пустое — пустая строка, время — без секунд"""
+        if value is None:
+            return ""
+        if isinstance(value, time):
+            return value.strftime("%H:%M")
+        return str(value)
+
+    @staticmethod
+    def _llm_json(data: dict) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    async def make_description(id: int, type: str, dt_string: str, request: str, session: AsyncSession | None = None) -> str | None:
         """
         запрос пользователя для редактирования задачи
         id - id объекта
@@ -26,49 +42,40 @@ class Formater:
 
         if type == "tasks":
             logger.info("создаю запрос пользователя в LLM для задачи")
-            task = get_task_by_id(id)
+            task = await get_task_by_id(id, session=session)
             if not task:
                 return None
-            description = f'''
-            Сегодня {dt_string}. Вот моя задача:
-            {{
-            "type": "tasks",
-            "items": [
-                {{
-                "category": "{task.category}",
-                "date": "{task.deadline_day}",
-                "time": "{task.deadline_time}",
-                "remind_date": "{task.remind_date}",
-                "remind_time": "{task.remind_time}",
-                "task": "{task.description}"
-                }}
-            ]
-            }}
-            Вот моя просьба: {request}
-            '''
+            current = {
+                "type": "tasks",
+                "items": [{
+                    "category": task.category,
+                    "date": Formater._llm_value(task.deadline_day),
+                    "time": Formater._llm_value(task.deadline_time),
+                    "remind_date": Formater._llm_value(task.remind_date),
+                    "remind_time": Formater._llm_value(task.remind_time),
+                    "task": task.description,
+                }],
+            }
+            # компактный JSON в том же виде, что примеры в EDIT_SYSTEM_PROMPT
+            description = f"Сегодня {dt_string}. Вот моя задача: {Formater._llm_json(current)} Вот моя просьба: {request}"
             logger.debug(f"итоговый текст: {description}")
             return description
         elif type == "shopping_list":
             logger.info("создаю запрос пользователя в LLM для покупки")
-            item = get_item_by_id(id)
+            item = await get_item_by_id(id, session=session)
             if not item:
                 return None
             
-            description = f'''
-            Сегодня {dt_string}. Вот моя покупка:
-            {{
-            "type": "shopping_list",
-            "items": [
-                {{
-                "category": {item.category},
-                "item": {item.item},
-                "amount": {item.amount},
-                "unit": {item.unit}
-                }}
-            ]
-            }}
-            Вот моя просьба: {request}
-            '''
+            current = {
+                "type": "shopping_list",
+                "items": [{
+                    "category": item.category,
+                    "item": item.item,
+                    "amount": Formater._llm_value(item.amount),
+                    "unit": Formater._llm_value(item.unit),
+                }],
+            }
+            description = f"Сегодня {dt_string}. Вот моя покупка: {Formater._llm_json(current)} Вот моя просьба: {request}"
             logger.debug(f"итоговый текст: {description}")
             return description
         else:
@@ -76,8 +83,16 @@ class Formater:
             return None
 
     @staticmethod
-    def get_user_time(user_id: int) -> str | None:
-        logger.info("получаем день, дату и время для LLM")
+    async def get_user_now(user_id: int, session: AsyncSession | None = None) -> datetime | None:
+        """Текущее локальное время пользователя"""
+        settings = await get_user_settings(user_id, session=session)
+        if not settings:
+            return None
+        return datetime.now(user_tz(settings))
+
+    @staticmethod
+    def format_user_time(user_datetime: datetime) -> str:
+        """Строка с днем недели, датой и временем для LLM"""
         WEEKDAYS_RU = {
             0: "Понедельник",
             1: "Вторник",
@@ -88,14 +103,6 @@ class Formater:
             6: "Воскресенье",
         }
 
-        settings = get_user_settings(user_id)
-        if not settings:
-            return None
-
-        # Часовой пояс пользователя
-        user_tz = timezone(timedelta(hours=settings.utc_offset))
-        user_datetime = datetime.now(user_tz)
-
         # День недели
         weekday_ru = WEEKDAYS_RU[user_datetime.weekday()]
         weekday_en = user_datetime.strftime("%A")
@@ -107,7 +114,15 @@ class Formater:
         return dt_string
 
     @staticmethod
-    def format_task(task: Task, make_task: bool) -> str:
+    async def get_user_time(user_id: int, session: AsyncSession | None = None) -> str | None:
+        logger.info("получаем день, дату и время для LLM")
+        user_datetime = await Formater.get_user_now(user_id, session=session)
+        if not user_datetime:
+            return None
+        return Formater.format_user_time(user_datetime)
+
+    @staticmethod
+    def format_task(task: Task, make_task: bool, changed: bool = True) -> str:
 
         logger.info("формирую сообщение о создании/редактировании задачи")
 
@@ -117,9 +132,14 @@ class Formater:
         remind_date_str=task.remind_date.strftime("%d-%m-%Y") if task.remind_date else 'Нет'
         remind_time = task.remind_time.strftime("%H:%M") if task.remind_time else 'Нет'
 
-        status = "добавлена" if make_task else "обновлена"
+        if make_task:
+            header = "✅ **Задача добавлена!**"
+        elif changed:
+            header = "✅ **Задача обновлена!**"
+        else:
+            header = "📝 **Задача**"
         response_text = (
-            f"✅ **Задача {status}!**\n\n"
+            f"{header}\n\n"
             f"📝 **Что:** {task.description}\n"
             f"📁 **Категория:** {cat_text}\n"
             f"📅 **Дата:** {date_text}\n"
@@ -132,7 +152,7 @@ class Formater:
         return response_text
     
     @staticmethod
-    def format_shopping_list(item: ShoppingItem) -> str:
+    def format_shopping_list(item: ShoppingItem, changed: bool = True) -> str:
 
         logger.info("формирую сообщение о создании/редактировании покупки")
 
@@ -153,7 +173,7 @@ class Formater:
         cat_display = categories_map.get(item.category, item.category or "Не указана")
 
         response_text = (
-            f"🛒 **Товар добавлен в список!**\n\n"
+            f"{'🛒 **Товар добавлен в список!**' if changed else '🛒 **Товар в списке**'}\n\n"
             f"📦 **Что:** {item.item}\n"
             f"🔢 **Кол-во:** {quantity_text}\n"
             f"📁 **Категория:** {cat_display}\n"
@@ -165,6 +185,47 @@ class Formater:
     
     
 
+    @staticmethod
+    def _cut_row(row: str, max_length: int) -> str:
+        return row if len(row) <= max_length else row[:max_length - 1] + "…"
+
+    @staticmethod
+    def format_tasks(tasks: list[Task], max_rows: int, max_length: int) -> str:
+        """Одно сообщение о нескольких добавленных задачах (первые max_rows, остальные — числом)"""
+        logger.info("формирую сообщение о создании нескольких задач")
+
+        lines = [f"✅ **Добавлено задач: {len(tasks)}**\n"]
+        for n, task in enumerate(tasks[:max_rows], 1):
+            when = " ".join(filter(None, (
+                task.deadline_day.strftime("%d-%m-%Y") if task.deadline_day else None,
+                task.deadline_time.strftime("%H:%M") if task.deadline_time else None,
+            )))
+            line = f"{n}. 📝 {task.description}"
+            if when:
+                line += f" — 📅 {when}"
+            if task.remind_time:
+                line += " 🚨"
+            lines.append(Formater._cut_row(line, max_length))
+        if len(tasks) > max_rows:
+            lines.append(f"…и еще {len(tasks) - max_rows}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_shopping_items(items: list[ShoppingItem], max_rows: int, max_length: int) -> str:
+        """Одно сообщение о нескольких добавленных покупках (первые max_rows, остальные — числом)"""
+        logger.info("формирую сообщение о создании нескольких покупок")
+
+        lines = [f"🛒 **Добавлено в список: {len(items)}**\n"]
+        for n, item in enumerate(items[:max_rows], 1):
+            line = f"{n}. 📦 {item.item}"
+            if item.amount:
+                amount_val = int(item.amount) if item.amount.is_integer() else item.amount
+                line += f" — {amount_val} {item.unit or ''}".rstrip()
+            lines.append(Formater._cut_row(line, max_length))
+        if len(items) > max_rows:
+            lines.append(f"…и еще {len(items) - max_rows}")
+        return "\n".join(lines)
+
     @staticmethod
     def format_category_item(item: ShoppingItem) -> str:
         logger.info("определяю что хочет изменить пользователь")
@@ -178,6 +239,53 @@ class Formater:
         logger.debug(f"пользователь хочет изменить: {response_text}")
         return response_text
     
+    @staticmethod
+    def format_task_row(n: int, task: Task, is_day: bool, max_length: int) -> str:
+        """Строка задачи в списке-странице"""
+        if is_day:
+            when = task.deadline_time.strftime('%H:%M') if task.deadline_time else ""
+        else:
+            when = " ".join(filter(None, (
+                task.deadline_day.strftime('%d-%m-%Y') if task.deadline_day else "",
+                task.deadline_time.strftime('%H:%M') if task.deadline_time else "",
+            )))
+        row = f"{n}. {when} {task.description}" if when else f"{n}. {task.description}"
+        return row if len(row) <= max_length else row[:max_length - 1] + "…"
+
+    @staticmethod
+    def format_notification(reminders: list[Task], day_tasks: list[Task], max_rows: int, max_length: int) -> tuple[str, list[int]]:
+        """
+        Одно сообщение со всеми уведомлениями пользователя: напоминания и задачи на сегодня.
+        Возвращает текст и id показанных задач (по порядку номеров — для кнопок)
+        """
+        if len(reminders) == 1 and not day_tasks:
+            return f"⏰ Напоминание:\n{reminders[0].description}", [reminders[0].id]
+
+        lines, ids = [], []
+        for title, tasks in (("⏰ Напоминания:", reminders), ("🔔 Задачи на сегодня:", day_tasks)):
+            if not tasks:
+                continue
+            if lines:
+                lines.append("")
+            lines.append(title)
+            for task in tasks:
+                if len(ids) >= max_rows:
+                    break
+                ids.append(task.id)
+                lines.append(Formater.format_task_row(len(ids), task, is_day=True, max_length=max_length))
+        hidden = len(reminders) + len(day_tasks) - len(ids)
+        if hidden:
+            lines.append(f"…и еще {hidden}")
+        return "\n".join(lines), ids
+
+    @staticmethod
+    def format_item_row(n: int, item: ShoppingItem, max_length: int) -> str:
+        """Строка покупки в списке-странице"""
+        amount_val = int(item.amount) if item.amount and item.amount.is_integer() else item.amount
+        quantity_text = f" — {amount_val} {item.unit or ''}".rstrip() if item.amount else ""
+        row = f"{n}. {item.item}{quantity_text}"
+        return row if len(row) <= max_length else row[:max_length - 1] + "…"
+
     @staticmethod
     def format_short_task(task: Task, is_day: bool) -> str:
         if is_day:
@@ -1,9 +1,16 @@
 import re
-from database import get_task_by_id, get_item_by_id, delete_item, delete_task, save_task, save_shopping_item
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from database import (
+    get_task_by_id, get_item_by_id, delete_item, delete_task,
+    save_tasks, save_shopping_items, update_task_fields, update_item_fields
+)
 from .formater import Formater
 from .parser import Parser
 from models import Task, ShoppingItem
+from ai.errors import LLMBadResponse
 from ai.schemas import ItemLLMResponse, TaskLLMResponse
+from notifications import scheduler
 import logging
 logger = logging.getLogger(__name__)
 
@@ -14,55 +21,135 @@ class MessageService:
     """
 
     @staticmethod
-    def delete_entity(id:int, type: str, user_id: int):
+    async def delete_entity(id:int, type: str, user_id: int, session: AsyncSession | None = None):
         if type == "tasks":
-            delete_task(id, user_id)
+            if await delete_task(id, user_id, session=session):
+                scheduler.remove_task(int(id))
         elif type == "shopping_list":
-            delete_item(id, user_id)
+            await delete_item(id, user_id, session=session)
         else:
             logger.error(f"неизвестный тип для удаления: {type}")
             raise ValueError(f"неизвестная сущность {type}")
             
     @staticmethod
-    def make_save_new_entity(result: dict, user_id: int) -> Task | ShoppingItem | None:
+    def validate_items(result: dict) -> list[TaskLLMResponse] | list[ItemLLMResponse]:
+        """Проверить все элементы ответа LLM за один проход, битые пропускаем"""
         if result["type"] == "tasks":
-            data = result["items"][0]
+            schema = TaskLLMResponse
+        elif result["type"] == "shopping_list":
+            schema = ItemLLMResponse
+        else:
+            logger.error(f"попытка создать неизвестный тип! {result["type"]}")
+            raise ValueError(f"попытка создать неизвестный тип! {result["type"]}")
 
-            val_data = TaskLLMResponse(**data)
+        valid = []
+        for data in result.get("items") or []:
+            try:
+                valid.append(schema(**data))
+            except ValidationError as e:
+                logger.warning(f"пропускаю элемент {data}: {e}")
+        return valid
 
-            task = Task(
-                user_id=user_id,
-                description=val_data.task,
-                category=val_data.category,
-                deadline_day=val_data.deadline_date,
-                deadline_time=val_data.deadline_time,
-                remind_time=val_data.remind_time,
-                remind_date=val_data.remind_date
-            )
-            logger.debug("создал задачу")
-            # Сохраняем в БД
-            save_task(task)
-            logger.debug("сохранил задачу")
-            return task
-        elif result["type"] == "shopping_list":
-            data = result["items"][0]
+    @staticmethod
+    async def make_save_new_entities(result: dict, user_id: int, session: AsyncSession | None = None) -> list[Task] | list[ShoppingItem]:
+        """Создать и сохранить все элементы ответа LLM одной транзакцией"""
+        valid = MessageService.validate_items(result)
+        return await MessageService.save_valid_items(valid, user_id, session=session)
 
-            val_data = ItemLLMResponse(**data)
+    @staticmethod
+    def build_entities(valid: list[TaskLLMResponse] | list[ItemLLMResponse], user_id: int) -> list[Task] | list[ShoppingItem]:
+        """Несохраненные сущности из проверенных элементов ответа LLM (все одного типа)"""
+        if not valid:
+            return []
 
-            item = ShoppingItem(
+        if isinstance(valid[0], TaskLLMResponse):
+            return [
+                Task(
+                    user_id=user_id,
+                    description=val_data.task,
+                    category=val_data.category,
+                    deadline_day=val_data.deadline_date,
+                    deadline_time=val_data.deadline_time,
+                    remind_time=val_data.remind_time,
+                    remind_date=val_data.remind_date
+                )
+                for val_data in valid
+            ]
+        return [
+            ShoppingItem(
                 user_id = user_id,
                 category = val_data.category,
                 item = val_data.item,
-                amount = val_data.amount, # передаю строку, но алхимия преобразует во float
+                amount = val_data.amount,
                 unit = val_data.unit
             )
-            logger.debug("создал покупку")
-            save_shopping_item(item)
-            logger.debug("сохранил покупку")
-            return item
+            for val_data in valid
+        ]
+
+    @staticmethod
+    async def save_valid_items(valid: list[TaskLLMResponse] | list[ItemLLMResponse], user_id: int, session: AsyncSession | None = None) -> list[Task] | list[ShoppingItem]:
+        """Сохранить уже проверенные элементы ответа LLM (все одного типа)"""
+        entities = MessageService.build_entities(valid, user_id)
+        if not entities:
+            return []
+
+        if isinstance(entities[0], Task):
+            tasks = await save_tasks(entities, session=session)
+            logger.debug(f"сохранил задач: {len(tasks)}")
+            for task in tasks:
+                scheduler.update_task(task)
+            return tasks
         else:
-            logger.error(f"попытка создать неизвестный тип! {result["type"]}")
-            raise ValueError(f"попытка создать неизвестный тип! {result["type"]}")
+            items = await save_shopping_items(entities, session=session)
+            logger.debug(f"сохранил покупок: {len(items)}")
+            return items
+
+    @staticmethod
+    async def make_save_new_entity(result: dict, user_id: int, session: AsyncSession | None = None) -> Task | ShoppingItem | None:
+        """Создать одну сущность (первый элемент ответа), например при редактировании"""
+        first = dict(result, items=(result.get("items") or [])[:1])
+        entities = await MessageService.make_save_new_entities(first, user_id, session=session)
+        return entities[0] if entities else None
 
+    @staticmethod
+    async def update_entity(id: int, type: str, result: dict, user_id: int, session: AsyncSession | None = None) -> tuple[Task | ShoppingItem | None, bool]:
+        """
+        Изменить сущность на месте по ответу LLM.
+        Возвращает (сущность, были ли изменения); если ничего не поменялось (например, "покажи") — в БД не пишем.
+        Сущность None — ее уже нет в БД; ответ LLM не по схеме — LLMBadResponse.
+        """
+        # проверяем до удаления: при смене типа невалидный ответ не должен стереть старую сущность
+        valid = MessageService.validate_items(dict(result, items=(result.get("items") or [])[:1]))
+        if not valid:
+            raise LLMBadResponse(f"правка не прошла проверку: {result!r}")
+
+        if result["type"] != type:
+            # LLM поменяла тип (задачу на покупку) — на месте не обновить, пересоздаем
+            await MessageService.delete_entity(id, type, user_id, session=session)
+            return await MessageService.make_save_new_entity(result, user_id, session=session), True
+
+        val_data = valid[0]
 
+        if type == "tasks":
+            values = {
+                "description": val_data.task,
+                "category": val_data.category,
+                "deadline_day": val_data.deadline_date,
+                "deadline_time": val_data.deadline_time,
+                "remind_date": val_data.remind_date,
+                "remind_time": val_data.remind_time,
+            }
+            entity, changed = await update_task_fields(int(id), user_id, values, session=session)
+            if entity and changed:
+                scheduler.update_task(entity)
+        else:
+            values = {
+                "item": val_data.item,
+                "category": val_data.category,
+                "amount": val_data.amount,
+                "unit": val_data.unit,
+            }
+            entity, changed = await update_item_fields(int(id), user_id, values, session=session)
 
+        logger.debug(f"изменены поля: {changed}")
+        return entity, bool(changed)
@@ -0,0 +1,106 @@
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import LIST_PAGE_SIZE
+from database import get_tasks_by_category, get_item_by_category
+from keyboards import page_inline, READABLE_CATEGORIES, PURCHASE_CATEGORY_MAP
+from .formater import Formater
+from .task_service import TaskService
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Telegram принимает не больше 100 кнопок и 4096 символов в сообщении
+PAGE_SIZE = max(1, min(LIST_PAGE_SIZE, 30))
+MAX_MESSAGE_LENGTH = 4096
+ROW_LENGTH = max(40, (MAX_MESSAGE_LENGTH - 200) // PAGE_SIZE)
+# сообщения-списки без страниц (подтверждение добавления, уведомления): не больше стольких строк,
+# остальное — строкой "…и еще N"; по две кнопки на строку
+MAX_LIST_ROWS = 30
+LIST_ROW_LENGTH = (MAX_MESSAGE_LENGTH - 200) // MAX_LIST_ROWS
+
+PURCHASE_CATEGORY_NAMES = {code: name for name, code in PURCHASE_CATEGORY_MAP.items()}
+
+
+class Pager:
+    """
+    Списки задач и покупок одним сообщением по страницам.
+    view — что показываем: "day:0", "day:1", "week", "all", "cat:<категория задач>", "shop:<категория покупок>".
+    Из БД читается только одна страница (LIMIT/OFFSET), на строку больше, чтобы понять, есть ли следующая.
+    """
+
+    @staticmethod
+    async def load(view: str, user_id: int, page: int, session: AsyncSession) -> tuple[list, bool]:
+        offset = page * PAGE_SIZE
+        limit = PAGE_SIZE + 1
+        kind, _, arg = view.partition(":")
+
+        if kind == "day":
+            rows = await TaskService.get_day_tasks(user_id, int(arg), session=session, offset=offset, limit=limit)
+        elif kind == "week":
+            rows = await TaskService.get_week_task(user_id, session=session, offset=offset, limit=limit)
+        elif kind == "all":
+            rows = await TaskService.get_all_tasks(user_id, session=session, offset=offset, limit=limit)
+        elif kind == "cat":
+            rows = await get_tasks_by_category(user_id, arg, session=session, offset=offset, limit=limit)
+        elif kind == "shop":
+            rows = await get_item_by_category(user_id, arg, session=session, offset=offset, limit=limit)
+        else:
+            logger.error(f"неизвестный список: {view}")
+            raise ValueError(f"неизвестный список {view}")
+
+        return rows[:PAGE_SIZE], len(rows) > PAGE_SIZE
+
+    @staticmethod
+    def title(view: str) -> str:
+        kind, _, arg = view.partition(":")
+        if kind == "day":
+            return "📅 Задачи на сегодня" if arg == "0" else "🌅 Задачи на завтра"
+        if kind == "week":
+            return "📆 Задачи на неделю"
+        if kind == "all":
+            return "📋 Все задачи"
+        if kind == "cat":
+            return f"⏱ {READABLE_CATEGORIES.get(arg, arg)}"
+        return f"🛒 {PURCHASE_CATEGORY_NAMES.get(arg, arg)}"
+
+    @staticmethod
+    def empty_text(view: str) -> str:
+        kind = view.partition(":")[0]
+        if kind == "day":
+            return "Задач нет 🎉"
+        if kind == "week":
+            return "На неделю задач нет 🎉"
+        if kind == "shop":
+            return "Покупок нет"
+        return "Задач нет"
+
+    @staticmethod
+    def render(view: str, rows: list, page: int, has_next: bool) -> tuple[str, InlineKeyboardMarkup]:
+        is_items = view.startswith("shop:")
+        first_number = page * PAGE_SIZE + 1
+
+        lines = [Pager.title(view)]
+        if page > 0 or has_next:
+            lines[0] += f" (стр. {page + 1})"
+        lines.append("")
+        for n, row in enumerate(rows, first_number):
+            if is_items:
+                lines.append(Formater.format_item_row(n, row, ROW_LENGTH))
+            else:
+                lines.append(Formater.format_task_row(n, row, view.startswith("day:"), ROW_LENGTH))
+
+        markup = page_inline(view, page, [r.id for r in rows], first_number, is_items, has_next)
+        return "\n".join(lines), markup
+
+    @staticmethod
+    async def build(view: str, user_id: int, page: int, session: AsyncSession) -> tuple[str, InlineKeyboardMarkup | None]:
+        """Текст и кнопки страницы; если страница опустела — показываем предыдущую"""
+        rows, has_next = await Pager.load(view, user_id, page, session)
+        while not rows and page > 0:
+            page -= 1
+            rows, has_next = await Pager.load(view, user_id, page, session)
+
+        if not rows:
+            return Pager.empty_text(view), None
+        return Pager.render(view, rows, page, has_next)
@@ -1,10 +1,60 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta, timezone, date
 from database import get_user_settings
 import re
 
 import logging
 logger = logging.getLogger(__name__)
 
+# ================= быстрый разбор простых сообщений без LLM =================
+
+NUMBER_WORDS = {
+    "один": 1, "одну": 1, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5,
+    "десять": 10, "пятнадцать": 15, "двадцать": 20, "тридцать": 30, "сорок": 40,
+}
+_NUMBER = r"\d{1,3}|" + "|".join(NUMBER_WORDS)
+
+WEEKDAYS = {
+    "понедельник": 0, "вторник": 1, "среду": 2, "четверг": 3,
+    "пятницу": 4, "субботу": 5, "воскресенье": 6,
+}
+
+# "напомни мне", "мне нужно", "надо" в начале сообщения
+REMIND_RE = re.compile(r"^\s*напомни(?:те)?(?:\s+мне)?\b[\s,:]*", re.IGNORECASE)
+FILLER_RE = re.compile(r"^\s*(?:мне\s+)?(?:нужно|надо)\b\s*", re.IGNORECASE)
+
+RELATIVE_RE = re.compile(
+    rf"\bчерез\s+(?:(?P<n>{_NUMBER})\s+)?(?P<unit>минут[уы]?|мин|час(?:а|ов)?|полчаса|дн(?:я|ей)|день|недел[юи])\b",
+    re.IGNORECASE,
+)
+DAY_RE = re.compile(r"\b(?P<day>сегодня|завтра|послезавтра)\b", re.IGNORECASE)
+WEEKDAY_RE = re.compile(r"\bв(?:о)?\s+(?P<wd>" + "|".join(WEEKDAYS) + r")\b", re.IGNORECASE)
+DATE_RE = re.compile(r"\b(?P<d>\d{1,2})\.(?P<m>\d{1,2})(?:\.(?P<y>\d{2,4}))?\b")
+# "в 10:30" — минуты указаны, дальше может идти что угодно;
+# "в 18" — только если дальше конец, знак препинания или служебное слово ("в 10 магазинов" — не время)
+TIME_RE = re.compile(
+    r"\b(?:в|к)\s+(?P<h>\d{1,2})(?:[:.](?P<mi>\d{2})|(?:\s*(?:час(?:а|ов)?|ч)\b)?"
+    r"(?=\s*$|\s*[,.!?]|\s+(?:в|во|на|с|со|у|к|утра|дня|вечера|ночи|сегодня|завтра|послезавтра)\b))"
+    r"(?:\s+(?P<part>утра|дня|вечера|ночи)\b)?",
+    re.IGNORECASE,
+)
+
+# предлог прямо перед вырезанным выражением ("на завтра", "на 12.05") уходит вместе с ним;
+# "до" не трогаем: "до завтра" — это срок, такое решает LLM (см. LEFTOVER_TIME_RE)
+DANGLING_PREP_RE = re.compile(r"(?:^|\s)(?:в|во|на|к|ко|с|со)\s*$", re.IGNORECASE)
+
+# если после разбора в тексте остались такие слова — формулировка сложнее, чем мы умеем
+LEFTOVER_TIME_RE = re.compile(
+    r"утр|вечер|обед|ночь|ночью|днем|днём|недел|месяц|выходн|числ|\bгод|кажд|ежедн|через|сегодня|завтра|"
+    r"понедельн|вторник|сред[уа]|четверг|пятниц|суббот|воскрес|\bчас|минут|\bза\b|\bдо\b|\bпосле\b",
+    re.IGNORECASE,
+)
+
+# грубая оценка длительности по первому слову, по умолчанию short_30
+CATEGORY_HINTS = (
+    (re.compile(r"^(позвонить|написать|отправить|оплатить|перевести|ответить|выпить|снять|выключить|включить)\b", re.IGNORECASE), "short_5"),
+    (re.compile(r"^(созвон|встреча|тренировка|зал|сходить в зал|бассейн|пробежка|врач|стрижка)", re.IGNORECASE), "short_120"),
+)
+
 class Parser:
     """
     (преобразует один формат в другой)
@@ -33,4 +83,151 @@ class Parser:
         logger.error("ID не найден в сообщении!")
         raise ValueError(f"ID не найден в сообщении: {text}")
 
-    
+    @staticmethod
+    def fast_parse(text: str, now: datetime) -> dict | None:
+        """
+        Разбор простых сообщений без LLM: "купить хлеб в 18", "созвон завтра в 10:30",
+        "напомни через 40 минут снять кастрюлю".
+        now — текущее локальное время пользователя.
+        Возвращает тот же формат, что parse_text, или None, если не уверен.
+        """
+        rest = text.strip()
+        if not rest or "\n" in rest or len(rest) > 200:
+            return None
+
+        remind = False
+        match = REMIND_RE.match(rest)
+        if match:
+            remind = True
+            rest = rest[match.end():]
+        match = FILLER_RE.match(rest)
+        if match:
+            rest = rest[match.end():]
+
+        day: date | None = None
+        at = None  # (час, минута)
+
+        def take(regex):
+            """Найти выражение один раз и вырезать его из текста"""
+            nonlocal rest
+            found = list(regex.finditer(rest))
+            if len(found) > 1:
+                raise ValueError("выражение встречается несколько раз")
+            if not found:
+                return None
+            m = found[0]
+            rest = DANGLING_PREP_RE.sub("", rest[:m.start()]) + " " + rest[m.end():]
+            return m
+
+        try:
+            relative = take(RELATIVE_RE)
+            day_word = take(DAY_RE)
+            weekday = take(WEEKDAY_RE)
+            # время раньше даты: "в 18.05" — это 18:05, а не 18 мая
+            clock = take(TIME_RE)
+            exact_date = take(DATE_RE)
+        except ValueError:
+            return None
+
+        if sum(x is not None for x in (day_word, weekday, exact_date)) > 1:
+            return None
+
+        if relative:
+            if day_word or weekday or exact_date or clock:
+                return None
+            n_text = (relative.group("n") or "1").lower()
+            n = int(n_text) if n_text.isdigit() else NUMBER_WORDS[n_text]
+            unit = relative.group("unit").lower()
+            if unit == "полчаса":
+                moment = now + timedelta(minutes=30 * n)
+            elif unit.startswith("мин"):
+                moment = now + timedelta(minutes=n)
+            elif unit.startswith("час"):
+                moment = now + timedelta(hours=n)
+            elif unit.startswith("недел"):
+                moment = now + timedelta(weeks=n)
+            else:
+                moment = now + timedelta(days=n)
+            day = moment.date()
+            if unit.startswith(("мин", "час", "полчаса")):
+                at = (moment.hour, moment.minute)
+
+        if day_word:
+            shift = {"сегодня": 0, "завтра": 1, "послезавтра": 2}[day_word.group("day").lower()]
+            day = now.date() + timedelta(days=shift)
+
+        if weekday:
+            target = WEEKDAYS[weekday.group("wd").lower()]
+            ahead = (target - now.weekday()) % 7
+            if ahead == 0:
+                # "в пятницу" в пятницу — сегодня или через неделю, пусть решает LLM
+                return None
+            day = now.date() + timedelta(days=ahead)
+
+        if exact_date:
+            try:
+                year = exact_date.group("y")
+                if year:
+                    year = int(year) + (2000 if len(year) == 2 else 0)
+                    day = date(year, int(exact_date.group("m")), int(exact_date.group("d")))
+                else:
+                    day = date(now.year, int(exact_date.group("m")), int(exact_date.group("d")))
+                    if day < now.date():
+                        day = day.replace(year=now.year + 1)
+            except ValueError:
+                return None
+
+        if clock:
+            hour = int(clock.group("h"))
+            minute = int(clock.group("mi") or 0)
+            part = (clock.group("part") or "").lower()
+            if part in ("дня", "вечера") and hour < 12:
+                hour += 12
+            elif part == "ночи" and hour == 12:
+                hour = 0
+            elif not part and 1 <= hour <= 6:
+                # "в 5" — утра или вечера? не угадываем
+                return None
+            if hour > 23 or minute > 59:
+                return None
+            at = (hour, minute)
+            if day is None:
+                # "в 9", когда 9 уже прошло — сегодня или завтра? пусть решает LLM
+                if at < (now.hour, now.minute):
+                    return None
+                day = now.date()
+
+        # без даты и времени это может быть и задача, и покупка — решает LLM
+        if day is None:
+            return None
+
+        description = re.sub(r"\s+", " ", rest).strip(" ,.:;-")
+        if (
+            len(description) < 3
+            or not re.search(r"[а-яёa-z]", description, re.IGNORECASE)
+            or re.search(r"\d|[,;]|\sи\s", description)
+            or LEFTOVER_TIME_RE.search(description)
+        ):
+            return None
+
+        category = "short_30"
+        for regex, hint in CATEGORY_HINTS:
+            if regex.search(description):
+                category = hint
+                break
+
+        date_str = day.strftime("%Y-%m-%d")
+        time_str = f"{at[0]:02d}:{at[1]:02d}" if at else ""
+        return {
+            "type": "tasks",
+            "items": [
+                {
+                    "category": category,
+                    "date": date_str,
+                    "time": time_str,
+                    "remind_date": date_str if remind else "",
+                    "remind_time": time_str if remind else "",
+                    "task": description,
+                }
+            ],
+        }
@@ -1,45 +1,35 @@
-from database import get_user_settings, get_tasks_for_day, get_tasks_week, get_all_tasks, get_tasks_by_category
+from database import get_user_settings, get_tasks_for_day, get_tasks_week, get_all_tasks, user_tz
 from datetime import datetime, timedelta
-from keyboards import TASK_CATEGORY_MAP
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import logging
 logger = logging.getLogger(__name__)
 
 class TaskService:
     @staticmethod
-    def get_day_tasks(user_id: int, day_shift: int):
+    async def get_day_tasks(user_id: int, day_shift: int, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None):
         logger.info("получаем задачи на день")
-        settings = get_user_settings(user_id)
-        offset = settings.utc_offset if settings else 0
+        settings = await get_user_settings(user_id, session=session)
 
         target_date = (
-            datetime.utcnow() + timedelta(days=day_shift, hours=offset)
+            datetime.now(user_tz(settings)) + timedelta(days=day_shift)
         ).date()
 
-        return get_tasks_for_day(user_id, target_date)
+        return await get_tasks_for_day(user_id, target_date, session=session, offset=offset, limit=limit)
 
     @staticmethod
-    def get_week_task(user_id: int):
+    async def get_week_task(user_id: int, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None):
         logger.info("получаем задачи на неделю")
-        settings = get_user_settings(user_id)
-        offset = settings.utc_offset if settings else 0
+        settings = await get_user_settings(user_id, session=session)
 
-        start = (datetime.utcnow() + timedelta(hours=offset)).date()
+        start = datetime.now(user_tz(settings)).date()
         end = start + timedelta(days=7)
 
-        tasks = get_tasks_week(user_id, start, end)
+        tasks = await get_tasks_week(user_id, start, end, session=session, offset=offset, limit=limit)
         return tasks
     
     @staticmethod
-    def get_all_tasks(user_id: int):
+    async def get_all_tasks(user_id: int, session: AsyncSession | None = None, offset: int = 0, limit: int | None = None):
         logger.info("получаем все задачи")
-        tasks = get_all_tasks(user_id)
+        tasks = await get_all_tasks(user_id, session=session, offset=offset, limit=limit)
         return tasks
-    
-    @staticmethod
-    def get_category_task(user_id: int, category: str):
-        logger.info("получаем задачи по категории")
-        category = TASK_CATEGORY_MAP[category]
-        tasks = get_tasks_by_category(user_id, category)
-        
-        return tasks
\ No newline at end of file
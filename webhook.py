@@ -0,0 +1,84 @@
+"""
+Получение обновлений через webhook вместо long polling.
+Telegram присылает обновления POST-запросом на WEBHOOK_URL + WEBHOOK_PATH (через reverse proxy),
+запрос проверяется по секрету из заголовка X-Telegram-Bot-Api-Secret-Token.
+Несколько процессов бота могут слушать один адрес за балансировщиком.
+"""
+import asyncio
+import signal
+from typing import Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
+from middlewares import InFlightMiddleware
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def build_app(bot: Bot, dp: Dispatcher, in_flight: InFlightMiddleware) -> web.Application:
+    """
+    aiohttp-приложение: POST WEBHOOK_PATH — обновления от Telegram, GET /health — проверка для балансировщика.
+    Когда app["state"]["draining"] включен, health отвечает 503, чтобы балансировщик увел трафик,
+    а новые обновления получают 503 — Telegram пришлет их повторно (другому процессу)
+    """
+
+    @web.middleware
+    async def reject_when_draining(request: web.Request, handler):
+        if request.app["state"]["draining"] and request.path == WEBHOOK_PATH:
+            return web.Response(status=503)
+        return await handler(request)
+
+    app = web.Application(middlewares=[reject_when_draining])
+    # словарь, а не ключ app: состояние запущенного приложения менять нельзя
+    app["state"] = {"draining": False}
+
+    async def health(request: web.Request) -> web.Response:
+        if request.app["state"]["draining"]:
+            return web.json_response({"status": "draining", "in_flight": in_flight.count}, status=503)
+        return web.json_response({"status": "ok", "in_flight": in_flight.count})
+
+    app.router.add_get("/health", health)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, in_flight: InFlightMiddleware, on_shutdown: Callable[[], Awaitable], shutdown_timeout: float):
+    """
+    Слушать webhook до SIGINT/SIGTERM, затем корректно остановиться:
+    перестать принимать обновления, дождаться on_shutdown (обработчики, уведомления, очередь)
+    и только потом закрыть сервер и сессию бота
+    """
+    app = build_app(bot, dp, in_flight)
+    runner = web.AppRunner(app, access_log=None, shutdown_timeout=shutdown_timeout)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info(f"webhook слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"webhook зарегистрирован в Telegram: {WEBHOOK_URL}")
+    else:
+        logger.warning("WEBHOOK_URL не задан, webhook в Telegram не регистрируем")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        logger.info("останавливаем webhook")
+        app["state"]["draining"] = True
+        await on_shutdown()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        await runner.cleanup()
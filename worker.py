@@ -0,0 +1,63 @@
+"""
+Отдельный воркер уведомлений (ежедневные списки и напоминания) без приема обновлений.
+Воркеров можно запустить сколько угодно: пользователи делятся на NOTIFY_PARTITIONS партиций,
+какой воркер ведет партицию, решает аренда в БД (notification_leases). Если воркер
+упал, его партиции через NOTIFY_LEASE_TTL_SECONDS заберут остальные.
+Процессы бота в этом случае запускаются с NOTIFICATIONS_ENABLED=0.
+
+Запуск:
+    python worker.py
+"""
+import asyncio
+import signal
+
+from aiogram import Bot
+
+from config import BOT_TOKEN, METRICS_HOST, METRICS_PORT, SHUTDOWN_TIMEOUT
+from database import init_db
+from metrics import start_metrics_server
+from middlewares import TelegramMetricsMiddleware
+from notifications import notification_loop, scheduler
+from send_queue import send_queue
+
+from logging_conf import setup_logging
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    setup_logging()
+    await init_db()
+
+    bot = Bot(token=BOT_TOKEN)
+    bot.session.middleware(TelegramMetricsMiddleware())
+
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError:
+            logger.exception("не удалось запустить сервер метрик, работаем без него")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, scheduler.stop)
+
+    logger.info("воркер уведомлений запущен")
+    try:
+        # после stop() цикл отпускает партиции, остается дослать очередь
+        await notification_loop(bot)
+        if not await send_queue.drain(SHUTDOWN_TIMEOUT):
+            logger.warning(f"не отправлено сообщений: {send_queue.qsize()}")
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        await bot.session.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        logger.info("воркер уведомлений остановлен")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())